@@ -4,15 +4,22 @@ import argparse
 
 from loader.iohandler import IOHandler
 from similarity.similarity import Similarity
+from similarity.similarity_cache import SimilarityCache
 from coarsening.matching import Matching
 from coarsening.coarser import Coarser
+from coarsening.hierarchy_store import HierarchyStore
+from coarsening.coarsening_scheduler import CoarseningScheduler
 from linkprediction.link_predictor import LinkPredictor
 from linkprediction.ml_link_predictor import MultilevelLinkPredictor
 from linkprediction.metric_calculator import MetricCalculator
 from linkprediction.sampler import Sampler
+from linkprediction.fold_scheduler import FoldScheduler
 from loader.graph_loader import GraphLoader
+from loader.graph_cache import GraphCache
 import random
 import os
+import json
+import numpy as np
 
 import time
 
@@ -33,9 +40,25 @@ parser = argparse.ArgumentParser(description="Multilevel link prediction")
 parser.add_argument('-f', '--filename', action='store', dest='filename', help='A file name that contains a .ncol network.', type = str)
 parser.add_argument('-k', '--k', action='store', dest='k', help='Number of folds to cross validation.', type = int, default = 10)
 parser.add_argument('-l', '--levels', action='store', dest='levels', help='Number of levels the networks will be coarsed.', type = int, default = 0)
-parser.add_argument('-m', '--matching', action='store', dest='matching_method', help='Matching method that will be used for coarsening. [0 - RM, 1 - MSE, 2 - LSE].', type = int, default = 0)
-parser.add_argument('-s', '--similarity', action='store', dest='similarity_method', help='Similarity measure used for link prediction. [0 - CN, 1 - JAC, 2 - SAL, 3 - AA, 4 - PA, 5 - KATZ].', type = int, default = 0)
+parser.add_argument('-m', '--matching', action='store', dest='matching_method', help='Matching method that will be used for coarsening. [0 - RM, 1 - MSE, 2 - LSE, 3 - HEM, 4 - LEM, 5 - LP, 6 - TWIN, 7 - GHEM, 8 - GLEM].', type = int, default = 0)
+parser.add_argument('-cs', '--clustersize', action='store', dest='cluster_size', help='Maximum number of vertices of a super-vertex of the cluster matchings (LP and TWIN).', type = int, default = 8)
+parser.add_argument('-ms', '--matchingsimilarity', action='store', dest='matching_similarity_method', help='Similarity measure used by the MSE, LSE and LP matchings. [0 - CN, 1 - JAC, 2 - SAL, 3 - AA, 4 - PA, 5 - KATZ, 6 - LKATZ, 7 - WLKATZ, 8 - SIMRANK, 9 - RPR].', type = int, default = 0)
+parser.add_argument('-s', '--similarity', action='store', dest='similarity_method', help='Similarity measure used for link prediction. [0 - CN, 1 - JAC, 2 - SAL, 3 - AA, 4 - PA, 5 - KATZ, 6 - LKATZ, 7 - WLKATZ, 8 - SIMRANK, 9 - RPR].', type = int, default = 0)
 parser.add_argument('-lp', '--mlinkpredictor', action='store', dest='multilevellp_method', help='Method that will be used for multilevel link prediction. [0 - ER, 1 - ERF, 2 - WER, 3 - WERF].', type = int, default = 0)
+parser.add_argument('-fw', '--foldworkers', action='store', dest='fold_workers', help='Number of folds executed in parallel processes.', type = int, default = 1)
+parser.add_argument('-sw', '--scoreworkers', action='store', dest='score_workers', help='Number of processes that score the similarities of a level in parallel.', type = int, default = 1)
+parser.add_argument('-c', '--cache', action='store_true', dest='cache', help='Loads the network from a binary cache written next to its file (built in the first load).')
+parser.add_argument('-st', '--stream', action='store_true', dest='stream', help='Streams the .ncol network to a compact cache (for .ncol files larger than the memory, the graph itself must fit in it).')
+parser.add_argument('-hs', '--hierarchystore', action='store', dest='hierarchy_store', help='Directory where the coarsed levels of each fold and matching are stored and reused by the next runs.', type = str, default = None)
+parser.add_argument('-sd', '--seed', action='store', dest='seed', help='Seed of the random generators (the same seed gives the same folds).', type = int, default = None)
+parser.add_argument('-rf', '--refine', action='store_true', dest='refine', help='Scores the pairs inside each super-vertex by the similarity measure (-s) on its induced subgraph (by -sw processes), instead of replicating a constant value.')
+parser.add_argument('-uc', '--uncoarsening', action='store', dest='uncoarsening', help='Projects the coarsed predictions level by level, rescoring the given number of best pairs at each level by the similarity measure (-s). [0 - direct projection].', type = int, default = 0)
+parser.add_argument('-tv', '--targetvertices', action='store', dest='target_vertices', help='Coarses the network until it has at most this number of vertices (up to -l levels, if given).', type = int, default = None)
+parser.add_argument('-tr', '--targetratio', action='store', dest='target_ratio', help='Coarses the network until it has at most this ratio of its vertices (up to -l levels, if given).', type = float, default = None)
+parser.add_argument('-tb', '--timebudget', action='store', dest='time_budget', help='Coarses the network until the estimated time (in seconds) of scoring its pairs fits in this budget (up to -l levels, if given).', type = float, default = None)
+parser.add_argument('-mr', '--minreduction', action='store', dest='min_reduction', help='Minimum ratio of vertices removed by a level. The adaptive coarsening stops at the levels that shrink the network less than it.', type = float, default = 0.05)
+parser.add_argument('-ex', '--export', action='store_true', dest='export', help='Exports the sorted binary ranking of each fold and level as a text ranking.')
+parser.add_argument('-mb', '--memorybudget', action='store', dest='memory_budget', help='Memory (in MB) used to sort the rankings (by -sw processes).', type = int, default = 256)
 
 # Parses the arguments.
 args = parser.parse_args()
@@ -43,19 +66,32 @@ args = parser.parse_args()
 if args.filename is None:
 	parser.error("required -f [filename] arg.")
 
-graph_loader = GraphLoader()
-if("ncol" in args.filename):
+# Seeds the random generators, so the folds (and their stored hierarchies) are the same in other runs.
+if(args.seed is not None):
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+graph_loader = GraphLoader(GraphCache() if args.cache else None)
+if("ncol" in args.filename and args.stream):
+    graph = graph_loader.load_unipartite_undirected_ncol_streaming(args.filename)
+elif("ncol" in args.filename):
     graph = graph_loader.load_unipartite_undirected_ncol(args.filename)
 elif("gml" in args.filename):
     graph = graph_loader.load_unipartite_undirected_gml(args.filename)
 
 coarser = Coarser()
-matching = Matching()
-link_predictor = LinkPredictor()
+# Cache of the similarity scores shared by the matching and the link prediction. It's only used by the matchings guided
+# by a similarity (MSE, LSE and LP).
+similarity_cache = SimilarityCache() if args.matching_method in [1, 2, 5] else None
+matching = Matching(similarity_cache, args.cluster_size, workers=args.score_workers)
+link_predictor = LinkPredictor(args.score_workers, similarity_cache)
 similarity = Similarity()
-ml_link_predictor = MultilevelLinkPredictor()
+# The refinement scores the pairs inside the super-vertices by the similarity method.
+ml_link_predictor = MultilevelLinkPredictor(refinement_similarity=(similarity.similarities_array[args.similarity_method] if args.refine else None),
+                                            refinement_workers=args.score_workers)
 metric_calculator = MetricCalculator()
 sampler = Sampler()
+# Store of the coarsed levels.
+hierarchy_store = HierarchyStore(args.hierarchy_store) if args.hierarchy_store else None
 
 # Number of folds of the set.
 k = args.k
@@ -65,29 +101,85 @@ l = args.levels
 m = args.matching_method
 # Similarity method.
 s = args.similarity_method
+# Similarity method of the matching.
+ms = args.matching_similarity_method
+# Name of the hierarchies of the matching in the store. The MSE, LSE and LP matchings also depend on their similarity
+# and the cluster matchings (LP and TWIN) on their maximum size.
+hierarchy_name = matching.matchings_array[m].__name__
+if(m in [1, 2, 5]):
+    hierarchy_name += "_" + similarity.similarities_array[ms].__name__
+if(m in [5, 6]):
+    hierarchy_name += "_" + str(args.cluster_size)
 # Similarity method.
 lp = args.multilevellp_method
+# Method that coarses a graph by the matching method (m) with the similarity method of the matching (ms).
+def coarsen(graph, similarity):
+    matching_array = matching.matchings_array[m](graph, similarity = similarity.similarities_array[ms])
+    return coarser.coarserning(graph, matching_array)
+
+# The number of levels of each fold is chosen by the coarsening of the fold graph when a target size or time budget is
+# given (up to -l levels, if given). The folds stop at their first level that reaches the targets or that is stalled.
+coarsening_scheduler = None
+max_levels = l
+if(args.target_vertices is not None or args.target_ratio is not None or args.time_budget is not None):
+    coarsening_scheduler = CoarseningScheduler(lambda graph: coarsen(graph, similarity), args.target_vertices, args.target_ratio, args.time_budget,
+                                               args.min_reduction, (l if l > 0 else None))
+    # Each level removes at least one vertex, so the levels are bounded by the number of vertices.
+    max_levels = l if l > 0 else graph.vcount()
+
+# Method that returns the coarsed graph of a level of the fold i from the graph of the previous level, loaded from the
+# hierarchy store or calculated by the matching. If the fold is coarsed by the scheduler, returns None when the
+# previous level is the last one of the fold.
+def coarsen_fold_level(graph, i, level, similarity, original_vcount):
+    if(hierarchy_store is not None):
+        coarsen_function = lambda graph: hierarchy_store.coarsen(graph, fold_keys[i], hierarchy_name, level, lambda graph: coarsen(graph, similarity))
+    else:
+        coarsen_function = lambda graph: coarsen(graph, similarity)
+    if(coarsening_scheduler is None):
+        return coarsen_function(graph)
+    coarsed_graph, reason = coarsening_scheduler.next_level(graph, original_vcount, level - 1, coarsen_function)
+    if(coarsed_graph is None):
+        print "Fold", i, "coarsening levels =", level - 1, "(" + reason + ")"
+    return coarsed_graph
+
 # Solves the dataset name.
 dataset_name = (args.filename.split("/")[len(args.filename.split("/")) - 1]).split(".")[0]
 print "Executing for dataset =",dataset_name,"k =",k,"l =",l,"m =",m,"s =",s,"lp =",lp
 
 # Gets the edgelist and shuffles this list.
 edgelist = random.sample(graph.get_edgelist(), graph.ecount())
-auc_io_handlers = [None] * (l + 1)
-pr_io_handlers = [None] * (l + 1)
-time_io_handlers = [None] * (l + 1)
+# The output files of each level are opened when the first fold reaches the level.
+auc_io_handlers = []
+pr_io_handlers = []
+time_io_handlers = []
 # ranking_io_handlers = [None] * (l + 1)
 
+# Name of the multilevel predictor in the outputs. The uncoarsening projects the predictions instead of the predictor,
+# so its runs are written apart, by the number of rescored pairs.
+predictor_name = ("uc" + str(args.uncoarsening)) if args.uncoarsening else ml_link_predictor.predictors_array[lp].__name__
+# The refinement also change the predictions.
+if(args.refine):
+    predictor_name += "_rf"
+# Directory of the outputs of the run. The matching is named as its hierarchies, so the runs of different matching
+# similarities (-ms) and cluster sizes (-cs) are not written together.
+output_path = "output/" + dataset_name + "/" + predictor_name + "/" + hierarchy_name + "/" + similarity.similarities_array[s].__name__ + "/"
+# The arguments of the run are written next to its outputs.
+if(not os.path.exists(output_path)):
+    os.makedirs(output_path)
+with open(output_path + "arguments.json", 'w') as arguments_file:
+    json.dump(vars(args), arguments_file, indent=4, sort_keys=True)
+
 # Size of Ls that will be analised.
 ls = [100, 200, 500, 1000, 2500, 5000, 10000]
 
-for i in range(l+1):
+# Method that opens the output files of the level i.
+def open_level_outputs(i):
     # Creating io_handlers for writing outputs in the files.
-    auc_io_handlers[i] = IOHandler()
-    pr_io_handlers[i] = IOHandler()
-    time_io_handlers[i] = IOHandler()
+    auc_io_handlers.append(IOHandler())
+    pr_io_handlers.append(IOHandler())
+    time_io_handlers.append(IOHandler())
     # ranking_io_handlers[i] = IOHandler()
-    dir = "output/" + dataset_name + "/" + ml_link_predictor.predictors_array[lp].__name__ + "/" + matching.matchings_array[m].__name__ + "/" + similarity.similarities_array[s].__name__ + "/level" + str(i) + "/"
+    dir = output_path + "level" + str(i) + "/"
     if(not os.path.exists(dir)):
         os.makedirs(dir)
     # Loading output files.
@@ -98,68 +190,108 @@ for i in range(l+1):
     auc_io_handlers[i].write_results(",".join(map(str, ls)))
     pr_io_handlers[i].write_results(",".join(map(str, ls)))
 
-predicted_edges_handler = IOHandler()
-predicted_edges_path= "output/" + dataset_name + "/" + ml_link_predictor.predictors_array[lp].__name__ + "/" + matching.matchings_array[
-    m].__name__ + "/" + similarity.similarities_array[s].__name__ + "/"
-
-for i in range(k):
-    print "Calculating for (",(i+1),"/",k,") folds..."
-    # Creates the probe edges by k-fold.
-    # probe_edges = sampler.create_k_edges_probe_list(graph, edgelist, i, k)
+# The directory of the rankings is created before the output files of the levels (opened when the folds finish).
+predicted_edges_path = output_path
 
-    # Creates the random probe edges.
-    probe_edges = sampler.create_random_edges_probe_list(graph, 0.20)
+# Method that runs a fold: the probe edges are removed from a copy of the graph and the ranking is written in a file
+# of the fold, so the folds can run in parallel processes. Returns the aucs, precisions and time of each level.
+def run_fold(i):
+    probe_edges = probe_edges_list[i]
+    fold_graph = graph.copy()
     # Delete the edges from the graph.
-    sampler.delete_edges(graph, probe_edges)
+    sampler.delete_edges(fold_graph, probe_edges)
+    # The rankings are written in the binary format (source, target and score records).
+    predicted_edges_handler = IOHandler(binary=True)
+    results = []
 
     # Calculating for level l.
-    coarsed_graph = graph
-    for level in range(l+1):
+    coarsed_graph = fold_graph
+    # Graphs of the levels, used by the uncoarsening.
+    level_graphs = [fold_graph]
+    for level in xrange(max_levels + 1):
         start_time = time.time()
         similarity = Similarity()
+        # Coarses the graph of the level. The fold stops at the last level chosen by the coarsening scheduler.
+        if(level != 0):
+            next_graph = coarsen_fold_level(coarsed_graph, i, level, similarity, fold_graph.vcount())
+            if(next_graph is None):
+                break
+            coarsed_graph = next_graph
+            level_graphs.append(coarsed_graph)
         # Open the predicted edges file to write them.
-        predicted_edges_handler.load_output_file(predicted_edges_path + "ranking.txt")
+        predicted_edges_handler.load_output_file(predicted_edges_path + "ranking" + str(i) + ".bin")
 
         if(level != 0):
-            # Calculates the matching for coarsening.
-            matching_array = matching.matchings_array[m](coarsed_graph, similarity = similarity.common_neighbors)
-            coarsed_graph = coarser.coarserning(coarsed_graph, matching_array)
             # Predict the coarsed edges.
-            coarsed_predicted = link_predictor.link_prediction_by_similarity(coarsed_graph, similarity.similarities_array[s])
+            coarsed_predicted = link_predictor.link_prediction_by_similarity_parallel(coarsed_graph, similarity.similarities_array[s])
 
             # Extracting real predicted edges.
-            predicted_edges = ml_link_predictor.predictors_array[lp](graph, coarsed_graph, coarsed_predicted, predicted_edges_handler)
+            if(args.uncoarsening):
+                ml_link_predictor.predict_by_uncoarsening_to_file(level_graphs, coarsed_predicted, similarity.similarities_array[s], args.uncoarsening, predicted_edges_handler)
+            else:
+                predicted_edges = ml_link_predictor.predictors_array[lp](fold_graph, coarsed_graph, coarsed_predicted, predicted_edges_handler)
         else:
             # Predict the coarsed edges.
-            predicted_edges = link_predictor.link_prediction_by_similarity_to_file(graph, similarity.similarities_array[s], predicted_edges_handler)
+            predicted_edges = link_predictor.link_prediction_by_similarity_parallel_to_file(fold_graph, similarity.similarities_array[s], predicted_edges_handler)
 
         # Finishes the time counter.
         elapsed_time = (time.time() - start_time)
         predicted_edges_handler.close_files()
 
         # Open the predicted edges file to write them.
-        predicted_edges_handler.load_input_file(predicted_edges_path + "ranking.txt")
+        predicted_edges_handler.load_input_file(predicted_edges_path + "ranking" + str(i) + ".bin")
 
-        aucs = [None] * len(ls)
         prs = [None] * len(ls)
 
-        # Sorts the edges file for Precision calculation.
-        predicted_edges_handler.batch_sort()
+        # Sorts the edges file for Precision calculation. Only the first max(ls) edges are needed, so they are sorted to
+        # another file (unless the whole sorted ranking is exported).
+        top_edges_handler = IOHandler(binary=True)
+        if(args.export):
+            predicted_edges_handler.batch_sort(workers=args.score_workers, memory_budget=args.memory_budget * 2 ** 20)
+            predicted_edges_handler.export_text_ranking(predicted_edges_path + "ranking" + str(i) + "_level" + str(level) + ".txt")
+            top_edges_handler.load_input_file(predicted_edges_path + "ranking" + str(i) + ".bin")
+        else:
+            predicted_edges_handler.batch_sort(workers=args.score_workers, memory_budget=args.memory_budget * 2 ** 20, top=max(ls),
+                                               output_file_path=predicted_edges_path + "ranking" + str(i) + ".top.bin")
+            top_edges_handler.load_input_file(predicted_edges_path + "ranking" + str(i) + ".top.bin")
         for j in range(len(ls)):
             # Calculates precision.
-            prs[j] = metric_calculator.calculate_precision_from_file(probe_edges, predicted_edges_handler, ls[j])
+            prs[j] = metric_calculator.calculate_precision_from_file(probe_edges, top_edges_handler, ls[j])
+        top_edges_handler.close_files()
+        if(not args.export):
+            top_edges_handler.remove_input_file()
 
-        # Shuffles the edges file for AUC calculation.
-        predicted_edges_handler.batch_shuffle()
-        for j in range(len(ls)):
-            # Calculates auc.
-            aucs[j] = metric_calculator.calculate_auc_from_file(probe_edges, predicted_edges_handler, ls[j])
+        # Samples the edges file for AUC calculation (in one pass, without shuffling the file). The sample is seeded by
+        # the random generator of the fold, so the aucs are repeated by the same seed.
+        # The uncoarsening writes only the best pairs, so the other non-edges pairs are an implicit tail of zero scores.
+        total_pairs = None
+        if(args.uncoarsening and level != 0):
+            total_pairs = (fold_graph.vcount() * (fold_graph.vcount() - 1) // 2) - fold_graph.ecount()
+        aucs = metric_calculator.calculate_aucs_from_sample(probe_edges, predicted_edges_handler, ls, np.random.randint(0, (2 ** 31) - 1),
+                                                            total_pairs=total_pairs)
 
         # Closes the predicted edges input file.
         predicted_edges_handler.close_files()
         # Delete the predicted edges file.
         predicted_edges_handler.remove_input_file()
+        results.append((aucs, prs, elapsed_time))
+    return results
+
+# Creates the random probe edges of each fold.
+probe_edges_list = [sampler.create_random_edges_probe_list(graph, 0.20) for i in range(k)]
+# Keys of the folds in the hierarchy store.
+fold_keys = [hierarchy_store.fold_key(args.filename, probe_edges) for probe_edges in probe_edges_list] if hierarchy_store else None
+# Creates the probe edges by k-fold.
+# probe_edges_list = [sampler.create_k_edges_probe_list(graph, edgelist, i, k) for i in range(k)]
+seeds = [random.randint(0, (2 ** 31) - 1) for i in range(k)]
 
+fold_scheduler = FoldScheduler(args.fold_workers)
+for i, results in enumerate(fold_scheduler.run(run_fold, range(k), seeds)):
+    print "Calculated (",(i+1),"/",k,") folds..."
+    for level in range(len(auc_io_handlers), len(results)):
+        open_level_outputs(level)
+    for level in range(len(results)):
+        aucs, prs, elapsed_time = results[level]
         # Writes the auc results.
         auc_io_handlers[level].write_results(",".join(map(str, aucs)))
         # Writes the precision results.
@@ -167,11 +299,7 @@ for i in range(k):
         # Writes the time results.
         time_io_handlers[level].write_results(str(elapsed_time))
 
-
-    # Re-adds the edges in the network.
-    sampler.readd_edges(graph, probe_edges)
-
-for i in range(l+1):
+for i in range(len(auc_io_handlers)):
     auc_io_handlers[i].close_files()
     pr_io_handlers[i].close_files()
     time_io_handlers[i].close_files()
\ No newline at end of file
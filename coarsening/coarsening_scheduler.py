@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division
+import numpy as np
+
+# Class that chooses the number of levels of the coarsening. The graph is coarsed (by a function that applies a matching
+# and the coarser) until it reaches a target number of vertices or a target reduction ratio of the original graph, or
+# until the estimated time of scoring its pairs fits in a time budget. The coarsening stops when a level shrinks the
+# graph less than a minimum reduction (like the heavy edge matching on star-like graphs) or after a maximum of levels.
+class CoarseningScheduler():
+
+    def __init__(self, coarsen_function, target_vcount=None, target_ratio=None, time_budget=None, min_reduction=0.05,
+                 max_levels=None, operations_per_second=5e7):
+        # Function that receives a graph and returns the coarsed graph of the next level.
+        self.coarsen_function = coarsen_function
+        # Number of vertices of the coarsest graph.
+        self.target_vcount = target_vcount
+        # Number of vertices of the coarsest graph, as a ratio of the vertices of the original graph.
+        self.target_ratio = target_ratio
+        # Estimated time (in seconds) of scoring the pairs of the coarsest graph.
+        self.time_budget = time_budget
+        # Minimum ratio of vertices removed by a level. The levels that shrink the graph less than it stall the coarsening.
+        self.min_reduction = min_reduction
+        # Maximum number of levels. If None, the levels are not limited.
+        self.max_levels = max_levels
+        # Number of operations of the scoring done in a second, used to estimate the time of the scoring.
+        self.operations_per_second = operations_per_second
+
+    # Method that estimates the operations of scoring all the pairs of a graph by the sparse engine: the edges, the
+    # paths of 2 hops (sum of the squared degrees) and the dense block of the pairs (v, u), v < u.
+    def estimate_operations(self, graph):
+        degrees = np.array(graph.degree(), dtype=np.float64)
+        n = graph.vcount()
+        return graph.ecount() + (degrees * degrees).sum() + (n * (n - 1) / 2)
+
+    # Method that estimates the time (in seconds) of scoring all the pairs of a graph.
+    def estimate_time(self, graph):
+        return self.estimate_operations(graph) / self.operations_per_second
+
+    # Method that tells if a graph reached the targets, given the number of vertices of the original graph. Returns
+    # the reason or None.
+    def reached(self, graph, original_vcount):
+        if(self.target_vcount is not None and graph.vcount() <= self.target_vcount):
+            return "target vertices"
+        if(self.target_ratio is not None and graph.vcount() <= self.target_ratio * original_vcount):
+            return "target ratio"
+        if(self.time_budget is not None and self.estimate_time(graph) <= self.time_budget):
+            return "time budget"
+        return None
+
+    # Method that coarses a graph of a level one more level, unless the graph reached the targets, the levels reached the
+    # maximum or the new level is stalled. Receives the number of vertices of the original graph, the number of levels
+    # coarsed before the graph and the function that coarses it (by default, the function of the scheduler). Returns the
+    # coarsed graph and None, or None and the reason of the stop.
+    def next_level(self, graph, original_vcount, levels, coarsen_function=None):
+        reason = self.reached(graph, original_vcount)
+        if(reason is not None):
+            return None, reason
+        if(self.max_levels is not None and levels >= self.max_levels):
+            return None, "max levels"
+        coarsed_graph = (coarsen_function or self.coarsen_function)(graph)
+        # The stalled level is not kept, since it costs a level with almost the same graph.
+        if(coarsed_graph.vcount() > (1 - self.min_reduction) * graph.vcount()):
+            return None, "stalled"
+        return coarsed_graph, None
+
+    # Method that coarses the graph until it reaches the targets. Returns the coarsed graphs of the levels (the first
+    # one is the graph) and the reason of the stop.
+    def coarsen(self, graph):
+        graphs = [graph]
+        while(True):
+            coarsed_graph, reason = self.next_level(graphs[-1], graph.vcount(), len(graphs) - 1)
+            if(coarsed_graph is None):
+                return graphs, reason
+            graphs.append(coarsed_graph)
+
+    # Method that returns the number of levels chosen for the graph and the reason of the stop.
+    def levels(self, graph):
+        graphs, reason = self.coarsen(graph)
+        return len(graphs) - 1, reason
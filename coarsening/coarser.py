@@ -1,73 +1,52 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from igraph import *
+import numpy as np
+from loader.edge_index import EdgeIndex
+from coarsening.hierarchy import Hierarchy
 
 class Coarser():
 
     def __init__(self):
         pass
 
-    # Method that receives an original graph and a matching array and creates a coarsed graph. Complexity = O(V + E)
+    # Method that receives an original graph and a matching array and creates a coarsed graph. The contraction is done
+    # with numpy arrays: the edges are mapped to the super-vertices and the parallel edges are merged by a single
+    # unique/bincount reduction that sums their weights. Complexity = O(V + E log E)
     def coarserning(self, graph, matching):
-        # Creates a new coarsed graph.
-        coarsed_graph = Graph()
-        # Calculates the number of vertices of the coarsed graph.
-        n_vertices = 0
-        # An array of the successors of all vertices in the new coarsed graph.
-        successors = range(graph.vcount())
-        successor = 0
-        for i in range(len(matching)):
-            if(i <= matching[i]):
-                n_vertices += 1
-                successors[i] = successor
-                successor += 1
-            else:
-                successors[i] = successors[matching[i]]
-        # Add the vertices in the coarsed graph.
-        coarsed_graph.add_vertices(n_vertices)
-        # Calculates the new edges for the coarsed graph.
-        weights = {}
-        for edge in graph.get_edgelist():
-            # Recovers the vertices new ids in the coarsed network.
-            new_source = successors[edge[0]]
-            new_target = successors[edge[1]]
-            if(new_source != new_target):
-                # Tests if the edge was already defined for the coarsed graph.
-                if((new_source, new_target) in weights):
-                    weights[(new_source, new_target)] += graph[edge[0], edge[1]]
-                elif((new_target, new_source) in weights):
-                    weights[(new_target, new_source)] += graph[edge[0], edge[1]]
-                else:
-                    weights[(new_source, new_target)] = graph[edge[0], edge[1]]
-
-        # Add the edges in the graph.
-        coarsed_graph.add_edges(weights.keys())
-        # Add the edges weights in the graph.
-        coarsed_graph.es['weight'] = weights.values()
+        matching = np.asarray(matching, dtype=np.int64)
+        vertices = np.arange(len(matching))
+        # A vertex creates a super-vertex if it is not matched to a vertex with a lower id. The other vertices belong
+        # to the super-vertex of the vertex they are matched to.
+        representatives = vertices <= matching
+        successors = (np.cumsum(representatives) - 1)[np.minimum(vertices, matching)]
+        n_vertices = int(np.count_nonzero(representatives))
+        # Recovers the vertices new ids in the coarsed network.
+        edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+        weights = EdgeIndex.get(graph).weights_of(edges[:, 0], edges[:, 1])
+        new_sources = successors[edges[:, 0]]
+        new_targets = successors[edges[:, 1]]
+        # The edges inside a super-vertex are removed and the edges between the same super-vertices are merged.
+        mask = new_sources != new_targets
+        keys = (np.minimum(new_sources[mask], new_targets[mask]) << 32) | np.maximum(new_sources[mask], new_targets[mask])
+        keys, inverse = np.unique(keys, return_inverse=True)
+        new_weights = np.bincount(inverse, weights=weights[mask], minlength=len(keys))
+        # Creates a new coarsed graph with the edges and their weights.
+        coarsed_graph = Graph(n=n_vertices, edges=zip((keys >> 32).tolist(), (keys & 0xFFFFFFFF).tolist()))
+        coarsed_graph.es['weight'] = new_weights.tolist()
         # Updates the coarse level of the graph.
         coarsed_graph['level'] = graph['level'] + 1
-        # Updates the succesors of the graph according to the original graph.
-        coarsed_graph['successors'] = [0] * len(graph['successors'])
-        for i in range(len(graph['successors'])):
-            coarsed_graph['successors'][i] = successors[graph['successors'][i]]
+        # Adds the level to the hierarchy of the graph. The succesors of the original graph are the membership of the level.
+        coarsed_graph['hierarchy'] = Hierarchy.get(graph).add_level(coarsed_graph['level'], successors, n_vertices)
+        coarsed_graph['successors'] = coarsed_graph['hierarchy'].membership()
+        # Indexes the edges of the coarsed graph.
+        coarsed_graph['edge_index'] = EdgeIndex(coarsed_graph)
 
         return coarsed_graph
 
     # Method that receives the coarsed graph and extracts subgraphs of the vertices inside the supervertices.
     # Each supervertice generates a subgraph.
     def create_subgraphs(self, original_graph, coarsed_graph):
-        supervertices = {}
-        # Gets the supervertices from the successors.
-        for i in range(len(coarsed_graph['successors'])):
-            successor = coarsed_graph['successors'][i]
-            if(successor in supervertices):
-                supervertices[successor].append(i)
-            else:
-                supervertices[successor] = [i]
-        # Creates the subgraphs for each supervertex.
-        subgraphs = [None] * len(supervertices)
-        index = 0
-        for supervertex in supervertices:
-            subgraphs[index] = original_graph.subgraph(supervertices[supervertex])
-            index += 1
-        return subgraphs
\ No newline at end of file
+        hierarchy = Hierarchy.get(coarsed_graph)
+        # Creates the subgraphs for each supervertex from its block of original vertices.
+        return [original_graph.subgraph(hierarchy.members(supervertex).tolist()) for supervertex in range(coarsed_graph.vcount())]
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+
+# Class that keeps the levels of a multilevel hierarchy: for each level, the super-vertex of each original vertex
+# (membership), the number of original vertices of each super-vertex (sizes) and the original vertices grouped by
+# super-vertex (order and offsets of the blocks). A level is built from the previous one by array operations over the
+# map of the vertices of the previous level to the new super-vertices, so the original vertices are never sorted again.
+# The hierarchy of a graph is stored in its 'hierarchy' attribute and holds the levels up to the level of the graph.
+class Hierarchy():
+
+    def __init__(self, vcount):
+        # Numbers of the stored levels.
+        self.levels = [0]
+        self.memberships = [np.arange(vcount)]
+        self.sizes = [np.ones(vcount, dtype=np.int64)]
+        self.orders = [np.arange(vcount)]
+        self.offsets = [np.arange(vcount + 1)]
+
+    # Method that recovers the hierarchy of a graph. If the graph doesn't have one (or it belongs to other level), a
+    # hierarchy with the original level and the level of the graph is built from its successors.
+    @staticmethod
+    def get(graph):
+        level = graph['level'] if 'level' in graph.attributes() else 0
+        if('hierarchy' in graph.attributes()):
+            hierarchy = graph['hierarchy']
+            if(hierarchy.levels[-1] == level and len(hierarchy.sizes[-1]) == graph.vcount()):
+                return hierarchy
+        successors = np.asarray(graph['successors'] if 'successors' in graph.attributes() else np.arange(graph.vcount()), dtype=np.int64)
+        hierarchy = Hierarchy(len(successors))
+        if(level != 0):
+            hierarchy = hierarchy.add_level(level, successors, graph.vcount())
+        graph['hierarchy'] = hierarchy
+        return hierarchy
+
+    # Method that returns a new hierarchy with the levels of this one and a level whose super-vertices are given by the
+    # map of the vertices of the last level (vertex_map[v] is the super-vertex of v). The levels are shared.
+    def add_level(self, level, vertex_map, vcount):
+        vertex_map = np.asarray(vertex_map, dtype=np.int64)
+        hierarchy = Hierarchy(0)
+        hierarchy.levels = self.levels + [level]
+        hierarchy.memberships = self.memberships + [vertex_map[self.memberships[-1]]]
+        sizes = np.bincount(vertex_map, weights=self.sizes[-1], minlength=vcount).astype(np.int64)
+        hierarchy.sizes = self.sizes + [sizes]
+        offsets = np.zeros(vcount + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(sizes)
+        hierarchy.offsets = self.offsets + [offsets]
+        # The blocks of the previous super-vertices are concatenated in the order of their new super-vertices.
+        previous = np.argsort(vertex_map, kind='mergesort')
+        previous_sizes = self.sizes[-1][previous]
+        positions = np.arange(offsets[-1]) - np.repeat(np.cumsum(previous_sizes) - previous_sizes, previous_sizes)
+        hierarchy.orders = self.orders + [self.orders[-1][np.repeat(self.offsets[-1][previous], previous_sizes) + positions]]
+        return hierarchy
+
+    # Method that returns the position of a level (by default, the last one) in the lists.
+    def index(self, level=None):
+        return -1 if level is None else self.levels.index(level)
+
+    # Method that returns the super-vertex of each original vertex in a level.
+    def membership(self, level=None):
+        return self.memberships[self.index(level)]
+
+    # Method that returns the original vertices grouped by super-vertex in a level, the offset of each super-vertex in
+    # this order and the sizes of the super-vertices.
+    def blocks(self, level=None):
+        i = self.index(level)
+        return self.orders[i], self.offsets[i][:-1], self.sizes[i]
+
+    # Method that returns the original vertices of a super-vertex in a level.
+    def members(self, super_vertex, level=None):
+        i = self.index(level)
+        return self.orders[i][self.offsets[i][super_vertex]:self.offsets[i][super_vertex + 1]]
+
+    # Method that returns the super-vertex of an upper level of each vertex of a lower level.
+    def parents(self, upper_level, lower_level):
+        lower = self.index(lower_level)
+        parents = np.empty(len(self.sizes[lower]), dtype=np.int64)
+        parents[self.memberships[lower]] = self.memberships[self.index(upper_level)]
+        return parents
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import hashlib
+from tempfile import mkdtemp
+import numpy as np
+from igraph import Graph
+from loader.edge_index import EdgeIndex
+from coarsening.hierarchy import Hierarchy
+
+# Class that stores the coarsed graphs of the multilevel hierarchies, so the matching and the contraction of a level are
+# done once and reused by the runs with other similarity indices or multilevel link predictors. Each level of a fold
+# (the network without its probe edges) and of a matching is a directory with the edges of the coarsed graph in CSR
+# arrays (offsets, neighbors and weights) and its successors mapping as .npy files, loaded only when the level is used.
+class HierarchyStore():
+
+    # Version of the store format. The levels of other versions are coarsed again.
+    version = 3
+
+    def __init__(self, directory):
+        # Directory of the stored hierarchies.
+        self.directory = directory
+
+    # Method that returns the key of a fold: a hash of the network file (name, size and modification time) and of the
+    # probe edges removed from the fold graph.
+    def fold_key(self, file, probe_edges):
+        status = os.stat(file)
+        sha1 = hashlib.sha1("%s %d %r" % (os.path.basename(file), status.st_size, status.st_mtime))
+        edges = np.array(sorted(probe_edges), dtype=np.int64).reshape(-1, 2)
+        sha1.update(((np.minimum(edges[:, 0], edges[:, 1]) << 32) | np.maximum(edges[:, 0], edges[:, 1])).tostring())
+        return sha1.hexdigest()
+
+    # Method that returns the directory of a level of the hierarchy of a fold and a matching.
+    def level_path(self, fold_key, matching_name, level):
+        return os.path.join(self.directory, fold_key, matching_name, "level%d" % level)
+
+    # Method that returns the coarsed graph of a level. If the level isn't stored, it's coarsed from the graph of the
+    # previous level by the function and stored.
+    def coarsen(self, graph, fold_key, matching_name, level, coarsen_function):
+        coarsed_graph = self.load(fold_key, matching_name, level)
+        if(coarsed_graph is None):
+            coarsed_graph = coarsen_function(graph)
+            self.save(fold_key, matching_name, level, coarsed_graph)
+        else:
+            # The loaded level is added to the hierarchy of the graph by the map of its vertices to the super-vertices.
+            hierarchy = Hierarchy.get(graph)
+            vertex_map = np.empty(graph.vcount(), dtype=np.int64)
+            vertex_map[hierarchy.membership()] = coarsed_graph['successors']
+            coarsed_graph['hierarchy'] = hierarchy.add_level(level, vertex_map, coarsed_graph.vcount())
+        return coarsed_graph
+
+    # Method that loads the coarsed graph of a level or returns None if the level isn't stored.
+    def load(self, fold_key, matching_name, level):
+        path = self.level_path(fold_key, matching_name, level)
+        header_path = os.path.join(path, "header.json")
+        if(not os.path.exists(header_path)):
+            return None
+        with open(header_path) as header_file:
+            header = json.load(header_file)
+        if(header.get('version') != self.version):
+            return None
+        arrays = dict((name, np.load(os.path.join(path, name + ".npy"), mmap_mode='r')) for name in ['offsets', 'neighbors', 'weights', 'successors'])
+        sources = np.repeat(np.arange(header['vcount']), np.diff(arrays['offsets']))
+        coarsed_graph = Graph(n=header['vcount'], edges=zip(sources.tolist(), arrays['neighbors'].tolist()))
+        coarsed_graph.es['weight'] = arrays['weights'].tolist()
+        coarsed_graph['level'] = header['level']
+        coarsed_graph['successors'] = np.array(arrays['successors'])
+        coarsed_graph['edge_index'] = EdgeIndex(coarsed_graph)
+        return coarsed_graph
+
+    # Method that stores the coarsed graph of a level. The level is written in a temporary directory and renamed, so
+    # the processes that use the same store never read a partial level.
+    def save(self, fold_key, matching_name, level, coarsed_graph):
+        path = self.level_path(fold_key, matching_name, level)
+        parent = os.path.dirname(path)
+        if(not os.path.isdir(parent)):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if(not os.path.isdir(parent)):
+                    raise
+        edges = np.array(coarsed_graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+        order = np.argsort(edges[:, 0], kind='mergesort')
+        offsets = np.zeros(coarsed_graph.vcount() + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(edges[:, 0], minlength=coarsed_graph.vcount()))
+        temporary_path = mkdtemp(dir=parent)
+        try:
+            np.save(os.path.join(temporary_path, "offsets.npy"), offsets)
+            np.save(os.path.join(temporary_path, "neighbors.npy"), edges[order, 1])
+            np.save(os.path.join(temporary_path, "weights.npy"), np.array(coarsed_graph.es['weight'], dtype=np.float64)[order])
+            np.save(os.path.join(temporary_path, "successors.npy"), np.asarray(coarsed_graph['successors'], dtype=np.int64))
+            with open(os.path.join(temporary_path, "header.json"), 'w') as header_file:
+                json.dump({'version': self.version, 'vcount': coarsed_graph.vcount(), 'ecount': coarsed_graph.ecount(),
+                           'level': coarsed_graph['level']}, header_file)
+            # A level of other version is replaced.
+            if(os.path.isdir(path)):
+                shutil.rmtree(path, ignore_errors=True)
+            os.rename(temporary_path, path)
+        except OSError:
+            # Other process stored the same level.
+            if(not os.path.exists(os.path.join(path, "header.json"))):
+                raise
+        finally:
+            shutil.rmtree(temporary_path, ignore_errors=True)
@@ -1,102 +1,79 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import multiprocessing
 import random
+import numpy as np
+from itertools import izip
+from loader.edge_index import EdgeIndex
+from similarity.sparse_similarity import SparseSimilarity
 
-class Matching():
+# Sparse engine loaded with the graph whose edges are scored. The worker processes are forked after it's set, so they
+# share its pages.
+matching_similarity = None
 
-    def __init__(self):
-        # Array that contains all the available matching methods implemented in this class.
-        self.matchings_array = [self.random_matching, self.most_similar_edge_matching, self.least_similar_edge_matching,
-                                self.heavy_edge_matching, self.light_edge_matching]
+# Function that scores a chunk of edges in a worker process. It is a module function so it can be sent to the worker
+# processes.
+def score_edges(arguments):
+    similarity_name, sources, targets = arguments
+    return matching_similarity.indices[similarity_name](sources, targets)
 
+class Matching():
 
+    def __init__(self, similarity_cache=None, max_cluster_size=8, rounds=10, workers=1, chunk_size=2 ** 18):
+        # Array that contains all the available matching methods implemented in this class. The pairwise matchings set
+        # matching[i] = j and matching[j] = i, the cluster matchings set matching[i] to the lowest vertex of its cluster.
+        self.matchings_array = [self.random_matching, self.most_similar_edge_matching, self.least_similar_edge_matching,
+                                self.heavy_edge_matching, self.light_edge_matching, self.label_propagation_matching,
+                                self.twin_vertex_matching, self.greedy_heavy_edge_matching, self.greedy_light_edge_matching]
+        # Cache shared with the link predictor, so the scores of the edges are calculated only once for each graph.
+        self.similarity_cache = similarity_cache
+        # Maximum number of vertices of a cluster of the cluster matchings.
+        self.max_cluster_size = max_cluster_size
+        # Number of rounds of the label propagation.
+        self.rounds = rounds
+        # Number of processes that calculate the similarities of the edges.
+        self.workers = workers
+        # Number of edges scored by each task of the worker processes.
+        self.chunk_size = chunk_size
+        # Engine that calculates the similarities of the edges at once for the indices that have a batch implementation.
+        self.sparse_similarity = SparseSimilarity()
 
-    # Implementation of the Random matching (RM). Time complexity is O(|E|).
+    # Implementation of the Random matching (RM). The edges are matched in a random order, so each edge has a random
+    # priority. Time complexity is O(|E| log |E|) for each handshake round.
     def random_matching(self, graph, similarity):
-        # Creates an array that represents the matching array.
-        matching = range(graph.vcount())
-        # Gets the edgelist.
-        edgelist = graph.get_edgelist()
-        for edge in random.sample(edgelist, len(edgelist)):
-            from_vertex = edge[0]
-            to_vertex = edge[1]
-            # If this condition is satisfied, a matching occurs.
-            if(matching[from_vertex] == from_vertex and matching[to_vertex] == to_vertex):
-                matching[from_vertex] = to_vertex
-                matching[to_vertex] = from_vertex
+        sources, targets, weights = EdgeIndex.get(graph).edges()
+        return self.handshake_matching(graph.vcount(), sources, targets, np.random.random(len(sources)))
 
-        return matching
 
-
-    # Implementation of the Most Similar Edge Matching (MSEM). For each vertex that was not matched yet,
-    # The most similar (according to a similarity measure) neighbor is selected for matching. MSE - Most Similar Edge.
+    # Implementation of the Most Similar Edge Matching (MSEM). The most similar edges (according to a similarity measure)
+    # are matched first, ties are broken at random. The similarities of the edges are calculated at once. MSE - Most
+    # Similar Edge. Time complexity is O(|E| log |E|) for each handshake round.
     def most_similar_edge_matching(self, graph, similarity):
-        adjlist = map(set, graph.get_adjlist())
-        # Creates an array that represents the matching array.
-        matching = range(graph.vcount())
-        # Dictionary that stores the similarities already calculated for the graph.
-        for i in range(graph.vcount()):
-            # Means a non-matched vertex.
-            if(i == matching[i]):
-                neighbors = graph.neighbors(i)
-                best_similarity = -1
-                # For each vertex neighbor, the similarity will be calculated. The for similar vertex will be selected.
-                for j in neighbors:
-                    # Means a non-matched neighbor.
-                    if(matching[j] == j):
-                        sim = similarity(graph, adjlist, i=i, j=j)
-                        if(sim > best_similarity):
-                            # Updates the best similarity found.
-                            best_similarity = sim
-                            # Corrects the old matching.
-                            matching[matching[i]] = matching[i]
-                            # Add the new matches.
-                            matching[i] = j
-                            matching[j] = i
-        return matching
+        sources, targets, scores = self.edge_similarity_scores(graph, similarity)
+        return self.handshake_matching(graph.vcount(), sources, targets, scores)
 
-    # Implementation of the Least Similar Edge Matching (LSEM). For each vertex that was not matched yet,
-    # The least similar (according to a similarity measure) neighbor is selected for matching. MSE - Least Similar Edge.
+    # Implementation of the Least Similar Edge Matching (LSEM). The least similar edges (according to a similarity
+    # measure) are matched first, ties are broken at random. LSE - Least Similar Edge. Time complexity is O(|E| log |E|)
+    # for each handshake round.
     def least_similar_edge_matching(self, graph, similarity):
-        adjlist = map(set, graph.get_adjlist())
-        # Creates an array that represents the matching array.
-        matching = range(graph.vcount())
-        # Dictionary that stores the similarities already calculated for the graph.
-        for i in range(graph.vcount()):
-            # Means a non-matched vertex.
-            if(i == matching[i]):
-                neighbors = graph.neighbors(i)
-                worst_similarity = float("inf")
-                # For each vertex neighbor, the similarity will be calculated. The for similar vertex will be selected.
-                for j in neighbors:
-                    # Means a non-matched neighbor.
-                    if(matching[j] == j):
-                        sim = similarity(graph, adjlist, i=i, j=j)
-                        if(sim < worst_similarity):
-                            # Updates the best similarity found.
-                            worst_similarity = sim
-                            # Corrects the old matching.
-                            matching[matching[i]] = matching[i]
-                            # Add the new matches.
-                            matching[i] = j
-                            matching[j] = i
-        return matching
-
+        sources, targets, scores = self.edge_similarity_scores(graph, similarity)
+        return self.handshake_matching(graph.vcount(), sources, targets, -scores)
 
-    # Implementation of the Heavy Edge Matching (HEM). Time complexity is O(|E|).
+    # Implementation of the Heavy Edge Matching (HEM). The vertices are visited in a random order and each vertex that
+    # was not matched yet is matched to its unmatched neighbor with the heaviest edge. Time complexity is O(|E|).
     def heavy_edge_matching(self, graph, similarity):
+        edge_index = EdgeIndex.get(graph)
+        adjlist = graph.get_adjlist()
         matching = range(graph.vcount())
 
         for vertex in random.sample(matching, len(matching)):
             # Means that the vertice was not matched yet.
             if(matching[vertex] == vertex):
-                # Gets the adjacent neighbors.
-                neighbors = graph.neighbors(vertex)
                 greatest_value = 0
                 greatest_value_neighbor = -1
-                for neighbor in neighbors:
+                for neighbor in adjlist[vertex]:
                     if(matching[neighbor] == neighbor):
-                        value = graph[min(vertex, neighbor), max(vertex, neighbor)]
+                        value = edge_index.weight(vertex, neighbor)
                         if(value > greatest_value):
                             greatest_value = value
                             greatest_value_neighbor = neighbor
@@ -106,20 +83,21 @@ class Matching():
 
         return matching
 
-    # Implementation of the Heavy Edge Matching (HEM). Time complexity is O(|E|).
+    # Implementation of the Light Edge Matching (LEM). The vertices are visited in a random order and each vertex that
+    # was not matched yet is matched to its unmatched neighbor with the lightest edge. Time complexity is O(|E|).
     def light_edge_matching(self, graph, similarity):
+        edge_index = EdgeIndex.get(graph)
+        adjlist = graph.get_adjlist()
         matching = range(graph.vcount())
 
         for vertex in random.sample(matching, len(matching)):
             # Means that the vertice was not matched yet.
             if(matching[vertex] == vertex):
-                # Gets the adjacent neighbors.
-                neighbors = graph.neighbors(vertex)
                 lowest_value = float("inf")
                 lowest_value_neighbor = -1
-                for neighbor in neighbors:
+                for neighbor in adjlist[vertex]:
                     if(matching[neighbor] == neighbor):
-                        value = graph[min(vertex, neighbor), max(vertex, neighbor)]
+                        value = edge_index.weight(vertex, neighbor)
                         if(value < lowest_value):
                             lowest_value = value
                             lowest_value_neighbor = neighbor
@@ -129,12 +107,182 @@ class Matching():
 
         return matching
 
+    # Implementation of the Label Propagation Matching (LP), a size constrained label propagation guided by the similarity
+    # of the edges. Each vertex starts in its own cluster and, in each round, a random half of the vertices moves to the
+    # cluster of its neighbors with the highest sum of similarities, if it's higher than the sum of its own cluster and
+    # the cluster has less than max_cluster_size vertices. Time complexity is O(|E| log |E|) for each round.
+    def label_propagation_matching(self, graph, similarity):
+        vcount = graph.vcount()
+        sources, targets, scores = self.edge_similarity_scores(graph, similarity)
+        mask = sources != targets
+        # The edges without similarity (like the common neighbors of a bridge) still attract their vertices a little.
+        scores = np.asarray(scores, dtype=np.float64)[mask] + 1e-6
+        vertices = np.concatenate((sources[mask], targets[mask]))
+        neighbors = np.concatenate((targets[mask], sources[mask]))
+        scores = np.concatenate((scores, scores))
+        labels = np.arange(vcount)
+        for label_round in range(self.rounds):
+            sizes = np.bincount(labels, minlength=vcount)
+            # The sum of the similarities of each vertex to each cluster of its neighbors.
+            keys, inverse = np.unique((vertices << 32) | labels[neighbors], return_inverse=True)
+            sums = np.bincount(inverse, weights=scores)
+            key_vertices, key_labels = keys >> 32, keys & 0xFFFFFFFF
+            own = key_labels == labels[key_vertices]
+            own_sums = np.zeros(vcount)
+            own_sums[key_vertices[own]] = sums[own]
+            # The candidate clusters of the moving vertices, with room for one more vertex.
+            moving = np.random.random(vcount) < 0.5
+            mask = ~own & moving[key_vertices] & (sizes[key_labels] < self.max_cluster_size)
+            key_vertices, key_labels, sums = key_vertices[mask], key_labels[mask], sums[mask]
+            # The best cluster of each vertex.
+            order = np.lexsort((-sums, key_vertices))
+            best_vertices, first = np.unique(key_vertices[order], return_index=True)
+            best_labels, best_sums = key_labels[order][first], sums[order][first]
+            mask = best_sums > own_sums[best_vertices]
+            best_vertices, best_labels, best_sums = best_vertices[mask], best_labels[mask], best_sums[mask]
+            if(not len(best_vertices)):
+                break
+            # Each cluster receives the vertices with the highest sums up to its size limit.
+            order = np.lexsort((-best_sums, best_labels))
+            best_vertices, best_labels = best_vertices[order], best_labels[order]
+            group_starts = np.flatnonzero(np.concatenate(([True], best_labels[1:] != best_labels[:-1])))
+            ranks = np.arange(len(best_labels)) - np.repeat(group_starts, np.diff(np.concatenate((group_starts, [len(best_labels)]))))
+            accepted = ranks < (self.max_cluster_size - sizes[best_labels])
+            labels[best_vertices[accepted]] = best_labels[accepted]
+        return self.clusters_matching(labels)
 
+    # Implementation of the Twin Vertex Matching (TWIN). The vertices with the same neighbors (like the leaves of a hub)
+    # are collapsed in clusters of up to max_cluster_size vertices, and then the adjacent vertices with the same
+    # neighbors plus themselves. The neighborhoods are compared by a random 64-bit hash (the sum of random values of
+    # their vertices) and their sizes. Time complexity is O(|V| log |V| + |E|).
+    def twin_vertex_matching(self, graph, similarity):
+        vcount = graph.vcount()
+        adjacency = EdgeIndex.get(graph).adjacency()
+        degrees = np.diff(adjacency.indptr)
+        values = np.random.randint(0, 2 ** 62, size=vcount, dtype=np.int64)
+        rows = np.repeat(np.arange(vcount), degrees)
+        # The sums overflow and wrap around, which keeps them as hashes of the neighborhoods.
+        open_hashes = np.zeros(vcount, dtype=np.int64)
+        np.add.at(open_hashes, rows, values[adjacency.indices])
+        labels = np.arange(vcount)
+        clustered = np.zeros(vcount, dtype=bool)
+        for hashes, sizes in [(open_hashes, degrees), (open_hashes + values, degrees + 1)]:
+            # Only the vertices that were not collapsed yet (and that have neighbors) are grouped.
+            candidates = np.flatnonzero(~clustered & (degrees > 0))
+            order = candidates[np.lexsort((candidates, sizes[candidates], hashes[candidates]))]
+            same = (hashes[order][1:] == hashes[order][:-1]) & (sizes[order][1:] == sizes[order][:-1])
+            group_starts = np.flatnonzero(np.concatenate(([True], ~same)))
+            group_sizes = np.diff(np.concatenate((group_starts, [len(order)])))
+            # The groups are split in clusters of up to max_cluster_size vertices.
+            ranks = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+            first = order[np.repeat(group_starts, group_sizes) + (ranks - (ranks % self.max_cluster_size))]
+            labels[order] = first
+            clustered[order[np.repeat(group_sizes, group_sizes) > 1]] = True
+        return self.clusters_matching(labels)
 
+    # Implementation of the Greedy Heavy Edge Matching (GHEM). The heaviest edges of the whole graph are matched first,
+    # ties are broken at random. Unlike the HEM, the matching doesn't depend on a visiting order of the vertices, so it's
+    # calculated by the handshake rounds. Time complexity is O(|E| log |E|) for each handshake round.
+    def greedy_heavy_edge_matching(self, graph, similarity):
+        sources, targets, weights = EdgeIndex.get(graph).edges()
+        return self.handshake_matching(graph.vcount(), sources, targets, weights)
 
+    # Implementation of the Greedy Light Edge Matching (GLEM). The lightest edges of the whole graph are matched first,
+    # ties are broken at random. Time complexity is O(|E| log |E|) for each handshake round.
+    def greedy_light_edge_matching(self, graph, similarity):
+        sources, targets, weights = EdgeIndex.get(graph).edges()
+        return self.handshake_matching(graph.vcount(), sources, targets, -weights)
 
+    # Method that returns the matching array of clusters given by a label of each vertex: each vertex is matched to the
+    # lowest vertex of its cluster, so the coarser creates a super-vertex for each cluster.
+    def clusters_matching(self, labels):
+        labels = np.asarray(labels, dtype=np.int64)
+        lowest = np.full(len(labels), len(labels), dtype=np.int64)
+        np.minimum.at(lowest, labels, np.arange(len(labels)))
+        return lowest[labels]
 
+    ############################
+    #    Edge similarities     #
+    ############################
 
+    # Method that returns the edges (v, u), v < u, of the graph and their similarities as arrays. The similarities are
+    # taken from the cache when they were calculated before (like by the link prediction of the same graph) and the
+    # missing ones are calculated at once.
+    def edge_similarity_scores(self, graph, similarity):
+        sources, targets, weights = EdgeIndex.get(graph).edges()
+        if(self.similarity_cache is None):
+            scores = self.similarities_of(graph, similarity, sources, targets)
+        else:
+            scores = self.similarity_cache.pair_scores(self.similarity_cache.key(graph, similarity), sources, targets,
+                                                       lambda v, u: self.similarities_of(graph, similarity, v, u))
+        # The similarities are rounded, so the ties don't depend on the summation order of the engine that calculated them.
+        return sources, targets, np.round(np.asarray(scores, dtype=np.float64), 12)
 
+    # Method that calculates the similarities of the pairs (sources[k], targets[k]) of the graph. The pairs are split in
+    # chunks scored by worker processes.
+    def similarities_of(self, graph, similarity, sources, targets):
+        global matching_similarity
+        if(self.sparse_similarity.supports(similarity)):
+            self.sparse_similarity.load_graph(graph)
+            # The daemonic processes (like the fold workers) can't have children, so they score sequentially. Only the
+            # local indices are split in chunks, since the global ones (like katz) would build their engine in each chunk.
+            if(self.workers > 1 and len(sources) > self.chunk_size and similarity.__name__ in SparseSimilarity.local_indices and
+               not multiprocessing.current_process().daemon):
+                sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+                tasks = [(similarity.__name__, sources[first:(first + self.chunk_size)], targets[first:(first + self.chunk_size)])
+                         for first in range(0, len(sources), self.chunk_size)]
+                matching_similarity = self.sparse_similarity
+                pool = multiprocessing.Pool(min(self.workers, len(tasks)))
+                try:
+                    # The chunks are returned in order, so the scores follow the pairs.
+                    return np.concatenate([np.asarray(scores, dtype=np.float64) for scores in pool.imap(score_edges, tasks)])
+                finally:
+                    pool.close()
+                    pool.join()
+                    matching_similarity = None
+            return self.sparse_similarity.pair_scores(similarity, sources, targets)
+        adjlist = map(set, graph.get_adjlist())
+        return [similarity(graph, adjlist, i=v, j=u) for v, u in izip(np.asarray(sources).tolist(), np.asarray(targets).tolist())]
 
+    ############################
+    #     Handshake kernel     #
+    ############################
 
+    # Method that matches the edges with the highest priorities. In each handshake round, every vertex points to its
+    # unmatched neighbor with the highest priority and the pairs of vertices that point to each other are matched (a
+    # locally dominant edge). The result is the same of matching the edges greedily in the priority order. The edges
+    # that remain after max_rounds rounds are matched greedily. Returns the matching array.
+    def handshake_matching(self, vcount, sources, targets, priorities, max_rounds=32):
+        matching = np.arange(vcount)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        # The ties are broken at random, so each edge has an unique rank. (The higher the rank, the higher the priority)
+        ranks = np.empty(len(sources), dtype=np.int64)
+        ranks[np.lexsort((np.random.random(len(sources)), priorities))] = np.arange(len(sources))
+        mask = sources != targets
+        sources, targets, ranks = sources[mask], targets[mask], ranks[mask]
+        for handshake_round in range(max_rounds):
+            if(not len(ranks)):
+                break
+            # Finds the incident edge with the highest rank of each vertex.
+            vertices = np.concatenate((sources, targets))
+            order = np.argsort(-np.concatenate((ranks, ranks)), kind='mergesort')
+            best_vertices, first = np.unique(vertices[order], return_index=True)
+            best_ranks = np.full(vcount, -1, dtype=np.int64)
+            best_ranks[best_vertices] = np.concatenate((ranks, ranks))[order][first]
+            # Matches the edges that are the best ones of both vertices.
+            dominant = (best_ranks[sources] == ranks) & (best_ranks[targets] == ranks)
+            matching[sources[dominant]] = targets[dominant]
+            matching[targets[dominant]] = sources[dominant]
+            # Removes the edges of the matched vertices.
+            unmatched = matching == np.arange(vcount)
+            mask = unmatched[sources] & unmatched[targets]
+            sources, targets, ranks = sources[mask], targets[mask], ranks[mask]
+        # The remaining edges are matched greedily in the rank order.
+        for i in np.argsort(-ranks, kind='mergesort').tolist():
+            from_vertex = sources[i]
+            to_vertex = targets[i]
+            if(matching[from_vertex] == from_vertex and matching[to_vertex] == to_vertex):
+                matching[from_vertex] = to_vertex
+                matching[to_vertex] = from_vertex
+        return matching
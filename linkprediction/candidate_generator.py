@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import numpy as np
+import scipy.sparse
+from loader.edge_index import EdgeIndex
+
+# Class that generates the candidate pairs for link prediction. Instead of all the V^2 pairs of the graph, only the
+# pairs of vertices that can be reached within k hops are generated, since the local similarity indices are zero for
+# the other pairs. The pairs are generated in chunks of arrays to do not overload the memory.
+class CandidateGenerator():
+
+    def __init__(self, hops=2, chunk_size=2 ** 20):
+        # Maximum distance between the vertices of a candidate pair.
+        self.hops = hops
+        # Approximated number of pairs in each chunk.
+        self.chunk_size = chunk_size
+
+    # Method that builds the binary and symmetric adjacency matrix of the graph. The direction of the edges is
+    # ignored, so the candidates of directed graphs are the pairs within k hops in any direction.
+    def adjacency(self, graph):
+        adjacency = EdgeIndex.get(graph).adjacency()
+        adjacency = (adjacency + adjacency.T).tocsr()
+        adjacency.data[:] = 1
+        return adjacency
+
+    # Method that splits the vertices in blocks of rows, so each block generates about chunk_size pairs. The number of
+    # pairs of a vertex is estimated by its number of 2 hops paths. Complexity = O(V + E)
+    def row_blocks(self, adjacency):
+        degrees = np.asarray(adjacency.sum(axis=1)).ravel()
+        paths = np.cumsum(adjacency.dot(degrees) + degrees)
+        boundaries = [0, adjacency.shape[0]]
+        if(len(paths) and paths[-1] > 0):
+            boundaries.extend(np.searchsorted(paths, np.arange(self.chunk_size, paths[-1], self.chunk_size)).tolist())
+        boundaries = sorted(set(boundaries))
+        return zip(boundaries[:-1], boundaries[1:])
+
+    # Method that generates the candidate pairs (v, u), v < u, that are not edges of the graph and whose distance is
+    # at most the number of hops. Each chunk is a tuple of arrays (sources, targets). Complexity = O(sum(deg^2)) for
+    # two hops.
+    def generate(self, graph):
+        adjacency = self.adjacency(graph)
+        for start, end in self.row_blocks(adjacency):
+            reached = adjacency[start:end]
+            frontier = reached
+            for hop in range(2, (self.hops + 1)):
+                frontier = frontier * adjacency
+                frontier.data[:] = 1
+                reached = reached + frontier
+            # Removes the pairs that are already edges of the graph.
+            reached = (reached - adjacency[start:end].multiply(reached)).tocoo()
+            sources = reached.row.astype(np.int64) + start
+            targets = reached.col.astype(np.int64)
+            # Only the pairs above the main diagonal with a positive reach are candidates.
+            mask = (targets > sources) & (reached.data > 0)
+            order = np.lexsort((targets[mask], sources[mask]))
+            yield sources[mask][order], targets[mask][order]
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import multiprocessing
+import random
+from itertools import izip
+import numpy as np
+
+# Function that seeds the random generators and runs a fold. It is a module function so it can be sent to the
+# worker processes.
+def run_seeded_fold(arguments):
+    fold_function, fold, seed = arguments
+    random.seed(seed)
+    np.random.seed(seed % (2 ** 32))
+    return fold_function(fold)
+
+# Class that runs the folds of the k-fold evaluation concurrently in worker processes. The workers are forked from the
+# main process, so they share the pages of the loaded graph. Each fold must work on its own copy of the graph (with its
+# own probe edges removed) instead of changing the shared graph.
+class FoldScheduler():
+
+    def __init__(self, workers=1):
+        # Number of folds that are executed at the same time.
+        self.workers = workers
+
+    # Method that runs a fold function for each fold and yields the results in the order of the folds. The random
+    # generators are seeded for each fold, so the forked workers don't repeat the same random sequences.
+    def run(self, fold_function, folds, seeds):
+        arguments = [(fold_function, fold, seed) for fold, seed in izip(folds, seeds)]
+        if(self.workers <= 1 or len(arguments) <= 1):
+            for argument in arguments:
+                yield run_seeded_fold(argument)
+        else:
+            pool = multiprocessing.Pool(min(self.workers, len(arguments)))
+            try:
+                for result in pool.imap(run_seeded_fold, arguments):
+                    yield result
+            finally:
+                pool.close()
+                pool.join()
@@ -1,21 +1,41 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import scipy.sparse
+from itertools import izip
+from similarity.sparse_similarity import SparseSimilarity
+from similarity.parallel_similarity import ParallelSimilarity
+from linkprediction.candidate_generator import CandidateGenerator
+from loader.edge_index import EdgeIndex
 
 class LinkPredictor():
 
-    def __init__(self):
-        self.predictors_array = [self.link_prediction_by_similarity, self.link_prediction_by_similarity_to_file, self.link_prediction_by_similarity_non_zero]
+    def __init__(self, workers=1, similarity_cache=None):
+        self.predictors_array = [self.link_prediction_by_similarity, self.link_prediction_by_similarity_to_file, self.link_prediction_by_similarity_non_zero,
+                                 self.link_prediction_by_candidates, self.link_prediction_by_candidates_to_file,
+                                 self.link_prediction_by_similarity_parallel, self.link_prediction_by_similarity_parallel_to_file]
+        # Cache shared with the matching. The engines store in it the scores of the edges, that are calculated by the
+        # blocks but not predicted, so the matching of the same graph doesn't calculate them again.
+        self.similarity_cache = similarity_cache
+        # Engine that calculates the local similarity indices in blocks by sparse matrix products.
+        self.sparse_similarity = SparseSimilarity(similarity_cache=similarity_cache)
+        # Engine that calculates the indices of the sparse engine in a number of worker processes.
+        self.parallel_similarity = ParallelSimilarity(workers, similarity_cache=similarity_cache)
 
     # Method that predict links in without consider self edges.
     def link_prediction_by_similarity(self, graph, similarity):
         predicted_edges = {}
+        # The indices that have a batch implementation are calculated by the sparse engine.
+        if(self.sparse_similarity.supports(similarity)):
+            for sources, targets, scores in self.sparse_similarity.predict_blocks(graph, similarity):
+                predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), scores.tolist()))
+            return predicted_edges
         adjlist = map(set, graph.get_adjlist())
+        edge_index = EdgeIndex.get(graph)
         for v in range(graph.vcount()):
             for u in range((v + 1), graph.vcount()):
                 # A 0 value in a adjacency matrix position means that not exist a edge.
                 # Also, this function doesn't considerate self links.
-                if(graph[v, u] == 0):
+                if(not edge_index.contains(v, u)):
                     predicted_value = similarity(graph, adjlist, i = v, j = u)
                     predicted_edges[(v, u)] = predicted_value
         return predicted_edges
@@ -23,27 +43,92 @@ class LinkPredictor():
 
     # Method that predict links in without consider self edges. The output is saved in a outputfile to do not overload the memory.
     def link_prediction_by_similarity_to_file(self, graph, similarity, io_handler):
+        # The indices that have a batch implementation are calculated by the sparse engine.
+        if(self.sparse_similarity.supports(similarity)):
+            for sources, targets, scores in self.sparse_similarity.predict_blocks(graph, similarity):
+                io_handler.write_predicted_edges_block(sources, targets, scores)
+            return
         adjlist = map(set, graph.get_adjlist())
+        edge_index = EdgeIndex.get(graph)
         for v in range(graph.vcount()):
             for u in range((v + 1), graph.vcount()):
                 # A 0 value in a adjacency matrix position means that not exist a edge.
                 # Also, this function doesn't considerate self links.
-                if (graph[v, u] == 0):
+                if (not edge_index.contains(v, u)):
                     io_handler.write_predicted_edge((v, u), str(similarity(graph, adjlist, v, u)))
 
 
     # Method that predict links without consider self edges. This method does not save edges with a zero value.
     def link_prediction_by_similarity_non_zero(self, graph, similarity, threshold = 0.00005):
         predicted_edges = {}
+        # The indices that have a batch implementation are calculated by the sparse engine.
+        if(self.sparse_similarity.supports(similarity)):
+            for sources, targets, scores in self.sparse_similarity.predict_blocks(graph, similarity, threshold):
+                predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), scores.tolist()))
+            return predicted_edges
         adjlist = map(set, graph.get_adjlist())
+        edge_index = EdgeIndex.get(graph)
         for v in range(graph.vcount()):
             for u in range((v + 1), graph.vcount()):
                 # A 0 value in a adjacency matrix position means that not exist a edge.
                 # Also, this function doesn't considerate self links.
-                if (graph[v, u] == 0):
+                if (not edge_index.contains(v, u)):
                     # print "Predicted:", (v,u)
                     sim = similarity(graph, adjlist, i=v, j=u)
                     if (sim > threshold):
                         predicted_edges[(v, u)] = sim
                         print "Size: ", len(predicted_edges), "Sim:", sim
         return predicted_edges
+
+
+    # Method that predict links only for the candidate pairs that are within a number of hops. The other pairs are an
+    # implicit tail of zero scores that is not stored, so the ranking must be evaluated as a non-zero ranking. Indices
+    # that are not zero outside the neighborhood (like preferential attachment) are truncated to the candidates.
+    def link_prediction_by_candidates(self, graph, similarity, hops=2):
+        predicted_edges = {}
+        candidate_generator = CandidateGenerator(hops)
+        # The indices that have a batch implementation are calculated by the sparse engine.
+        if(self.sparse_similarity.supports(similarity)):
+            self.sparse_similarity.load_graph(graph)
+            for sources, targets in candidate_generator.generate(graph):
+                scores = self.sparse_similarity.pair_scores(similarity, sources, targets)
+                predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), scores.tolist()))
+            return predicted_edges
+        adjlist = map(set, graph.get_adjlist())
+        for sources, targets in candidate_generator.generate(graph):
+            for v, u in izip(sources.tolist(), targets.tolist()):
+                predicted_edges[(v, u)] = similarity(graph, adjlist, i=v, j=u)
+        return predicted_edges
+
+    # Method that predict links only for the candidate pairs that are within a number of hops. The output is saved in a
+    # outputfile to do not overload the memory.
+    def link_prediction_by_candidates_to_file(self, graph, similarity, io_handler, hops=2):
+        candidate_generator = CandidateGenerator(hops)
+        # The indices that have a batch implementation are calculated by the sparse engine.
+        if(self.sparse_similarity.supports(similarity)):
+            self.sparse_similarity.load_graph(graph)
+            for sources, targets in candidate_generator.generate(graph):
+                io_handler.write_predicted_edges_block(sources, targets, self.sparse_similarity.pair_scores(similarity, sources, targets))
+            return
+        adjlist = map(set, graph.get_adjlist())
+        for sources, targets in candidate_generator.generate(graph):
+            for v, u in izip(sources.tolist(), targets.tolist()):
+                io_handler.write_predicted_edge((v, u), str(similarity(graph, adjlist, i=v, j=u)))
+
+    # Method that predict links in without consider self edges. The source vertices are split in shards that are scored
+    # by parallel processes. The indices without a batch implementation are calculated sequentially.
+    def link_prediction_by_similarity_parallel(self, graph, similarity):
+        if(not self.parallel_similarity.supports(similarity)):
+            return self.link_prediction_by_similarity(graph, similarity)
+        predicted_edges = {}
+        for sources, targets, scores in self.parallel_similarity.predict_blocks(graph, similarity):
+            predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), scores.tolist()))
+        return predicted_edges
+
+    # Method that predict links in without consider self edges by parallel processes. The output is saved in a
+    # outputfile (or a ranking) as soon as each shard is scored.
+    def link_prediction_by_similarity_parallel_to_file(self, graph, similarity, io_handler):
+        if(not self.parallel_similarity.supports(similarity)):
+            return self.link_prediction_by_similarity_to_file(graph, similarity, io_handler)
+        for sources, targets, scores in self.parallel_similarity.predict_blocks(graph, similarity):
+            io_handler.write_predicted_edges_block(sources, targets, scores)
@@ -4,6 +4,7 @@
 from __future__ import division
 import random
 from itertools import izip
+import numpy as np
 
 # Class with methods that calculates the metrics for test link predictors accuracy.
 class MetricCalculator():
@@ -31,6 +32,9 @@ class MetricCalculator():
     # This method considers that the predicted edges ranking is already batch sorted by the value. This method also
     # works for batched files.
     def calculate_precision_from_file(self, edges_probe_set, iohandler, L=100):
+        if(iohandler.binary):
+            records = iohandler.load_ranking_records()[:L]
+            return (np.count_nonzero(self.probe_mask(records, self.probe_keys(edges_probe_set))) / L)
         iohandler.input_file.seek(0, 0)
         Lr = 0
         # Reads the first L predicted edges from the ranking.
@@ -43,6 +47,14 @@ class MetricCalculator():
                         Lr += 1
         return (Lr / L)
 
+    # Method that calculates the precision score for a top-K ranking (TopKRanking), a edges probe set and a depth L.
+    # The ranking is sorted only once, so the precisions for all the L values come from the same sorted prefix.
+    def calculate_precision_from_ranking(self, ranking, edges_probe_set, L=100):
+        L = min(L, len(edges_probe_set))
+        # Verifies how many of the first L edges in the sorted ranking are in the probe set.
+        Lr = np.count_nonzero(ranking.top()[3][:L])
+        return (Lr / L)
+
 
     ########################
     # Area Under ROC Curve #
@@ -69,10 +81,79 @@ class MetricCalculator():
         return ((n_line + 0.5 * n_twolines)/n)
 
 
+    # Method that calculates the AUC score for a top-K ranking (TopKRanking) and n comparisons. The comparisons are
+    # sampled from the summary statistics of the ranking: the scores of the probe edges and the number of pairs with
+    # each score. As in the method above, the predicted edges are sampled from all the ranked pairs.
+    def calculate_auc_from_ranking(self, ranking, n=100):
+        probe_values = ranking.probe_values()
+        values, counts = ranking.non_probe_distribution()
+        n_pairs = int(counts.sum()) + len(probe_values)
+        # Tests if the n is biggers than the sets sizes.
+        n = min(n, n_pairs, len(probe_values))
+        # Creates a n size sample of the sets for n comparisons.
+        probe_sample = probe_values[random.sample(xrange(len(probe_values)), n)]
+        predicted_positions = np.array(random.sample(xrange(n_pairs), n), dtype=np.int64)
+        # The positions are mapped to the non-probe scores (by their counts) or to the probe scores.
+        non_probe = predicted_positions < (n_pairs - len(probe_values))
+        predicted_sample = np.empty(n)
+        predicted_sample[non_probe] = values[np.searchsorted(np.cumsum(counts), predicted_positions[non_probe], side='right')]
+        predicted_sample[~non_probe] = probe_values[predicted_positions[~non_probe] - (n_pairs - len(probe_values))]
+        # There are n_line times the missing link having a higher score and n_twolines times they have the same score.
+        n_line = np.count_nonzero(probe_sample > predicted_sample)
+        n_twolines = np.count_nonzero(probe_sample == predicted_sample)
+        return ((n_line + 0.5 * n_twolines) / n)
+
+    # Method that calculates the exact AUC score from the scores of the probe edges and the scores of the non-existent
+    # edges, given as an array or as distinct values and the number of edges with each value. The AUC is the
+    # Mann-Whitney statistic: the probability of a probe edge having a higher score than a non-existent edge, where the
+    # ties count 0.5. Complexity = O(N log N)
+    def calculate_exact_auc(self, probe_scores, non_existent_values, non_existent_counts=None):
+        probe_scores = np.asarray(probe_scores, dtype=np.float64)
+        if(non_existent_counts is None):
+            values, counts = np.unique(np.asarray(non_existent_values, dtype=np.float64), return_counts=True)
+        else:
+            order = np.argsort(non_existent_values)
+            values = np.asarray(non_existent_values, dtype=np.float64)[order]
+            counts = np.asarray(non_existent_counts, dtype=np.int64)[order]
+        n_non_existent = counts.sum()
+        # Without comparisons the ranking is not better than a random one.
+        if(len(probe_scores) == 0 or n_non_existent == 0):
+            return 0.5
+        cumulative_counts = np.concatenate(([0], np.cumsum(counts)))
+        # For each probe score, the number of non-existent edges with lower and with the same score.
+        lower = cumulative_counts[np.searchsorted(values, probe_scores, side='left')]
+        lower_or_equal = cumulative_counts[np.searchsorted(values, probe_scores, side='right')]
+        n_line = lower.sum()
+        n_twolines = (lower_or_equal - lower).sum()
+        return ((n_line + 0.5 * n_twolines) / (len(probe_scores) * n_non_existent))
+
+    # Method that calculates the exact AUC score for a link prediction ranking and a edges probe set. The probe edges
+    # that are not in the ranking have a zero score. If the number of pairs that could be predicted is given, the pairs
+    # that are not in the ranking (like in the non-zero rankings) are a tail of non-existent edges with zero score.
+    def calculate_exact_auc_from_edges(self, predicted_edges, edges_probe_set, n_pairs=None):
+        edges = np.array(predicted_edges.keys(), dtype=np.int64).reshape(-1, 2)
+        scores = np.array(predicted_edges.values(), dtype=np.float64)
+        probe = np.array(list(edges_probe_set), dtype=np.int64).reshape(-1, 2)
+        probe_keys = (np.minimum(probe[:, 0], probe[:, 1]) << 32) | np.maximum(probe[:, 0], probe[:, 1])
+        is_probe = np.in1d((np.minimum(edges[:, 0], edges[:, 1]) << 32) | np.maximum(edges[:, 0], edges[:, 1]), probe_keys)
+        probe_scores = np.concatenate((scores[is_probe], np.zeros(len(probe_keys) - np.count_nonzero(is_probe))))
+        non_existent_scores = scores[~is_probe]
+        if(n_pairs is not None):
+            non_existent_scores = np.concatenate((non_existent_scores, np.zeros(max(0, n_pairs - len(scores) - (len(probe_keys) - np.count_nonzero(is_probe))))))
+        return self.calculate_exact_auc(probe_scores, non_existent_scores)
+
+    # Method that calculates the exact AUC score for a top-K ranking (TopKRanking) from its summary statistics, so the
+    # full ranking never has to be stored. The implicit tail of zero scores of the ranking is considered.
+    def calculate_exact_auc_from_ranking(self, ranking):
+        values, counts = ranking.non_probe_distribution()
+        return self.calculate_exact_auc(ranking.probe_values(), values, counts)
+
     # Method that calculates the precision score for a link prediction ranking, a edges probe set and a depth L.
     # This method considers that the predicted edges ranking is already batch sorted by the value. This method also
     # works for batched files.
     def calculate_auc_from_file(self, edges_probe_set, iohandler, n=100):
+        if(iohandler.binary):
+            return self.calculate_auc_from_records(edges_probe_set, iohandler.load_ranking_records(), n)
         iohandler.input_file.seek(0, 0)
         n_line = 0
         n_twolines = 0
@@ -104,6 +185,105 @@ class MetricCalculator():
         return ((n_line + 0.5 * n_twolines) / n)
 
 
+    # Method that calculates the AUC score like the method above for the records of a binary ranking (already batch
+    # shuffled). The first n probe edges are compared with the first n non-existent edges of the ranking, in blocks.
+    def calculate_auc_from_records(self, edges_probe_set, records, n=100, block_size=2 ** 20):
+        n = min(n, len(edges_probe_set))
+        probe_keys = self.probe_keys(edges_probe_set)
+        probe_values = []
+        predicted_values = []
+        probe_count = 0
+        predicted_count = 0
+        for start in range(0, len(records), block_size):
+            if(probe_count >= n and predicted_count >= n):
+                break
+            block = records[start:(start + block_size)]
+            is_probe = self.probe_mask(block, probe_keys)
+            probe_values.append(block['score'][is_probe][:(n - probe_count)])
+            predicted_values.append(block['score'][~is_probe][:(n - predicted_count)])
+            probe_count += len(probe_values[-1])
+            predicted_count += len(predicted_values[-1])
+        # Making the comparisons between the probe and predicted edges. The ranking may have less than n edges of a kind,
+        # so the AUC is the ratio of the comparisons that were made.
+        comparisons = min(probe_count, predicted_count)
+        if(comparisons == 0):
+            return 0.0
+        probe_values = np.concatenate(probe_values)[:comparisons].astype(np.float64)
+        predicted_values = np.concatenate(predicted_values)[:comparisons].astype(np.float64)
+        # There are n_line times the missing link having a higher score and n_twolines times they have the same score.
+        n_line = np.count_nonzero(probe_values > predicted_values)
+        n_twolines = np.count_nonzero(probe_values == predicted_values)
+        return ((n_line + 0.5 * n_twolines) / comparisons)
+
+    # Method that calculates the AUC score like the methods above without shuffling the ranking file (binary or text).
+    # The ranking is read once by the method below.
+    def calculate_auc_from_sample(self, edges_probe_set, iohandler, n=100, seed=None, block_size=2 ** 20, total_pairs=None):
+        return self.calculate_aucs_from_sample(edges_probe_set, iohandler, [n], seed, block_size, total_pairs)[0]
+
+    # Method that calculates the AUC score like the method above for each n of a list. The ranking is sampled once for
+    # the biggest n and the smaller ones use the first comparisons of the sample.
+    def calculate_aucs_from_sample(self, edges_probe_set, iohandler, ns, seed=None, block_size=2 ** 20, total_pairs=None):
+        probe_values, predicted_values = self.sample_ranking(edges_probe_set, iohandler, max(ns), seed, block_size, total_pairs)
+        aucs = []
+        for n in ns:
+            # Making the comparisons between the probe and predicted edges.
+            comparisons = min(n, len(probe_values), len(predicted_values))
+            if(comparisons == 0):
+                aucs.append(0.0)
+                continue
+            # There are n_line times the missing link having a higher score and n_twolines times they have the same score.
+            n_line = np.count_nonzero(probe_values[:comparisons] > predicted_values[:comparisons])
+            n_twolines = np.count_nonzero(probe_values[:comparisons] == predicted_values[:comparisons])
+            aucs.append((n_line + 0.5 * n_twolines) / comparisons)
+        return aucs
+
+    # Method that reads the ranking file once and returns uniform samples of up to n probe scores and n non-existent
+    # scores, in a random order (so their prefixes are uniform samples too). Two reservoirs keep the samples: each edge
+    # gets a random priority and each reservoir keeps the n edges with the lowest priorities. The probe edges that are
+    # not in the ranking have a zero score, so they are mixed in the probe sample by their share of the probe edges. If
+    # the number of pairs that could be predicted is given, the pairs that are not in the ranking (like in the
+    # uncoarsening, that writes only the best pairs) are a tail of non-existent edges with zero score, mixed in the same way.
+    def sample_ranking(self, edges_probe_set, iohandler, n, seed=None, block_size=2 ** 20, total_pairs=None):
+        random_state = np.random.RandomState(seed)
+        probe_keys = self.probe_keys(edges_probe_set)
+        # The priorities and scores of the non-existent edges and of the probe edges.
+        reservoirs = [(np.empty(0), np.empty(0)), (np.empty(0), np.empty(0))]
+        # Number of non-existent edges and of probe edges in the ranking.
+        ranked = [0, 0]
+        for sources, targets, scores in iohandler.load_predicted_edges_blocks(block_size):
+            is_probe = np.in1d((sources << 32) | targets, probe_keys)
+            priorities = random_state.random_sample(len(scores))
+            for k, selected in enumerate([~is_probe, is_probe]):
+                ranked[k] += np.count_nonzero(selected)
+                reservoir_priorities = np.concatenate((reservoirs[k][0], priorities[selected]))
+                reservoir_scores = np.concatenate((reservoirs[k][1], scores[selected]))
+                if(len(reservoir_priorities) > n):
+                    kept = np.argpartition(reservoir_priorities, n)[:n]
+                    reservoir_priorities, reservoir_scores = reservoir_priorities[kept], reservoir_scores[kept]
+                reservoirs[k] = (reservoir_priorities, reservoir_scores)
+        missing = [0, max(0, len(probe_keys) - ranked[1])]
+        if(total_pairs is not None):
+            missing[0] = max(0, total_pairs - ranked[0] - ranked[1] - missing[1])
+        samples = []
+        for k in range(2):
+            reservoir_priorities, reservoir_scores = reservoirs[k]
+            size = min(n, ranked[k] + missing[k])
+            # The number of missing edges of a uniform sample of the ranked and missing edges is hypergeometric.
+            n_missing = random_state.hypergeometric(missing[k], ranked[k], size) if (missing[k] and size) else 0
+            sample = np.concatenate((reservoir_scores[np.argsort(reservoir_priorities)][:(size - n_missing)], np.zeros(n_missing)))
+            samples.append(sample[random_state.permutation(size)].astype(np.float64))
+        return samples[1], samples[0]
+
+    # Method that returns the packed keys (source << 32 | target) of the edges of the probe set.
+    def probe_keys(self, edges_probe_set):
+        probe_edges = np.array(list(edges_probe_set), dtype=np.int64).reshape(-1, 2)
+        return (probe_edges[:, 0] << 32) | probe_edges[:, 1]
+
+    # Method that tells which records of a binary ranking are edges of the probe set (given by its keys).
+    def probe_mask(self, records, probe_keys):
+        keys = (records['source'].astype(np.int64) << 32) | records['target'].astype(np.int64)
+        return np.in1d(keys, probe_keys)
+
     # Method that calculates the AUC score for a link prediction ranking, a edges probe set and n comparisons. This
     # method considers a ranking that only contains non-zero predictions (To do such thing, the way that the edges are
     # randomizes is different from the standard method.
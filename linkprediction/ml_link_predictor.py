@@ -1,15 +1,93 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from __future__ import division
+import multiprocessing
+from itertools import izip
+import numpy as np
 from linkprediction.link_predictor import LinkPredictor
 from similarity.similarity import Similarity
+from loader.edge_index import EdgeIndex
+from coarsening.hierarchy import Hierarchy
+from similarity.sparse_similarity import SparseSimilarity
+
+# Original graph of the refinement. The worker processes are forked after it's set, so they share its pages.
+refinement_graph = None
+
+# Function that scores the pairs inside a group of super-vertices in a worker process. It is a module function so it
+# can be sent to the worker processes.
+def score_super_vertices(arguments):
+    similarity_name, vertices, labels, seed = arguments
+    return score_inside_pairs(refinement_graph, getattr(Similarity(), similarity_name), vertices, labels, seed)
+
+# Function that scores the pairs inside a group of super-vertices, given by their original vertices and a label of the
+# super-vertex of each one. The similarity is calculated on the subgraph induced by each super-vertex: the subgraph of
+# the group without the edges between different super-vertices. Returns the sources, targets and scores of the
+# original pairs (v, u), v < u, that are not original edges. The global indices (like katz, that takes its beta from
+# the spectral radius of the graph) depend on the whole scored graph, so each super-vertex is scored alone, with a
+# seed (of the random indices) given by the seed of the refinement and its lowest vertex. So the scores don't depend on
+# how the super-vertices are grouped in tasks.
+def score_inside_pairs(graph, similarity, vertices, labels, seed=None):
+    if(similarity.__name__ in SparseSimilarity.local_indices or len(vertices) == 0):
+        return score_induced_pairs(graph, similarity, vertices, labels, seed)
+    grouped = np.argsort(labels, kind='mergesort')
+    blocks = []
+    for members in np.split(grouped, np.flatnonzero(np.diff(labels[grouped])) + 1):
+        super_vertex_seed = None if seed is None else (seed + int(vertices[members].min())) % ((2 ** 31) - 1)
+        blocks.append(score_induced_pairs(graph, similarity, vertices[members], np.zeros(len(members), dtype=np.int64), super_vertex_seed))
+    return tuple(np.concatenate(arrays) for arrays in izip(*blocks))
+
+# Function that scores the pairs inside a group of super-vertices like the function above, on the subgraph of the
+# group without the edges between different super-vertices.
+def score_induced_pairs(graph, similarity, vertices, labels, seed=None):
+    order = np.argsort(vertices)
+    vertices, labels = vertices[order], labels[order]
+    subgraph = graph.subgraph(vertices.tolist())
+    subgraph['successors'] = range(subgraph.vcount())
+    subgraph['level'] = 0
+    edges = np.array(subgraph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+    subgraph.delete_edges(np.flatnonzero(labels[edges[:, 0]] != labels[edges[:, 1]]).tolist())
+    # The pairs of the super-vertices with the same size are listed at once (the upper triangle of their members).
+    grouped = np.argsort(labels, kind='mergesort')
+    sizes = np.bincount(labels)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    sources = [np.zeros(0, dtype=np.int64)]
+    targets = [np.zeros(0, dtype=np.int64)]
+    for size in np.unique(sizes[sizes > 1]):
+        same_size = offsets[sizes == size]
+        members = grouped[(same_size[:, np.newaxis] + np.arange(size)).ravel()].reshape(-1, size)
+        first, second = np.triu_indices(size, 1)
+        sources.append(members[:, first].ravel())
+        targets.append(members[:, second].ravel())
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    mask = ~EdgeIndex.get(subgraph).contains_pairs(sources, targets)
+    sources, targets = sources[mask], targets[mask]
+    return vertices[sources], vertices[targets], pair_scores(subgraph, similarity, sources, targets, seed)
+
+# Function that calculates the similarities of the pairs (sources[k], targets[k]) of a graph, by the sparse engine if it
+# supports the similarity. If a seed is given, it's the seed of the random indices (like simrank).
+def pair_scores(graph, similarity, sources, targets, seed=None):
+    sparse_similarity = SparseSimilarity()
+    if(sparse_similarity.supports(similarity)):
+        sparse_similarity.load_graph(graph)
+        if(seed is not None):
+            sparse_similarity.seed = seed
+        return np.asarray(sparse_similarity.pair_scores(similarity, sources, targets), dtype=np.float64)
+    adjlist = map(set, graph.get_adjlist())
+    return np.array([similarity(graph, adjlist, v, u) for v, u in izip(sources.tolist(), targets.tolist())], dtype=np.float64)
 
 class MultilevelLinkPredictor():
 
-    def __init__(self):
+    def __init__(self, chunk_size=2 ** 22, refinement_similarity=None, refinement_workers=1):
         # Array that contains all the available multilevel link predictors implemented in this class.
         self.predictors_array = [self.predict_by_edge_replication, self.predict_by_edge_replication_to_file,
                                  self.predict_by_weighted_edge_replication, self.predict_by_weighted_edge_replication_to_file]
+        # Approximated number of original pairs projected in each block.
+        self.chunk_size = chunk_size
+        # Similarity that scores the pairs inside the super-vertices (on their induced subgraphs) instead of the
+        # constant values of the replication. If None, the pairs inside the super-vertices are replicated.
+        self.refinement_similarity = refinement_similarity
+        # Number of processes that score the pairs inside the super-vertices.
+        self.refinement_workers = refinement_workers
 
     # Method that receives a coarsed graph and the predicted links generated by this graph and generate
     # the predicted links for the original graph (level 0) by replicating the predicted edges for all
@@ -18,27 +96,8 @@ class MultilevelLinkPredictor():
     # algorithm in the coarsed graph). ER - Edge Replication.
     def predict_by_edge_replication(self, original_graph, coarsed_graph, coarsed_predicted_edges):
         original_predicted_edges = {}
-        for v in range(original_graph.vcount()):
-            for u in range((v + 1), original_graph.vcount()):
-                # Tests if the edge doesn't exists in the original graph. (The edge must be predicted)
-                if(original_graph[v, u] == 0):
-                    v_successor = coarsed_graph['successors'][v]
-                    u_successor = coarsed_graph['successors'][u]
-                    # Tests if the edge exists in between the supervertices.
-                    if(coarsed_graph[v_successor, u_successor] != 0):
-                        original_predicted_edges[(v, u)] = coarsed_graph[v_successor, u_successor]
-                    # Tests if the edge exists in between the supervertices.
-                    elif (coarsed_graph[u_successor, v_successor] != 0):
-                        original_predicted_edges[(v, u)] = coarsed_graph[u_successor, v_successor]
-                    # Tests if the vertices are in the same supervertex.
-                    elif(v_successor == u_successor):
-                        original_predicted_edges[(v, u)] = 1
-                    # Tests if there is an edge between the supervertices.
-                    elif((v_successor, u_successor) in coarsed_predicted_edges):
-                        original_predicted_edges[(v, u)] = coarsed_predicted_edges[(v_successor, u_successor)]
-                    # Tests if there is an edge between the supervertices.
-                    elif((u_successor, v_successor) in coarsed_predicted_edges):
-                        original_predicted_edges[(v, u)] = coarsed_predicted_edges[(u_successor, v_successor)]
+        for sources, targets, values in self.projection_blocks(original_graph, coarsed_graph, coarsed_predicted_edges):
+            original_predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), values.tolist()))
         return original_predicted_edges
 
     # Method that receives a coarsed graph and the predicted links generated by this graph and generate
@@ -47,28 +106,8 @@ class MultilevelLinkPredictor():
     # the coarsed graph (in any level) and the coarsed predicted edges (generated by a link prediction
     # algorithm in the coarsed graph). ER - Edge Replication.
     def predict_by_edge_replication_to_file(self, original_graph, coarsed_graph, coarsed_predicted_edges, io_handler):
-        original_predicted_edges = {}
-        for v in range(original_graph.vcount()):
-            for u in range((v + 1), original_graph.vcount()):
-                # Tests if the edge doesn't exists in the original graph. (The edge must be predicted)
-                if(original_graph[v, u] == 0):
-                    v_successor = coarsed_graph['successors'][v]
-                    u_successor = coarsed_graph['successors'][u]
-                    # Tests if the edge exists in between the supervertices.
-                    if(coarsed_graph[v_successor, u_successor] != 0):
-                        io_handler.write_predicted_edge((v, u), str(coarsed_graph[v_successor, u_successor]))
-                    # Tests if the edge exists in between the supervertices.
-                    elif (coarsed_graph[u_successor, v_successor] != 0):
-                        io_handler.write_predicted_edge((v, u), str(coarsed_graph[u_successor, v_successor]))
-                    # Tests if the vertices are in the same supervertex.
-                    elif(v_successor == u_successor):
-                        io_handler.write_predicted_edge((v, u), str(1))
-                    # Tests if there is an edge between the supervertices.
-                    elif((v_successor, u_successor) in coarsed_predicted_edges):
-                        io_handler.write_predicted_edge((v, u), str(coarsed_predicted_edges[(v_successor, u_successor)]))
-                    # Tests if there is an edge between the supervertices.
-                    elif((u_successor, v_successor) in coarsed_predicted_edges):
-                        io_handler.write_predicted_edge((v, u), str(coarsed_predicted_edges[(u_successor, v_successor)]))
+        for sources, targets, values in self.projection_blocks(original_graph, coarsed_graph, coarsed_predicted_edges):
+            io_handler.write_predicted_edges_block(sources, targets, values)
 
     # Method that receives a coarsed graph and the predicted links generated by this graph and generate
     # the predicted links for the original graph (level 0) by replicating the predicted edges for all
@@ -76,34 +115,8 @@ class MultilevelLinkPredictor():
     # that are inside the supervertex. WER - Weighted Edge Replication.
     def predict_by_weighted_edge_replication(self, original_graph, coarsed_graph, coarsed_predicted_edges):
         original_predicted_edges = {}
-        # Calculates the sizes of the super-vertices of the network.
-        super_vertices_sizes = {}
-        for super_vertice in coarsed_graph['successors']:
-            if(super_vertice in super_vertices_sizes):
-                super_vertices_sizes[super_vertice] += 1
-            else:
-                super_vertices_sizes[super_vertice] = 1
-        for v in range(original_graph.vcount()):
-            for u in range((v + 1), original_graph.vcount()):
-                # Tests if the edge doesn't exists in the original graph. (The edge must be predicted)
-                if(original_graph[v, u] == 0):
-                    v_successor = coarsed_graph['successors'][v]
-                    u_successor = coarsed_graph['successors'][u]
-                    # Tests if the edge exists in between the supervertices.
-                    if(coarsed_graph[v_successor, u_successor] != 0):
-                        original_predicted_edges[(v, u)] = (coarsed_graph[v_successor, u_successor] / (super_vertices_sizes[v_successor] * super_vertices_sizes[u_successor]))
-                    # Tests if the edge exists in between the supervertices.
-                    elif (coarsed_graph[u_successor, v_successor] != 0):
-                        original_predicted_edges[(v, u)] = (coarsed_graph[u_successor, v_successor] / (super_vertices_sizes[v_successor] * super_vertices_sizes[u_successor]))
-                    # Tests if the vertices are in the same supervertex.
-                    elif(v_successor == u_successor):
-                        original_predicted_edges[(v, u)] = (1 / super_vertices_sizes[v_successor])
-                    # Tests if there is an edge between the supervertices.
-                    elif((v_successor, u_successor) in coarsed_predicted_edges):
-                        original_predicted_edges[(v, u)] = coarsed_predicted_edges[(v_successor, u_successor)]
-                    # Tests if there is an edge between the supervertices.
-                    elif((u_successor, v_successor) in coarsed_predicted_edges):
-                        original_predicted_edges[(v, u)] = coarsed_predicted_edges[(u_successor, v_successor)]
+        for sources, targets, values in self.projection_blocks(original_graph, coarsed_graph, coarsed_predicted_edges, weighted=True):
+            original_predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), values.tolist()))
         return original_predicted_edges
 
 
@@ -112,47 +125,224 @@ class MultilevelLinkPredictor():
     # the vertices inside a supervertex. Differently from the method above, this method weights the edges
     # that are inside the supervertex. WER - Weighted Edge Replication.
     def predict_by_weighted_edge_replication_to_file(self, original_graph, coarsed_graph, coarsed_predicted_edges, io_handler):
+        for sources, targets, values in self.projection_blocks(original_graph, coarsed_graph, coarsed_predicted_edges, weighted=True):
+            io_handler.write_predicted_edges_block(sources, targets, values)
+
+    # Method that projects the coarsed predicted edges to the original graph level by level (V-cycle), keeping only the
+    # budget best pairs at each level. Receives the graphs of the levels (the original graph and the coarsed ones),
+    # the coarsed predicted edges of the coarsest graph, the similarity and the budget. UC - Uncoarsening.
+    def predict_by_uncoarsening(self, level_graphs, coarsed_predicted_edges, similarity, budget):
         original_predicted_edges = {}
-        # Calculates the sizes of the super-vertices of the network.
-        super_vertices_sizes = {}
-        for super_vertice in coarsed_graph['successors']:
-            if (super_vertice in super_vertices_sizes):
-                super_vertices_sizes[super_vertice] += 1
-            else:
-                super_vertices_sizes[super_vertice] = 1
-        for v in range(original_graph.vcount()):
-            for u in range((v + 1), original_graph.vcount()):
-                # Tests if the edge doesn't exists in the original graph. (The edge must be predicted)
-                if (original_graph[v, u] == 0):
-                    v_successor = coarsed_graph['successors'][v]
-                    u_successor = coarsed_graph['successors'][u]
-                    # Tests if the edge exists in between the supervertices.
-                    if (coarsed_graph[v_successor, u_successor] != 0):
-                        io_handler.write_predicted_edge((v, u), str((coarsed_graph[v_successor, u_successor] / (
-                        super_vertices_sizes[v_successor] * super_vertices_sizes[u_successor]))))
-                    # Tests if the edge exists in between the supervertices.
-                    elif (coarsed_graph[u_successor, v_successor] != 0):
-                        io_handler.write_predicted_edge((v, u), str((coarsed_graph[u_successor, v_successor] / (
-                        super_vertices_sizes[v_successor] * super_vertices_sizes[u_successor]))))
-                    # Tests if the vertices are in the same supervertex.
-                    elif (v_successor == u_successor):
-                        io_handler.write_predicted_edge((v, u), str((1 / super_vertices_sizes[v_successor])))
-
-                    # Tests if there is an edge between the supervertices.
-                    elif ((v_successor, u_successor) in coarsed_predicted_edges):
-                        io_handler.write_predicted_edge((v, u), str(coarsed_predicted_edges[(v_successor, u_successor)]))
-
-                    # Tests if there is an edge between the supervertices.
-                    elif ((u_successor, v_successor) in coarsed_predicted_edges):
-                        io_handler.write_predicted_edge((v, u), str(coarsed_predicted_edges[(u_successor, v_successor)]))
-
-
-    # Method that predicts edges for each subgraph generated by supervertices.
-    def predict_inside_super_vertex(self, coarsed_graph, similarity):
+        sources, targets, values = self.uncoarsening_pairs(level_graphs, coarsed_predicted_edges, similarity, budget)
+        original_predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), values.tolist()))
+        return original_predicted_edges
+
+    # Method that projects the coarsed predicted edges to the original graph level by level (V-cycle), like the method
+    # above, and writes them in an output (an IOHandler or a TopKRanking). UC - Uncoarsening.
+    def predict_by_uncoarsening_to_file(self, level_graphs, coarsed_predicted_edges, similarity, budget, io_handler):
+        io_handler.write_predicted_edges_block(*self.uncoarsening_pairs(level_graphs, coarsed_predicted_edges, similarity, budget))
+
+    # Method that returns the version of a multilevel predictor that writes the predicted edges in an output (an
+    # IOHandler or a TopKRanking) instead of returning them.
+    def to_file(self, predictor):
+        if(predictor.__name__.endswith('_to_file')):
+            return predictor
+        return getattr(self, predictor.__name__ + '_to_file')
+
+    ############################
+    #        Projection        #
+    ############################
+
+    # Method that groups the original vertices by super-vertex. Returns the original vertices sorted by super-vertex,
+    # the offset of each super-vertex in this order and the sizes of the super-vertices, kept by the hierarchy of the
+    # coarsed graph as its levels are added.
+    def super_vertices_blocks(self, coarsed_graph):
+        return Hierarchy.get(coarsed_graph).blocks()
+
+    # Method that lists the pairs of super-vertices that generate original predicted edges and their values. A pair of
+    # super-vertices is projected with the weight of the coarsed edge between them, if it exists, with 1 if both
+    # are the same super-vertex or with the predicted value of the coarsed pair. The weighted version divides the
+    # weights of the coarsed edges by the number of original pairs and uses 1 / size inside a super-vertex.
+    def super_vertices_pairs(self, coarsed_graph, coarsed_predicted_edges, sizes, weighted=False):
+        coarsed_edge_index = EdgeIndex.get(coarsed_graph)
+        # Pairs between super-vertices connected by coarsed edges.
+        edge_sources, edge_targets, edge_values = coarsed_edge_index.edges()
+        if(weighted):
+            edge_values = edge_values / (sizes[edge_sources] * sizes[edge_targets])
+        # Pairs inside the super-vertices that have more than one original vertex. With a refinement, they are scored
+        # by the refinement instead.
+        inside = np.flatnonzero(sizes > 1) if self.refinement_similarity is None else np.zeros(0, dtype=np.int64)
+        inside_values = (1 / sizes[inside]) if weighted else np.ones(len(inside))
+        # Pairs between super-vertices that were predicted and are not coarsed edges.
+        predicted = np.array(coarsed_predicted_edges.keys(), dtype=np.int64).reshape(-1, 2)
+        predicted_values = np.array(coarsed_predicted_edges.values(), dtype=np.float64)
+        predicted_sources = np.minimum(predicted[:, 0], predicted[:, 1])
+        predicted_targets = np.maximum(predicted[:, 0], predicted[:, 1])
+        mask = (predicted_sources != predicted_targets) & ~coarsed_edge_index.contains_pairs(predicted_sources, predicted_targets)
+        _, first = np.unique(coarsed_edge_index.keys_of(predicted_sources[mask], predicted_targets[mask]), return_index=True)
+        return (np.concatenate((edge_sources, inside, predicted_sources[mask][first])),
+                np.concatenate((edge_targets, inside, predicted_targets[mask][first])),
+                np.concatenate((edge_values, inside_values, predicted_values[mask][first])))
+
+    # Method that projects the coarsed predicted edges to the original graph (level 0). The pairs of super-vertices
+    # that carry a value are expanded into the blocks of their original vertices, so the complexity is proportional
+    # to the number of projected pairs instead of V^2. Yields blocks of arrays: sources, targets and values of the
+    # original pairs (v, u), v < u, that are not original edges.
+    def projection_blocks(self, original_graph, coarsed_graph, coarsed_predicted_edges, weighted=False):
+        original_edge_index = EdgeIndex.get(original_graph)
+        order, offsets, sizes = self.super_vertices_blocks(coarsed_graph)
+        super_sources, super_targets, super_values = self.super_vertices_pairs(coarsed_graph, coarsed_predicted_edges, sizes, weighted)
+        # Number of original pairs generated by each pair of super-vertices.
+        counts = sizes[super_sources] * sizes[super_targets]
+        ends = np.cumsum(counts)
+        start = 0
+        while(start < len(counts)):
+            # The pairs of super-vertices are expanded in chunks of about chunk_size original pairs.
+            end = max(start + 1, np.searchsorted(ends, ends[start] - counts[start] + self.chunk_size, side='right'))
+            chunk_counts = counts[start:end]
+            pairs = np.repeat(np.arange(start, end), chunk_counts)
+            positions = np.arange(len(pairs)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            target_sizes = sizes[super_targets[pairs]]
+            sources = order[offsets[super_sources[pairs]] + positions // target_sizes]
+            targets = order[offsets[super_targets[pairs]] + positions % target_sizes]
+            # Inside a super-vertex each pair is generated twice, so only the pairs with source < target are kept.
+            mask = (super_sources[pairs] != super_targets[pairs]) | (sources < targets)
+            sources, targets = np.minimum(sources[mask], targets[mask]), np.maximum(sources[mask], targets[mask])
+            values = super_values[pairs[mask]]
+            # The pairs that are edges of the original graph are not predicted.
+            mask = ~original_edge_index.contains_pairs(sources, targets)
+            yield sources[mask], targets[mask], values[mask]
+            start = end
+        if(self.refinement_similarity is not None):
+            for block in self.inside_blocks(original_graph, coarsed_graph, self.refinement_similarity, self.refinement_workers):
+                yield block
+
+
+    ############################
+    #       Uncoarsening       #
+    ############################
+
+    # Method that uncoarses the coarsed predicted edges. The candidates of the coarsest level are its pairs of
+    # super-vertices (like in the projection: the coarsed edges with their weights, the pairs inside the super-vertices
+    # with 1 and the predicted pairs with their values). At each finer level, the budget best candidates are expanded to
+    # the pairs of their children, which are scored again on the graph of the level: the edges by their weights, the
+    # pairs inside a vertex by 1 and the other pairs by the similarity. The cost of each level is bounded by the budget
+    # (times the children of the pairs), instead of the pairs of the original graph. Returns the sources, targets and
+    # scores of the budget best original pairs (v, u), v < u, that are not original edges.
+    def uncoarsening_pairs(self, level_graphs, coarsed_predicted_edges, similarity, budget):
+        graphs = dict((graph['level'], graph) for graph in level_graphs)
+        coarsed_graph = graphs[max(graphs)]
+        hierarchy = Hierarchy.get(coarsed_graph)
+        # The levels of the hierarchy that have a graph, from the coarsest to the original one.
+        levels = [level for level in reversed(hierarchy.levels) if level in graphs]
+        sizes = hierarchy.sizes[hierarchy.index(levels[0])]
+        edge_sources, edge_targets, edge_values = EdgeIndex.get(coarsed_graph).edges()
+        inside = np.flatnonzero(sizes > 1)
+        predicted = np.array(coarsed_predicted_edges.keys(), dtype=np.int64).reshape(-1, 2)
+        predicted_sources = np.minimum(predicted[:, 0], predicted[:, 1])
+        predicted_targets = np.maximum(predicted[:, 0], predicted[:, 1])
+        mask = (predicted_sources != predicted_targets) & ~EdgeIndex.get(coarsed_graph).contains_pairs(predicted_sources, predicted_targets)
+        sources = np.concatenate((edge_sources, inside, predicted_sources[mask]))
+        targets = np.concatenate((edge_targets, inside, predicted_targets[mask]))
+        values = np.concatenate((edge_values, np.ones(len(inside)), np.array(coarsed_predicted_edges.values(), dtype=np.float64)[mask]))
+        if(levels[0] == 0):
+            mask = sources != targets
+            sources, targets, values = sources[mask], targets[mask], values[mask]
+        sources, targets, values = self.best_pairs(sources, targets, values, budget)
+        for upper_level, lower_level in izip(levels[:-1], levels[1:]):
+            sources, targets = self.children_pairs(hierarchy.parents(upper_level, lower_level), sources, targets)
+            lower_sizes = hierarchy.sizes[hierarchy.index(lower_level)]
+            # A pair inside a vertex is a candidate only if the vertex has more than one original vertex.
+            mask = (sources != targets) | (lower_sizes[sources] > 1)
+            sources, targets = sources[mask], targets[mask]
+            values = self.rescore_pairs(graphs[lower_level], similarity, sources, targets, lower_level == 0)
+            if(lower_level == 0):
+                # The original edges are not predicted.
+                mask = ~EdgeIndex.get(graphs[0]).contains_pairs(sources, targets)
+                sources, targets, values = sources[mask], targets[mask], values[mask]
+            sources, targets, values = self.best_pairs(sources, targets, values, budget)
+        return sources, targets, values
+
+    # Method that keeps the budget pairs with the highest values.
+    def best_pairs(self, sources, targets, values, budget):
+        if(len(values) > budget):
+            best = np.argpartition(-values, budget)[:budget]
+            return sources[best], targets[best], values[best]
+        return sources, targets, values
+
+    # Method that expands the pairs of vertices of an upper level to the pairs (v, u), v <= u, of their children in
+    # the lower level, given the parent of each vertex of the lower level.
+    def children_pairs(self, parents, sources, targets):
+        order = np.argsort(parents, kind='mergesort')
+        counts = np.bincount(parents)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        pair_counts = counts[sources] * counts[targets]
+        pairs = np.repeat(np.arange(len(sources)), pair_counts)
+        positions = np.arange(len(pairs)) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+        target_counts = counts[targets[pairs]]
+        children_sources = order[offsets[sources[pairs]] + positions // target_counts]
+        children_targets = order[offsets[targets[pairs]] + positions % target_counts]
+        # The pairs of the children of the same vertex are generated twice, so only one of them is kept.
+        mask = (sources[pairs] != targets[pairs]) | (children_sources <= children_targets)
+        return np.minimum(children_sources[mask], children_targets[mask]), np.maximum(children_sources[mask], children_targets[mask])
+
+    # Method that scores the candidate pairs of a level: the edges by their weights, the pairs inside a vertex by 1 and
+    # the other pairs by the similarity on the graph of the level. In the original level the edges aren't scored.
+    def rescore_pairs(self, graph, similarity, sources, targets, original):
+        values = np.ones(len(sources))
+        edge_index = EdgeIndex.get(graph)
+        edges = edge_index.contains_pairs(sources, targets)
+        if(not original):
+            values[edges] = edge_index.weights_of(sources[edges], targets[edges])
+        scored = (sources != targets) & ~edges
+        if(scored.any()):
+            values[scored] = pair_scores(graph, similarity, sources[scored], targets[scored])
+        return values
+
+    ############################
+    #        Refinement        #
+    ############################
+
+    # Method that predicts the edges inside each super-vertex by the similarity calculated on the subgraph induced by
+    # the super-vertex. Returns a dict with the scores of the original pairs (v, u), v < u, that are not edges.
+    def predict_inside_super_vertex(self, original_graph, coarsed_graph, similarity, workers=1):
         predicted_edges = {}
-        # Tests if the graph has any super-vertex.
-        if(coarsed_graph['level'] != 0):
-            print coarsed_graph['successors']
-            return predicted_edges
-        else:
-            print "graph has no super-vertices."
+        for sources, targets, scores in self.inside_blocks(original_graph, coarsed_graph, similarity, workers):
+            predicted_edges.update(izip(izip(sources.tolist(), targets.tolist()), scores.tolist()))
+        return predicted_edges
+
+    # Method that yields the scores of the pairs inside the super-vertices in blocks of arrays: sources, targets and
+    # scores. The super-vertices are grouped in tasks of about the same number of pairs, scored by worker processes. The
+    # blocks are yielded in the order of the tasks, so the ranking doesn't depend on the number of workers.
+    def inside_blocks(self, original_graph, coarsed_graph, similarity, workers=1):
+        global refinement_graph
+        order, offsets, sizes = self.super_vertices_blocks(coarsed_graph)
+        super_vertices = np.flatnonzero(sizes > 1)
+        if(len(super_vertices) == 0):
+            return
+        ends = np.cumsum(sizes[super_vertices] * (sizes[super_vertices] - 1) // 2)
+        # Each worker receives a few tasks, so the slower tasks are balanced by the other ones.
+        task_pairs = max(1, min(self.chunk_size, ends[-1] // (4 * workers)))
+        bounds = np.unique(np.concatenate(([0], np.searchsorted(ends, np.arange(task_pairs, ends[-1], task_pairs), side='right'), [len(super_vertices)])))
+        # Seed of the random indices of the refinement, drawn once so it doesn't depend on the tasks.
+        seed = np.random.randint(0, (2 ** 31) - 1)
+        tasks = []
+        for first, last in izip(bounds[:-1], bounds[1:]):
+            task_sizes = sizes[super_vertices[first:last]]
+            positions = np.arange(task_sizes.sum()) - np.repeat(np.cumsum(task_sizes) - task_sizes, task_sizes)
+            vertices = order[np.repeat(offsets[super_vertices[first:last]], task_sizes) + positions]
+            tasks.append((similarity.__name__, vertices, np.repeat(np.arange(last - first), task_sizes), seed))
+        # The daemonic processes (like the fold workers) can't have children, so they score sequentially.
+        if(workers <= 1 or len(tasks) <= 1 or multiprocessing.current_process().daemon):
+            for similarity_name, vertices, labels, seed in tasks:
+                yield score_inside_pairs(original_graph, similarity, vertices, labels, seed)
+            return
+        refinement_graph = original_graph
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            for block in pool.imap(score_super_vertices, tasks):
+                yield block
+        finally:
+            pool.close()
+            pool.join()
+            refinement_graph = None
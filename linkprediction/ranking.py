@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from itertools import izip
+import numpy as np
+
+# Class that accumulates a stream of predicted edges keeping only the K best scored pairs, instead of the whole
+# ranking. It also keeps the summary statistics needed for the AUC calculation: the scores of the probe edges and a
+# histogram of the scores of the non-probe pairs, bounded to max_values bins. The ranking has the same writing methods of the IOHandler, so the
+# predictors that write to a file can feed it directly.
+class TopKRanking():
+
+    def __init__(self, k, edges_probe_set=None, total_pairs=None, decimals=None, max_values=2 ** 16, buffer_size=2 ** 16):
+        # Number of best scored pairs that are kept.
+        self.k = k
+        # Number of decimals of the scores in the summary statistics. If it is None, the scores are not rounded.
+        self.decimals = decimals
+        # Maximum number of bins of the histogram of the non-probe scores. The distinct scores are exact while they fit
+        # in it, then the neighbor scores with few pairs are merged in bins of about the same number of pairs.
+        self.max_values = max_values
+        # Sorted keys (source << 32 | target, source < target) of the probe edges.
+        probe = np.array(list(edges_probe_set or []), dtype=np.int64).reshape(-1, 2)
+        self.probe_keys = np.unique(self.keys_of(probe[:, 0], probe[:, 1]))
+        # Number of pairs that could be predicted. The pairs that are not fed are an implicit tail of zero scores. If
+        # it is None, only the fed pairs are considered.
+        self.total_pairs = total_pairs
+        # Number of fed pairs.
+        self.n_pairs = 0
+        # The K best scored pairs (not sorted).
+        self.sources = np.empty(0, dtype=np.int64)
+        self.targets = np.empty(0, dtype=np.int64)
+        self.scores = np.empty(0, dtype=np.float64)
+        # Scores of the fed probe edges.
+        self.probe_scores = []
+        # Runs of distinct scores of the fed non-probe pairs and the number of pairs with each score, one for each block.
+        # They are merged when they hold more than 4 * max_values scores or when the distribution is requested.
+        self.value_runs = []
+        self.count_runs = []
+        self.n_run_values = 0
+        # Buffer of the pairs written one by one.
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.sorted_top = None
+
+    # Method that calculates the keys of the pairs (sources[k], targets[k]).
+    def keys_of(self, sources, targets):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        return (np.minimum(sources, targets) << 32) | np.maximum(sources, targets)
+
+    # Method that adds a block of scored pairs to the ranking.
+    def add_block(self, sources, targets, scores):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+        self.n_pairs += len(scores)
+        self.sorted_top = None
+        # Splits the probe edges from the other pairs.
+        is_probe = np.in1d(self.keys_of(sources, targets), self.probe_keys)
+        summary_scores = scores if self.decimals is None else np.round(scores, self.decimals)
+        self.probe_scores.append(summary_scores[is_probe])
+        values, counts = np.unique(summary_scores[~is_probe], return_counts=True)
+        self.value_runs.append(values)
+        self.count_runs.append(counts)
+        self.n_run_values += len(values)
+        if(self.n_run_values > 4 * self.max_values):
+            self.merge_runs()
+        # Keeps the K best scored pairs. The selection is only done when the candidates are twice K.
+        self.sources = np.concatenate((self.sources, sources))
+        self.targets = np.concatenate((self.targets, targets))
+        self.scores = np.concatenate((self.scores, scores))
+        if(len(self.scores) > 2 * self.k):
+            self.select()
+
+    # Method that merges the runs of non-probe scores in a single histogram of up to about max_values bins. The scores
+    # with at least total / max_values pairs keep their own bins (like the zeros), the others are merged with their
+    # neighbors in bins of about total / max_values pairs, represented by their mean score.
+    def merge_runs(self):
+        values, inverse = np.unique(np.concatenate([np.empty(0)] + self.value_runs), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([np.empty(0)] + self.count_runs)).astype(np.int64)
+        if(len(values) > self.max_values):
+            total = counts.sum()
+            heavy = counts * self.max_values >= total
+            bins = (np.cumsum(counts) - counts) * self.max_values // total
+            starts = np.concatenate(([True], (bins[1:] != bins[:-1]) | heavy[1:] | heavy[:-1]))
+            groups = np.cumsum(starts) - 1
+            merged_counts = np.bincount(groups, weights=counts).astype(np.int64)
+            merged_values = np.bincount(groups, weights=values * counts) / merged_counts
+            # The heavy scores are kept exactly, so their ties are not changed by the rounding of the mean.
+            merged_values[groups[heavy]] = values[heavy]
+            values, counts = merged_values, merged_counts
+        self.value_runs, self.count_runs, self.n_run_values = [values], [counts], len(values)
+
+    # Method that keeps only the K best scored pairs. Complexity = O(n)
+    def select(self):
+        if(len(self.scores) > self.k):
+            best = np.argpartition(-self.scores, self.k - 1)[:self.k] if self.k else np.empty(0, dtype=np.int64)
+            self.sources, self.targets, self.scores = self.sources[best], self.targets[best], self.scores[best]
+
+    # Method that adds a dict of predicted edges to the ranking.
+    def add_predicted_edges(self, predicted_edges):
+        edges = np.array(predicted_edges.keys(), dtype=np.int64).reshape(-1, 2)
+        self.add_block(edges[:, 0], edges[:, 1], np.array(predicted_edges.values(), dtype=np.float64))
+
+    # Methods that writes a block of predicted edges in the ranking. (Same interface of the IOHandler)
+    def write_predicted_edges_block(self, sources, targets, weights):
+        self.flush()
+        self.add_block(sources, targets, weights)
+
+    # Methods that writes one predicted edge in the ranking. (Same interface of the IOHandler)
+    def write_predicted_edge(self, predicted_edge, weight):
+        self.buffer.append((predicted_edge[0], predicted_edge[1], float(weight)))
+        if(len(self.buffer) >= self.buffer_size):
+            self.flush()
+
+    # Method that adds the buffered pairs to the ranking.
+    def flush(self):
+        if(self.buffer):
+            sources, targets, scores = izip(*self.buffer)
+            self.buffer = []
+            self.add_block(sources, targets, scores)
+
+    # Method that returns the K best scored pairs sorted by score (descending) as four arrays: sources, targets,
+    # scores and a boolean array that tells which pairs are probe edges.
+    def top(self):
+        self.flush()
+        if(self.sorted_top is None):
+            self.select()
+            order = np.argsort(-self.scores, kind='mergesort')
+            sources, targets, scores = self.sources[order], self.targets[order], self.scores[order]
+            self.sorted_top = (sources, targets, scores, np.in1d(self.keys_of(sources, targets), self.probe_keys))
+        return self.sorted_top
+
+    # Method that returns the scores of all probe edges. The probe edges that were not fed have a zero score.
+    def probe_values(self):
+        self.flush()
+        values = np.concatenate([np.empty(0)] + self.probe_scores)
+        return np.concatenate((values, np.zeros(max(0, len(self.probe_keys) - len(values)))))
+
+    # Method that returns the scores (or the mean scores of the merged bins) of the non-probe pairs and the number of
+    # pairs with each score, including the implicit tail of zero scores.
+    def non_probe_distribution(self):
+        self.flush()
+        self.merge_runs()
+        values, counts = self.value_runs[0], self.count_runs[0]
+        if(self.total_pairs is not None and self.total_pairs > self.n_pairs):
+            # The probe edges that were not fed are part of the tail, but they are not non-probe pairs.
+            tail = (self.total_pairs - self.n_pairs) - (len(self.probe_keys) - sum(map(len, self.probe_scores)))
+            values, inverse = np.unique(np.concatenate((values, [0.0])), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate((counts, [max(tail, 0)]))).astype(np.int64)
+        return values, counts
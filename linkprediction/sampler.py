@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import random
+from loader.edge_index import EdgeIndex
 
 # Class that creates samples, removes samples from the network, re-adds the samples of edges in the network for saving memory.
 
@@ -12,22 +13,23 @@ class Sampler():
     # Method that removes the edges in the probe list from the graph. The edge list must be a dictionary which the key is a edge
     # and the value is the weight.
     def delete_edges(self, graph, edges_probe_list):
-        graph.delete_edges(edges_probe_list.keys())
+        EdgeIndex.get(graph).delete_edges(graph, edges_probe_list.keys())
 
     # Method that re-adds the edges in the probe list to the graph. The edge list must be a dictionary which the key is a edge
     # and the value is the weight.
     def readd_edges(self, graph, edges_probe_list):
-        for edge in edges_probe_list:
-            graph[edge[0], edge[1]] = edges_probe_list[edge]
+        edges = edges_probe_list.keys()
+        EdgeIndex.get(graph).add_edges(graph, edges, [edges_probe_list[edge] for edge in edges])
 
     # Method that creates the edge probe list from graph according to the proportion.
     def create_random_edges_probe_list(self, graph, proportion):
         edges_probe_list = {}
+        edge_index = EdgeIndex.get(graph)
         # Creates a sample according to the proportion size.
         sample = random.sample(graph.get_edgelist(), int(len(graph.get_edgelist()) * proportion))
         # The edges are added to the probe list with their weights.
         for edge in sample:
-            weight = graph[edge[0], edge[1]]
+            weight = edge_index.weight(edge[0], edge[1])
             edges_probe_list[edge] = weight
         return edges_probe_list
 
@@ -35,12 +37,13 @@ class Sampler():
     # because it can be shuffled before the function call, generating a random sorted list of edges.
     def create_k_edges_probe_list(self, graph, edgelist, i, k):
         edges_probe_list = {}
+        edge_index = EdgeIndex.get(graph)
         from_i = i * (graph.ecount() / k)
         to_i = from_i + ((graph.ecount() / k))
         # The i partition of the edge is recovered.
         sample = edgelist[from_i: to_i]
         # The edges are added to the probe list with their weights.
         for edge in sample:
-            weight = graph[edge[0], edge[1]]
+            weight = edge_index.weight(edge[0], edge[1])
             edges_probe_list[edge] = weight
         return edges_probe_list
\ No newline at end of file
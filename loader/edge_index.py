@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import itertools
+import numpy as np
+import scipy.sparse
+
+# Counter that identifies each state of an edge index. It changes every time the indexed edges change.
+serials = itertools.count()
+
+# Class that indexes the edges of a graph by packed 64-bit keys (source << 32 | target) for O(1) edge existence and
+# weight queries, instead of the igraph graph[v, u] lookup. The keys are stored in a sorted numpy array for vectorized
+# queries and in a dict for single queries. The index is stored in the 'edge_index' attribute of the graph.
+class EdgeIndex():
+
+    def __init__(self, graph):
+        self.directed = graph.is_directed()
+        self.vcount = graph.vcount()
+        self.ecount = graph.ecount()
+        self.graph_id = id(graph)
+        edges = np.fromiter(itertools.chain.from_iterable(graph.get_edgelist()), dtype=np.int64, count=(2 * self.ecount)).reshape(-1, 2)
+        if('weight' in graph.es.attributes()):
+            weights = np.array(graph.es['weight'], dtype=np.float64)
+        else:
+            weights = np.ones(len(edges))
+        # Dict that maps each key to the weight of the edge. Like graph[v, u], multiple edges keep the last weight.
+        self.weights_by_key = dict(itertools.izip(self.keys_of(edges[:, 0], edges[:, 1]).tolist(), weights.tolist()))
+        self.update_arrays()
+
+    # Method that recovers the edge index of a graph. The index is created if the graph doesn't have one or if the
+    # index belongs to other graph (igraph copies the attributes in graph.copy() and graph.subgraph()).
+    @staticmethod
+    def get(graph):
+        if('edge_index' in graph.attributes()):
+            edge_index = graph['edge_index']
+            if(edge_index.graph_id == id(graph) and edge_index.vcount == graph.vcount() and edge_index.ecount == graph.ecount()):
+                return edge_index
+        graph['edge_index'] = EdgeIndex(graph)
+        return graph['edge_index']
+
+    # Method that updates the sorted arrays of keys and weights from the dict of keys.
+    def update_arrays(self):
+        keys = np.fromiter(self.weights_by_key.iterkeys(), dtype=np.int64, count=len(self.weights_by_key))
+        weights = np.fromiter(self.weights_by_key.itervalues(), dtype=np.float64, count=len(self.weights_by_key))
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.weights = weights[order]
+        self.serial = next(serials)
+
+    # Method that calculates the key of a pair of vertices. For undirected graphs the key of (v, u) and (u, v) is the same.
+    def key(self, v, u):
+        if(not self.directed and v > u):
+            v, u = u, v
+        return (v << 32) | u
+
+    # Method that calculates the keys of the pairs (sources[k], targets[k]).
+    def keys_of(self, sources, targets):
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if(not self.directed):
+            sources, targets = np.minimum(sources, targets), np.maximum(sources, targets)
+        return (sources << 32) | targets
+
+    # Method that tests if the edge (v, u) exists. Complexity = O(1)
+    def contains(self, v, u):
+        return self.key(v, u) in self.weights_by_key
+
+    # Method that returns the weight of the edge (v, u) or 0 if the edge doesn't exist, like graph[v, u].
+    def weight(self, v, u):
+        return self.weights_by_key.get(self.key(v, u), 0)
+
+    # Method that returns a boolean array that tells which pairs (sources[k], targets[k]) are edges.
+    def contains_pairs(self, sources, targets):
+        keys = self.keys_of(sources, targets)
+        positions = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        return (self.keys[positions] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+
+    # Method that returns the weights of the pairs (sources[k], targets[k]), 0 for the pairs that aren't edges.
+    def weights_of(self, sources, targets):
+        keys = self.keys_of(sources, targets)
+        if(not len(self.keys)):
+            return np.zeros(len(keys))
+        positions = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[positions] == keys, self.weights[positions], 0)
+
+    # Method that returns the indexed edges as three arrays: sources, targets and weights.
+    def edges(self):
+        return (self.keys >> 32), (self.keys & 0xFFFFFFFF), self.weights
+
+    # Method that builds the sparse adjacency matrix (CSR) of the indexed edges. The matrix is symmetric for undirected
+    # graphs and its values are the edge weights or 1 if the matrix is not weighted.
+    def adjacency(self, weighted=False):
+        sources, targets, weights = self.edges()
+        if(not weighted):
+            weights = np.ones(len(weights))
+        if(not self.directed):
+            sources, targets = np.concatenate((sources, targets)), np.concatenate((targets, sources))
+            weights = np.concatenate((weights, weights))
+        return scipy.sparse.csr_matrix((weights, (sources, targets)), shape=(self.vcount, self.vcount))
+
+    # Method that deletes a list of edges from the graph and from the index.
+    def delete_edges(self, graph, edges):
+        graph.delete_edges(edges)
+        for edge in edges:
+            self.weights_by_key.pop(self.key(edge[0], edge[1]), None)
+        self.ecount = graph.ecount()
+        self.update_arrays()
+
+    # Method that adds a list of edges with their weights to the graph and to the index.
+    def add_edges(self, graph, edges, weights):
+        graph.add_edges(edges)
+        if('weight' in graph.es.attributes()):
+            graph.es[(graph.ecount() - len(edges)):]['weight'] = weights
+        for edge, weight in itertools.izip(edges, weights):
+            self.weights_by_key[self.key(edge[0], edge[1])] = weight
+        self.ecount = graph.ecount()
+        self.update_arrays()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+from tempfile import gettempdir, mkdtemp, mkstemp
+import numpy as np
+
+# Class that shuffles ranking files larger than the memory. The records (binary files) or lines (text files) are read
+# in blocks and scattered to random buckets on disk, then each bucket is permuted in memory and the buckets are
+# concatenated. Each record goes to a uniform random bucket and each bucket is uniformly permuted, so every order of
+# the records has the same probability. The random generator is seedable, so a shuffle can be repeated.
+class ExternalShuffler():
+
+    def __init__(self, record_dtype, memory_budget=2 ** 28, tempdirs=None, seed=None):
+        # Fields of the records of the binary files.
+        self.record_dtype = np.dtype(record_dtype)
+        # Memory (in bytes) used by a block or a bucket in memory.
+        self.memory_budget = memory_budget
+        self.tempdirs = tempdirs if tempdirs else [gettempdir()]
+        self.random_state = np.random.RandomState(seed)
+
+    # Method that shuffles the ranking file and writes it in the output path (by default, the input file).
+    def shuffle(self, input_path, output_path=None, binary=True):
+        if(output_path is None):
+            output_path = input_path
+        # The text lines take more memory than their size.
+        expansion = 2 if binary else 8
+        block_bytes = max(self.record_dtype.itemsize, self.memory_budget // expansion)
+        n_buckets = max(1, int(np.ceil(os.path.getsize(input_path) / float(block_bytes))))
+        # The buckets are spread over the temporary directories.
+        bucket_directories = [mkdtemp(dir=self.tempdirs[i % len(self.tempdirs)]) for i in range(min(n_buckets, len(self.tempdirs)))]
+        bucket_paths = [os.path.join(bucket_directories[i % len(bucket_directories)], "bucket%d" % i) for i in range(n_buckets)]
+        try:
+            for block in self.read_blocks(input_path, binary, block_bytes):
+                self.scatter(block, bucket_paths, binary)
+            # The output is written in a temporary file, so the input file can be the output file.
+            descriptor, temporary_path = mkstemp(dir=os.path.dirname(os.path.abspath(output_path)))
+            with os.fdopen(descriptor, 'wb') as output_file:
+                for bucket_path in bucket_paths:
+                    if(not os.path.exists(bucket_path)):
+                        continue
+                    if(binary):
+                        bucket = np.fromfile(bucket_path, dtype=self.record_dtype)
+                        bucket[self.random_state.permutation(len(bucket))].tofile(output_file)
+                    else:
+                        with open(bucket_path, 'rb') as bucket_file:
+                            lines = bucket_file.readlines()
+                        output_file.writelines([lines[i] for i in self.random_state.permutation(len(lines))])
+            os.rename(temporary_path, output_path)
+        finally:
+            for bucket_directory in bucket_directories:
+                shutil.rmtree(bucket_directory, ignore_errors=True)
+
+    # Method that yields the blocks of records (binary files) or of lines (text files) of the file.
+    def read_blocks(self, path, binary, block_bytes):
+        if(binary):
+            if(os.path.getsize(path) == 0):
+                return
+            records = np.memmap(path, dtype=self.record_dtype, mode='r')
+            block_size = block_bytes // self.record_dtype.itemsize
+            for start in range(0, len(records), block_size):
+                yield np.array(records[start:(start + block_size)])
+            return
+        with open(path, 'rb') as input_file:
+            while(True):
+                lines = input_file.readlines(block_bytes)
+                if(not lines):
+                    break
+                # The last line of the file may not have the line break.
+                if(not lines[-1].endswith("\n")):
+                    lines[-1] += "\n"
+                yield lines
+
+    # Method that appends each record (or line) of the block to a random bucket.
+    def scatter(self, block, bucket_paths, binary):
+        bucket_ids = self.random_state.randint(len(bucket_paths), size=len(block))
+        if(binary):
+            order = np.argsort(bucket_ids, kind='mergesort')
+            block, bucket_ids = block[order], bucket_ids[order]
+            bounds = np.searchsorted(bucket_ids, np.arange(len(bucket_paths) + 1))
+            for i, bucket_path in enumerate(bucket_paths):
+                if(bounds[i] < bounds[i + 1]):
+                    with open(bucket_path, 'ab') as bucket_file:
+                        block[bounds[i]:bounds[i + 1]].tofile(bucket_file)
+            return
+        buckets = [[] for bucket_path in bucket_paths]
+        for line, bucket_id in zip(block, bucket_ids.tolist()):
+            buckets[bucket_id].append(line)
+        for bucket, bucket_path in zip(buckets, bucket_paths):
+            if(bucket):
+                with open(bucket_path, 'ab') as bucket_file:
+                    bucket_file.writelines(bucket)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import multiprocessing
+from tempfile import gettempdir, mkstemp
+from itertools import cycle, izip
+import numpy as np
+
+# Function that reads a chunk (a range of bytes) of a ranking file, sorts it by the key in descending order and saves
+# it in a temporary .npy file. The binary chunks are saved as records and the text chunks as (key, line) records, so
+# the lines are written back as they were. It is a module function so it can be sent to the worker processes. Returns
+# the path of the sorted chunk.
+def sort_chunk(arguments):
+    path, start, end, record_dtype, key, binary, top, tempdir = arguments
+    with open(path, 'rb') as input_file:
+        input_file.seek(start)
+        data = input_file.read(end - start)
+    if(binary):
+        records = np.frombuffer(data, dtype=record_dtype)
+        keys = records[key]
+    else:
+        lines = [line for line in data.splitlines(True) if line.strip()]
+        records = np.empty(len(lines), dtype=[('key', '<f8'), ('line', np.string_, max([len(line) for line in lines] + [1]))])
+        # Each line has a value for each field of the records, so the keys are a column of the tokens.
+        records['key'] = data.split()[record_dtype.names.index(key)::len(record_dtype.names)]
+        records['line'] = lines
+        keys = records['key']
+    # The sort is stable, so the records with the same key keep the order of the file.
+    order = np.argsort(-keys, kind='mergesort')
+    if(top is not None):
+        order = order[:top]
+    descriptor, chunk_path = mkstemp(suffix='.npy', dir=tempdir)
+    os.close(descriptor)
+    np.save(chunk_path, records[order])
+    return chunk_path
+
+# Class that sorts ranking files larger than the memory by a numeric key (like the score), in descending order. The file
+# is split in chunks that fit in a memory budget, the chunks are sorted in parallel worker processes by numpy.argsort and
+# merged by blocks: each round takes a block of records of each chunk and writes all the records that can't be preceded
+# by a record not read yet. The merge is stable, so the records with the same key keep the order of the file. When only
+# the first records are needed (like the top L of the precision), the chunks and the merge stop after them.
+class ExternalSorter():
+
+    def __init__(self, record_dtype, workers=1, memory_budget=2 ** 28, tempdirs=None):
+        # Fields of the records (binary files) or of the columns (text files).
+        self.record_dtype = np.dtype(record_dtype)
+        # Number of processes that sort the chunks.
+        self.workers = max(1, workers)
+        # Memory (in bytes) used by the chunks that are sorted at the same time and by the blocks of the merge.
+        self.memory_budget = memory_budget
+        self.tempdirs = tempdirs if tempdirs else [gettempdir()]
+
+    # Method that sorts the ranking file by the key and writes it in the output path (by default, the input file). If
+    # top is given, only the first top records are written.
+    def sort(self, input_path, output_path=None, key='score', binary=True, top=None):
+        if(output_path is None):
+            output_path = input_path
+        tasks = [(input_path, start, end, self.record_dtype, key, binary, top, tempdir)
+                 for (start, end), tempdir in izip(self.chunk_ranges(input_path, binary), cycle(self.tempdirs))]
+        chunk_paths = []
+        try:
+            # The daemonic processes (like the fold workers) can't have children, so they sort sequentially.
+            if(self.workers <= 1 or len(tasks) <= 1 or multiprocessing.current_process().daemon):
+                for task in tasks:
+                    chunk_paths.append(sort_chunk(task))
+            else:
+                pool = multiprocessing.Pool(min(self.workers, len(tasks)))
+                try:
+                    for chunk_path in pool.imap(sort_chunk, tasks):
+                        chunk_paths.append(chunk_path)
+                finally:
+                    pool.close()
+                    pool.join()
+            # The output is written in a temporary file, so the input file can be the output file.
+            descriptor, temporary_path = mkstemp(dir=os.path.dirname(os.path.abspath(output_path)))
+            with os.fdopen(descriptor, 'wb') as output_file:
+                self.merge(chunk_paths, output_file, key if binary else 'key', binary, top)
+            os.rename(temporary_path, output_path)
+        finally:
+            for chunk_path in chunk_paths:
+                try:
+                    os.remove(chunk_path)
+                except OSError:
+                    pass
+
+    # Method that splits the file in ranges of bytes that are sorted in memory. The binary ranges have whole records and
+    # the text ranges have whole lines. The text chunks take more memory than their size (lines and parsed tokens).
+    def chunk_ranges(self, path, binary):
+        size = os.path.getsize(path)
+        record_size = self.record_dtype.itemsize
+        chunk_bytes = self.memory_budget // (self.workers * (4 if binary else 24))
+        ranges = []
+        if(binary):
+            chunk_bytes = max(record_size, chunk_bytes - (chunk_bytes % record_size))
+            for start in range(0, size, chunk_bytes):
+                ranges.append((start, min(start + chunk_bytes, size)))
+            return ranges
+        chunk_bytes = max(1, chunk_bytes)
+        with open(path, 'rb') as input_file:
+            start = 0
+            while(start < size):
+                if(start + chunk_bytes >= size):
+                    end = size
+                else:
+                    # The range goes until the end of the line of its last byte.
+                    input_file.seek(start + chunk_bytes - 1)
+                    input_file.readline()
+                    end = input_file.tell()
+                ranges.append((start, end))
+                start = end
+        return ranges
+
+    # Method that merges the sorted chunks in the output file. In each round a block of each chunk is read and the
+    # records are written up to the bound: the smallest (key, chunk) of the last read records of the chunks that still
+    # have records to read. The following records of these chunks come after the bound, so at least the block of the
+    # chunk of the bound is written in each round.
+    def merge(self, chunk_paths, output_file, key, binary, top):
+        chunks = [np.load(chunk_path, mmap_mode='r') for chunk_path in chunk_paths]
+        if(not chunks):
+            return
+        # The blocks have a minimum size, so the merge of many small chunks still reads them in blocks.
+        block_size = max(2 ** 10, self.memory_budget // (2 * len(chunks) * max([chunk.dtype.itemsize for chunk in chunks])))
+        # The lines of the text chunks have the width of the longest line of each chunk, so they are cast to the widest one.
+        dtype = chunks[0].dtype
+        if(not binary):
+            dtype = np.dtype([('key', '<f8'), ('line', np.string_, max([chunk.dtype['line'].itemsize for chunk in chunks]))])
+        positions = [0] * len(chunks)
+        written = 0
+        while(top is None or written < top):
+            # The keys are negated, so the records are in ascending order.
+            blocks_keys = [-np.asarray(chunk[key][position:(position + block_size)], dtype=np.float64)
+                           for chunk, position in izip(chunks, positions)]
+            bound = None
+            for i, (chunk, position, block_keys) in enumerate(izip(chunks, positions, blocks_keys)):
+                if(position + block_size < len(chunk) and (bound is None or (block_keys[-1], i) < bound)):
+                    bound = (block_keys[-1], i)
+            if(bound is None):
+                counts = [len(block_keys) for block_keys in blocks_keys]
+            else:
+                # The records with the key of the bound are written up to the chunk of the bound.
+                counts = [np.searchsorted(block_keys, bound[0], side=('right' if i <= bound[1] else 'left'))
+                          for i, block_keys in enumerate(blocks_keys)]
+            if(sum(counts) == 0):
+                break
+            records = np.concatenate([chunk[position:(position + count)].astype(dtype) for chunk, position, count in izip(chunks, positions, counts)])
+            keys = np.concatenate([block_keys[:count] for block_keys, count in izip(blocks_keys, counts)])
+            sources = np.repeat(np.arange(len(chunks)), counts)
+            # The records are sorted by the key and then by the chunk (lexsort is stable, so the chunk order is kept).
+            records = records[np.lexsort((sources, keys))]
+            if(top is not None):
+                records = records[:(top - written)]
+            if(binary):
+                records.tofile(output_file)
+            else:
+                output_file.write(''.join(records['line'].tolist()))
+            written += len(records)
+            positions = [position + count for position, count in izip(positions, counts)]
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import hashlib
+from itertools import izip
+import numpy as np
+from igraph import Graph
+
+# Class that stores the parsed networks in a binary cache, so the text files are parsed only once. The cache of a
+# network (and of the way it's read, like directed or undirected) is a directory next to its file with the CSR arrays of the edges (offsets, neighbors and weights) and the
+# vertex names as .npy files, that are opened as memory maps (numpy.memmap), so the concurrent processes share their
+# pages. A header with the modification time, size and sha1 of the source file tells if the cache is valid.
+class GraphCache():
+
+    # Version of the cache format. The caches of other versions are built again.
+    version = 1
+
+    def __init__(self, directory=None):
+        # Directory of the caches. If None, the cache of each network is written next to its file.
+        self.directory = directory
+
+    # Method that returns the directory of the cache of a network file read in a way (kind).
+    def cache_path(self, file, kind):
+        if(self.directory is None):
+            return "%s.%s.cache" % (file, kind)
+        return os.path.join(self.directory, "%s.%s.cache" % (os.path.basename(file), kind))
+
+    # Method that calculates the sha1 of a file, reading it in blocks.
+    def file_hash(self, file):
+        sha1 = hashlib.sha1()
+        with open(file, 'rb') as source:
+            for block in iter(lambda: source.read(2 ** 20), b''):
+                sha1.update(block)
+        return sha1.hexdigest()
+
+    # Method that returns the header of a valid cache of the file or None. The cache is valid if the modification time
+    # and the size of the file are the same, or else if its hash is the same (like a copied or touched file).
+    def valid_header(self, file, kind):
+        header_path = os.path.join(self.cache_path(file, kind), "header.json")
+        if(not os.path.exists(header_path)):
+            return None
+        with open(header_path) as header_file:
+            try:
+                header = json.load(header_file)
+            except ValueError:
+                return None
+        status = os.stat(file)
+        if(header.get('version') != self.version or header['size'] != status.st_size):
+            return None
+        if(header['mtime'] != status.st_mtime):
+            if(header['sha1'] != self.file_hash(file)):
+                return None
+            # The file wasn't changed, so the new modification time is stored to skip the hash in the next loads.
+            header['mtime'] = status.st_mtime
+            self.write_header(file, kind, header)
+        return header
+
+    # Method that loads a network from its cache. If the cache doesn't exist or isn't valid, the network is read by the
+    # function and the cache is written. The graph is always built from the cache arrays, so the order of its edges is
+    # the same in the first and in the next loads.
+    def load(self, file, kind, read_graph):
+        header = self.valid_header(file, kind)
+        if(header is None):
+            header = self.write(file, kind, read_graph())
+        return self.build_graph(file, kind, header)
+
+    # Method that writes the cache of a graph read from the file. Each array is written to a temporary file and renamed,
+    # and the header is written last, so the processes that load the same network never read a partial cache.
+    def write(self, file, kind, graph):
+        status = os.stat(file)
+        path = self.cache_path(file, kind)
+        if(not os.path.exists(path)):
+            try:
+                os.makedirs(path)
+            except OSError:
+                if(not os.path.isdir(path)):
+                    raise
+        edges = np.array(graph.get_edgelist(), dtype=np.int64).reshape(-1, 2)
+        # The edges are sorted by source (stable, so the order of the neighbors is the order of the file).
+        order = np.argsort(edges[:, 0], kind='mergesort')
+        offsets = np.zeros(graph.vcount() + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(edges[:, 0], minlength=graph.vcount()))
+        arrays = {'offsets': offsets, 'neighbors': edges[order, 1]}
+        weighted = 'weight' in graph.es.attributes()
+        if(weighted):
+            arrays['weights'] = np.array(graph.es['weight'], dtype=np.float64)[order]
+        # The names are taken from the name attribute (ncol and pajek) or from the label attribute (gml).
+        names_attribute = None
+        for attribute in ['name', 'label']:
+            if(attribute in graph.vs.attributes()):
+                names_attribute = attribute
+                arrays['names'] = np.array([name.encode('utf-8') if isinstance(name, unicode) else str(name) for name in graph.vs[attribute]], dtype=np.string_)
+                break
+        for name, array in arrays.items():
+            temporary_path = os.path.join(path, "%s.%d.tmp.npy" % (name, os.getpid()))
+            np.save(temporary_path, array)
+            os.rename(temporary_path, os.path.join(path, name + ".npy"))
+        header = {'version': self.version, 'mtime': status.st_mtime, 'size': status.st_size, 'sha1': self.file_hash(file),
+                  'directed': graph.is_directed(), 'vcount': graph.vcount(), 'ecount': graph.ecount(), 'weighted': weighted,
+                  'names_attribute': names_attribute}
+        self.write_header(file, kind, header)
+        return header
+
+    # Method that writes the header of the cache of the file.
+    def write_header(self, file, kind, header):
+        path = self.cache_path(file, kind)
+        temporary_path = os.path.join(path, "header.%d.tmp.json" % os.getpid())
+        with open(temporary_path, 'w') as header_file:
+            json.dump(header, header_file)
+        os.rename(temporary_path, os.path.join(path, "header.json"))
+
+    # Method that yields the edges (source, neighbor) of the CSR arrays. The edges are read in blocks from the memory
+    # maps, so igraph receives them one by one and only a block of them is held as Python objects.
+    def edge_pairs(self, offsets, neighbors, block_size=2 ** 20):
+        for start in range(0, len(neighbors), block_size):
+            end = min(start + block_size, len(neighbors))
+            # The source of each edge is the vertex whose range of offsets contains it.
+            sources = np.searchsorted(offsets, np.arange(start, end), side='right') - 1
+            for pair in izip(sources.tolist(), np.asarray(neighbors[start:end]).tolist()):
+                yield pair
+
+    # Method that opens an array of the cache of the file as a memory map.
+    def open_array(self, file, kind, name):
+        return np.load(os.path.join(self.cache_path(file, kind), name + ".npy"), mmap_mode='r')
+
+    # Method that builds the graph of the cache of the file.
+    def build_graph(self, file, kind, header):
+        offsets = self.open_array(file, kind, 'offsets')
+        neighbors = self.open_array(file, kind, 'neighbors')
+        graph = Graph(n=header['vcount'], edges=self.edge_pairs(offsets, neighbors), directed=header['directed'])
+        if(header['weighted']):
+            graph.es['weight'] = self.open_array(file, kind, 'weights').tolist()
+        if(header['names_attribute'] is not None):
+            graph.vs[str(header['names_attribute'])] = self.open_array(file, kind, 'names').tolist()
+        return graph
@@ -2,12 +2,40 @@
 # -*- coding: utf-8 -*-
 
 from igraph import *
+import numpy as np
+from loader.edge_index import EdgeIndex
+from loader.graph_cache import GraphCache
+from loader.ncol_stream_reader import NcolStreamReader
 
 class GraphLoader():
 
+    def __init__(self, graph_cache=None):
+        # Binary cache of the parsed networks. If None, the networks are always parsed from their files.
+        self.graph_cache = graph_cache
+
+    # Method that reads a network by the function, or from its cache (of the kind of network) if the loader has a cache.
+    def read_graph(self, file, kind, read_function):
+        if(self.graph_cache is None):
+            return read_function()
+        return self.graph_cache.load(file, kind, read_function)
+
     # Method that loads a unipartite undirected .ncol network.
     def load_unipartite_undirected_ncol(self, file):
-        graph = Graph.Read_Ncol(file, directed=False)
+        graph = self.read_graph(file, 'undirected_ncol', lambda: Graph.Read_Ncol(file, directed=False))
+        graph['successors'] = range(graph.vcount())
+        graph['level'] = 0
+        graph = self.remove_self_edges(graph)
+        return graph
+
+    # Method that loads a unipartite undirected .ncol network whose text file is larger than the memory. The file is
+    # streamed to a compact cache (without self edges and with the multiple edges merged) and the network is built from
+    # it, so only the graph (not the text) has to fit in the memory.
+    def load_unipartite_undirected_ncol_streaming(self, file):
+        graph_cache = self.graph_cache if self.graph_cache is not None else GraphCache()
+        header = graph_cache.valid_header(file, 'streamed_ncol')
+        if(header is None):
+            header = NcolStreamReader(graph_cache).write(file, 'streamed_ncol')
+        graph = graph_cache.build_graph(file, 'streamed_ncol', header)
         graph['successors'] = range(graph.vcount())
         graph['level'] = 0
         graph = self.remove_self_edges(graph)
@@ -15,7 +43,7 @@ class GraphLoader():
 
     # Method that loads a unipartite undirected .ncol network.
     def load_unipartite_undirected_gml(self, file):
-        graph = Graph.Read_GML(file)
+        graph = self.read_graph(file, 'undirected_gml', lambda: Graph.Read_GML(file))
         graph['successors'] = range(graph.vcount())
         graph['level'] = 0
         graph = self.remove_self_edges(graph)
@@ -24,7 +52,7 @@ class GraphLoader():
 
     # Method that loads a unipartite undirected .ncol network.
     def load_unipartite_pajek(self, file):
-        graph = Graph.Read_Pajek(file)
+        graph = self.read_graph(file, 'pajek', lambda: Graph.Read_Pajek(file))
         graph['successors'] = range(graph.vcount())
         graph['level'] = 0
         graph = self.remove_self_edges(graph)
@@ -33,13 +61,15 @@ class GraphLoader():
 
     # Method that loads a unipartite undirected .ncol network.
     def load_unipartite_directed_ncol(self, file):
-        graph = Graph.Read_Ncol(file, directed=True)
+        graph = self.read_graph(file, 'directed_ncol', lambda: Graph.Read_Ncol(file, directed=True))
         graph['successors'] = range(graph.vcount())
         graph['level'] = 0
         graph = self.remove_self_edges(graph)
         return graph
 
     def remove_self_edges(self, graph):
-        graph.delete_edges([edge for edge in graph.es if (edge.source == edge.target)])
+        graph.delete_edges(np.flatnonzero(graph.is_loop()).tolist())
+        # Indexes the remaining edges for the edge existence queries.
+        graph['edge_index'] = EdgeIndex(graph)
         return graph
 
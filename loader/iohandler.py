@@ -2,29 +2,36 @@
 # -*- coding: utf-8 -*-
 import operator
 import os
-from tempfile import gettempdir
-from itertools import islice, cycle
-from random import shuffle
-import heapq
+from itertools import islice, izip
+import numpy as np
+from loader.external_sorter import ExternalSorter
+from loader.external_shuffler import ExternalShuffler
 
+# Record of the binary ranking files: the source and target vertices (uint32) and the score (float32) of an edge.
+ranking_dtype = np.dtype([('source', '<u4'), ('target', '<u4'), ('score', '<f4')])
 
 # Class that handles the input/output files that are used by this software. Ranking files, precision/auc/time files, etc.
 class IOHandler():
 
-    def __init__(self):
+    def __init__(self, binary=False, buffer_size=2 ** 16):
         self.input_file = None
         self.input_file_path = None
         self.output_file = None
         self.output_file_path = None
+        # Tells if the ranking files are binary (fixed width records of ranking_dtype) instead of text lines.
+        self.binary = binary
+        # Number of predicted edges buffered before they are written in a binary ranking file.
+        self.buffer_size = buffer_size
+        self.buffer = []
 
     # Method that loads a input file.
     def load_input_file(self, input_file_path):
-        self.input_file = open(input_file_path, "r")
+        self.input_file = open(input_file_path, "rb" if self.binary else "r")
         self.input_file_path = input_file_path
 
     # Method that loads a output file.
     def load_output_file(self, output_file_path):
-        self.output_file = open(output_file_path, "w")
+        self.output_file = open(output_file_path, "wb" if self.binary else "w")
         self.output_file_path = output_file_path
 
     # Method that closes the input/output files.
@@ -32,6 +39,7 @@ class IOHandler():
         if (self.input_file):
             self.input_file.close()
         if(self.output_file):
+            self.flush_buffer()
             self.output_file.close()
 
     # Method that removes an input file.
@@ -44,11 +52,18 @@ class IOHandler():
 
     # Methods that writes the predicted edges in the output file.
     def write_predicted_edges(self, predicted_edges):
+        if(self.binary):
+            edges = np.array(predicted_edges.keys(), dtype=np.int64).reshape(-1, 2)
+            self.write_predicted_edges_block(edges[:, 0], edges[:, 1], np.array(predicted_edges.values(), dtype=np.float64))
+            return
         for predicted_edge in predicted_edges:
             self.output_file.write("%i %i %f\n" % (predicted_edge[0], predicted_edge[1], predicted_edges[predicted_edge]))
 
     # Methods that loads the predicted edges from the input file.
     def load_predicted_edges(self):
+        if(self.binary):
+            records = self.load_ranking_records()
+            return dict(izip(izip(records['source'].tolist(), records['target'].tolist()), records['score'].tolist()))
         # Set the pointer to the begining.
         self.input_file.seek(0, 0)
         predicted_edges = {}
@@ -59,8 +74,64 @@ class IOHandler():
 
     # Methods that writes one predicted edge in the output file. (For performance proposes)
     def write_predicted_edge(self, predicted_edge, weight):
+        if(self.binary):
+            self.buffer.append((predicted_edge[0], predicted_edge[1], float(weight)))
+            if(len(self.buffer) >= self.buffer_size):
+                self.flush_buffer()
+            return
         self.output_file.write("%i %i %s\n" % (predicted_edge[0], predicted_edge[1], weight))
 
+    # Methods that writes a block of predicted edges, given as arrays of sources, targets and weights, in the output file.
+    def write_predicted_edges_block(self, sources, targets, weights):
+        if(self.binary):
+            self.flush_buffer()
+            records = np.empty(len(sources), dtype=ranking_dtype)
+            records['source'] = sources
+            records['target'] = targets
+            records['score'] = weights
+            records.tofile(self.output_file)
+            return
+        self.output_file.writelines("%i %i %s\n" % (source, target, weight) for source, target, weight in
+                                    izip(sources.tolist(), targets.tolist(), weights.tolist()))
+
+    # Method that writes the buffered predicted edges in the binary output file.
+    def flush_buffer(self):
+        if(self.buffer):
+            np.array(self.buffer, dtype=ranking_dtype).tofile(self.output_file)
+            self.buffer = []
+
+    # Method that opens the binary ranking of the input file as a (read only) memory map of records.
+    def load_ranking_records(self):
+        if(os.path.getsize(self.input_file_path) == 0):
+            return np.zeros(0, dtype=ranking_dtype)
+        return np.memmap(self.input_file_path, dtype=ranking_dtype, mode='r')
+
+    # Method that exports the binary ranking of the input file as a text ranking ("source target score" lines).
+    def export_text_ranking(self, output_file_path, block_size=2 ** 20):
+        records = self.load_ranking_records()
+        with open(output_file_path, "w") as output_file:
+            for start in range(0, len(records), block_size):
+                block = records[start:(start + block_size)]
+                output_file.writelines("%i %i %s\n" % (source, target, score) for source, target, score in
+                                       izip(block['source'].tolist(), block['target'].tolist(), block['score'].tolist()))
+
+    # Method that yields the predicted edges of the input file (binary or text) in blocks of arrays: sources, targets
+    # and scores. The file is read once, in its order.
+    def load_predicted_edges_blocks(self, block_size=2 ** 20):
+        if(self.binary):
+            records = self.load_ranking_records()
+            for start in range(0, len(records), block_size):
+                block = records[start:(start + block_size)]
+                yield block['source'].astype(np.int64), block['target'].astype(np.int64), block['score'].astype(np.float64)
+            return
+        self.input_file.seek(0, 0)
+        while(True):
+            lines = list(islice(self.input_file, block_size))
+            if(not lines):
+                break
+            values = np.array(" ".join(lines).split(), dtype=np.float64).reshape(-1, 3)
+            yield values[:, 0].astype(np.int64), values[:, 1].astype(np.int64), values[:, 2]
+
     # Methods that writes one predicted edge in the output file. (For performance proposes)
     def load_predicted_edge(self):
         return self.input_file.readline()
@@ -89,73 +160,24 @@ class IOHandler():
     #       Batch handling     #
     ############################
 
-    # Sorts a huge files for statistical confidence in metrics calculation.
-    def batch_sort(self, key=None, buffer_size=32000000, tempdirs=None):
-        if tempdirs is None:
-            tempdirs = []
-        if not tempdirs:
-            tempdirs.append(gettempdir())
-        chunks = []
-        try:
-            with open(self.input_file_path, 'rb', 64 * 1024) as input_file:
-                input_iterator = iter(input_file)
-                for tempdir in cycle(tempdirs):
-                    current_chunk = list(islice(input_iterator, buffer_size))
-                    if not current_chunk:
-                        break
-                    # Lambda function allows the last attribute (edge weight) be used as the value for sorting.
-                    current_chunk = sorted(current_chunk, key=lambda x: float(x.split(" ")[2]), reverse=True)
-
-                    output_chunk = open(os.path.join(tempdir, '%06i' % len(chunks)), 'w+b', 64 * 1024)
-                    chunks.append(output_chunk)
-                    output_chunk.writelines(current_chunk)
-                    output_chunk.flush()
-                    output_chunk.seek(0)
-            with open(self.input_file_path, 'wb', 64 * 1024) as output_file:
-                output_file.writelines(self.merge(key, *chunks))
-        finally:
-            for chunk in chunks:
-                try:
-                    chunk.close()
-                    os.remove(chunk.name)
-                except Exception:
-                    pass
-
-    # Shuffles a huge files for statistical confidence in metrics calculation.
-    def batch_shuffle(self, key=None, buffer_size=32000000, tempdirs=None):
-        if tempdirs is None:
-            tempdirs = []
-        if not tempdirs:
-            tempdirs.append(gettempdir())
-
-        chunks = []
-        try:
-            with open(self.input_file_path, 'rb', 64 * 1024) as input_file:
-                input_iterator = iter(input_file)
-                for tempdir in cycle(tempdirs):
-                    current_chunk = list(islice(input_iterator, buffer_size))
-                    if not current_chunk:
-                        break
-                    # Method that shuffles the chunk.
-                    shuffle(current_chunk)
-                    output_chunk = open(os.path.join(tempdir, '%06i' % len(chunks)), 'w+b', 64 * 1024)
-                    chunks.append(output_chunk)
-                    output_chunk.writelines(current_chunk)
-                    output_chunk.flush()
-                    output_chunk.seek(0)
-            with open(self.input_file_path, 'wb', 64 * 1024) as output_file:
-                output_file.writelines(self.merge(key, *chunks))
-        finally:
-            for chunk in chunks:
-                try:
-                    chunk.close()
-                    os.remove(chunk.name)
-                except Exception:
-                    pass
-
-    # Method that merges chunks of predicted edges.
-    def merge(self, key=None, *iterables):
-        for element in heapq.merge(*iterables):
-            yield element
-
-
+    # Sorts a huge files for statistical confidence in metrics calculation. The ranking is sorted by the key (a field of
+    # the records: source, target or score) in descending order by an external sort, with its chunks sorted by worker
+    # processes within the memory budget (bytes). If top is given, only the first top edges are written (in the output
+    # file or in the input file).
+    def batch_sort(self, key='score', tempdirs=None, workers=1, memory_budget=2 ** 28, top=None, output_file_path=None):
+        sorter = ExternalSorter(ranking_dtype, workers, memory_budget, tempdirs)
+        sorter.sort(self.input_file_path, output_file_path, key, self.binary, top)
+        # The sorted file replaces the opened one.
+        if(output_file_path is None and self.input_file):
+            self.input_file.close()
+            self.load_input_file(self.input_file_path)
+
+    # Shuffles a huge files for statistical confidence in metrics calculation. The ranking is shuffled by an external
+    # shuffle (random buckets on disk) within the memory budget (bytes), with a seedable random generator.
+    def batch_shuffle(self, tempdirs=None, memory_budget=2 ** 28, seed=None):
+        shuffler = ExternalShuffler(ranking_dtype, memory_budget, tempdirs, seed)
+        shuffler.shuffle(self.input_file_path, None, self.binary)
+        # The shuffled file replaces the opened one.
+        if(self.input_file):
+            self.input_file.close()
+            self.load_input_file(self.input_file_path)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import time
+import shutil
+import hashlib
+from tempfile import gettempdir, mkdtemp
+import numpy as np
+from loader.graph_cache import GraphCache
+
+# Class that reads a .ncol file larger than the memory. The file is streamed in chunks of lines, the vertex names
+# are mapped to dense integer ids (in the order they appear, like Graph.Read_Ncol) and the edges are written to bucket
+# files on disk by the range of their source ids. Each bucket is then loaded alone, its self edges are dropped and its
+# duplicated edges are merged (keeping the last weight, like graph[v, u]), so only the names and one bucket are kept
+# in memory. The CSR arrays are written in the format of the GraphCache, so the network is loaded from the cache.
+class NcolStreamReader():
+
+    def __init__(self, graph_cache=None, chunk_lines=2 ** 20, bucket_bits=20, tempdir=None, verbose=True):
+        self.graph_cache = graph_cache if graph_cache is not None else GraphCache()
+        # Number of lines parsed at once.
+        self.chunk_lines = chunk_lines
+        # Each bucket receives the edges of 2^bucket_bits source ids.
+        self.bucket_bits = bucket_bits
+        self.tempdir = tempdir if tempdir is not None else gettempdir()
+        # Tells if the progress is reported.
+        self.verbose = verbose
+
+    # Method that reports the progress of the reading.
+    def report(self, message, *values):
+        if(self.verbose):
+            print message % values
+            sys.stdout.flush()
+
+    # Method that reads the file and writes its cache (of the kind of network). Returns the header of the cache.
+    def write(self, file, kind, directed=False):
+        status = os.stat(file)
+        path = self.graph_cache.cache_path(file, kind)
+        if(not os.path.isdir(path)):
+            os.makedirs(path)
+        bucket_directory = mkdtemp(dir=self.tempdir)
+        try:
+            names, buckets, sha1, weighted = self.write_buckets(file, bucket_directory, directed)
+            vcount = len(names)
+            ecount = self.write_csr(path, buckets, vcount)
+            # The names are sorted by their ids.
+            names_array = np.empty(vcount, dtype=object)
+            for name, vertex in names.iteritems():
+                names_array[vertex] = name
+            self.save(path, 'names', np.array(names_array.tolist(), dtype=np.string_))
+        finally:
+            shutil.rmtree(bucket_directory, ignore_errors=True)
+        if(not weighted):
+            os.remove(os.path.join(path, 'weights.npy'))
+        header = {'version': self.graph_cache.version, 'mtime': status.st_mtime, 'size': status.st_size, 'sha1': sha1,
+                  'directed': directed, 'vcount': vcount, 'ecount': ecount, 'weighted': weighted, 'names_attribute': 'name'}
+        self.graph_cache.write_header(file, kind, header)
+        self.report("Wrote the cache of %s: %d vertices and %d edges.", file, vcount, ecount)
+        return header
+
+    # Method that streams the file and appends the keys (source << 32 | target) and weights of its edges to the bucket
+    # files. The sha1 of the file is calculated in the same pass. Returns the names, the bucket paths, the sha1 and if
+    # the network has weights.
+    def write_buckets(self, file, bucket_directory, directed):
+        names = {}
+        buckets = {}
+        sha1 = hashlib.sha1()
+        weighted = False
+        total_size = max(os.path.getsize(file), 1)
+        read_size = 0
+        lines_count = 0
+        start_time = time.time()
+        with open(file, 'rb') as source:
+            while(True):
+                lines = source.readlines(self.chunk_lines * 16)
+                if(not lines):
+                    break
+                sources = []
+                targets = []
+                weights = []
+                for line in lines:
+                    sha1.update(line)
+                    read_size += len(line)
+                    values = line.split()
+                    if(len(values) < 2):
+                        continue
+                    # The ids are given in the order the names appear.
+                    sources.append(names.setdefault(values[0], len(names)))
+                    targets.append(names.setdefault(values[1], len(names)))
+                    if(len(values) > 2):
+                        weighted = True
+                        weights.append(float(values[2]))
+                    else:
+                        weights.append(1.0)
+                lines_count += len(lines)
+                self.append_buckets(bucket_directory, buckets, sources, targets, weights, directed)
+                self.report("Read %d lines (%.1f%%) in %.1fs, %d vertices.", lines_count, 100.0 * read_size / total_size,
+                            time.time() - start_time, len(names))
+        return names, buckets, sha1.hexdigest(), weighted
+
+    # Method that appends the edges of a chunk (without the self edges) to the bucket files of their sources.
+    def append_buckets(self, bucket_directory, buckets, sources, targets, weights, directed):
+        sources = np.array(sources, dtype=np.int64)
+        targets = np.array(targets, dtype=np.int64)
+        weights = np.array(weights, dtype=np.float64)
+        edges = sources != targets
+        sources, targets, weights = sources[edges], targets[edges], weights[edges]
+        if(not directed):
+            sources, targets = np.minimum(sources, targets), np.maximum(sources, targets)
+        keys = (sources << 32) | targets
+        bucket_ids = sources >> self.bucket_bits
+        # The edges keep the order of the file inside each bucket.
+        order = np.argsort(bucket_ids, kind='mergesort')
+        keys, weights, bucket_ids = keys[order], weights[order], bucket_ids[order]
+        bounds = np.flatnonzero(np.diff(bucket_ids)) + 1
+        for first, last in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(keys)]))):
+            if(first == last):
+                continue
+            bucket = int(bucket_ids[first])
+            if(bucket not in buckets):
+                buckets[bucket] = os.path.join(bucket_directory, "bucket%d" % bucket)
+            with open(buckets[bucket] + ".keys", 'ab') as keys_file:
+                keys[first:last].tofile(keys_file)
+            with open(buckets[bucket] + ".weights", 'ab') as weights_file:
+                weights[first:last].tofile(weights_file)
+
+    # Method that merges the duplicated edges of each bucket and writes the CSR arrays (offsets, neighbors and weights).
+    # The buckets are merged one at a time and written to the memory mapped arrays. Returns the number of edges.
+    def write_csr(self, path, buckets, vcount):
+        counts = np.zeros(vcount, dtype=np.int64)
+        for bucket in sorted(buckets):
+            keys = np.fromfile(buckets[bucket] + ".keys", dtype=np.int64)
+            weights = np.fromfile(buckets[bucket] + ".weights", dtype=np.float64)
+            # The last occurrence of each edge is kept, so the keys are searched in the reversed order.
+            keys, last = np.unique(keys[::-1], return_index=True)
+            weights = weights[::-1][last]
+            keys.tofile(buckets[bucket] + ".keys")
+            weights.tofile(buckets[bucket] + ".weights")
+            counts += np.bincount(keys >> 32, minlength=vcount)
+            self.report("Merged bucket %d: %d edges.", bucket, len(keys))
+        offsets = np.zeros(vcount + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        ecount = int(offsets[-1])
+        self.save(path, 'offsets', offsets)
+        neighbors = self.open_output(path, 'neighbors', np.int64, ecount)
+        edge_weights = self.open_output(path, 'weights', np.float64, ecount)
+        position = 0
+        for bucket in sorted(buckets):
+            keys = np.fromfile(buckets[bucket] + ".keys", dtype=np.int64)
+            neighbors[position:(position + len(keys))] = keys & 0xFFFFFFFF
+            edge_weights[position:(position + len(keys))] = np.fromfile(buckets[bucket] + ".weights", dtype=np.float64)
+            position += len(keys)
+        for name, array in [('neighbors', neighbors), ('weights', edge_weights)]:
+            array.flush()
+            os.rename(os.path.join(path, "%s.%d.tmp.npy" % (name, os.getpid())), os.path.join(path, name + ".npy"))
+        return ecount
+
+    # Method that creates a memory mapped .npy array of the cache (in a temporary file renamed when it's complete).
+    def open_output(self, path, name, dtype, length):
+        temporary_path = os.path.join(path, "%s.%d.tmp.npy" % (name, os.getpid()))
+        return np.lib.format.open_memmap(temporary_path, mode='w+', dtype=dtype, shape=(length,))
+
+    # Method that saves an array of the cache.
+    def save(self, path, name, array):
+        temporary_path = os.path.join(path, "%s.%d.tmp.npy" % (name, os.getpid()))
+        np.save(temporary_path, array)
+        os.rename(temporary_path, os.path.join(path, name + ".npy"))
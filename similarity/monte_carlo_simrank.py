@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+import numpy as np
+import scipy.sparse
+
+# Class that estimates the simrank similarity index by Monte Carlo fingerprints (Fogaras and Racz). The simrank of
+# (u, v) is E[c^t], where t is the first step in which two random walks (over the in-neighbors) from u and v meet. Each
+# fingerprint draws one random in-neighbor for each vertex and step, and all the walkers move by the same draws, so
+# the walks that meet keep together. The memory is bounded by samples * length * vertices positions.
+class MonteCarloSimRank():
+
+	def __init__(self, adjacency, decay=0.8, length=5, samples=100, seed=None, max_positions=2 ** 25, block_size=2 ** 22):
+		self.adjacency = adjacency.tocsr()
+		self.decay = decay
+		# Maximum length of the random walks.
+		self.length = length
+		n = self.adjacency.shape[0]
+		# The number of samples is reduced if the positions don't fit in the bound.
+		self.samples = max(1, min(samples, max_positions // max(length * n, 1)))
+		# Maximum number of scores (pairs * samples * length, in the pairs case) calculated in each block.
+		self.block_size = block_size
+		# The contribution of a meeting at the step t is c^t minus the contribution of the following step, since the
+		# walks that meet keep together. The meetings at the last step weight c^length.
+		powers = decay ** np.arange(1, length + 2)
+		self.step_weights = powers[:-1] - powers[1:]
+		self.step_weights[-1] = powers[-2]
+		# Sparse matrix (vertices x (samples * length * positions)) that tells the position of the walker of each vertex
+		# in each sample and step. The values are the weights of the steps, so the product of two rows sums the
+		# contributions of the meetings of two walkers.
+		self.fingerprints_matrix = self.positions_matrix(self.fingerprints(np.random.RandomState(seed)))
+		self.meetings_matrix = scipy.sparse.csr_matrix((np.ones(self.fingerprints_matrix.nnz), self.fingerprints_matrix.indices,
+														self.fingerprints_matrix.indptr), shape=self.fingerprints_matrix.shape).T.tocsr()
+
+	# Method that draws the fingerprints. Returns the positions (samples x length x vertices) of the walker of each
+	# vertex at each step.
+	def fingerprints(self, random_state):
+		n = self.adjacency.shape[0]
+		# The in-neighbors are the columns of the transposed matrix.
+		in_adjacency = self.adjacency.T.tocsr()
+		degrees = np.diff(in_adjacency.indptr)
+		positions = np.empty((self.samples, self.length, n), dtype=np.int64)
+		for sample in range(self.samples):
+			current = np.arange(n)
+			for step in range(self.length):
+				# Draws one in-neighbor for each vertex, so all the walkers in the same vertex go together.
+				draws = in_adjacency.indptr[:-1] + np.floor(random_state.random_sample(n) * degrees).astype(np.int64)
+				following = np.full(n, -1, dtype=np.int64)
+				following[degrees > 0] = in_adjacency.indices[draws[degrees > 0]]
+				# A walker that reaches a vertex without in-neighbors stops in a (negative) position of the vertex and
+				# the step, so only the walkers that were together stop together.
+				walking = current >= 0
+				following = following[np.where(walking, current, 0)]
+				stopping = walking & (following < 0)
+				current = np.where(walking & ~stopping, following, current)
+				current[stopping] = -1 - (current[stopping] + n * step)
+				positions[sample, step] = current
+		return positions
+
+	# Method that builds the sparse matrix of the positions. The positions of the stopped walkers (from -n * length to
+	# -1) are shifted to be positive, so each sample and step has (length + 1) * n columns.
+	def positions_matrix(self, positions):
+		n = positions.shape[2]
+		columns_per_step = (self.length + 1) * n
+		offsets = np.arange(self.samples * self.length).reshape(self.samples, self.length, 1) * columns_per_step
+		columns = (positions + (self.length * n) + offsets).transpose(2, 0, 1).reshape(-1)
+		weights = np.tile(self.step_weights, n * self.samples)
+		indptr = np.arange(n + 1) * (self.samples * self.length)
+		return scipy.sparse.csr_matrix((weights, columns, indptr), shape=(n, self.samples * self.length * columns_per_step))
+
+	# Method that returns the similarities of the rows (a slice or an array of vertices) against all vertices (a dense
+	# block) or of each pair (rows[k], columns[k]). The similarity of a vertex with itself is 1.
+	def scores(self, rows, columns=None):
+		n = self.fingerprints_matrix.shape[0]
+		rows = np.arange(n)[rows]
+		if(columns is None):
+			scores = (self.fingerprints_matrix[rows] * self.meetings_matrix).toarray() / self.samples
+			scores[np.arange(len(rows)), rows] = 1
+			return scores
+		columns = np.asarray(columns)
+		scores = np.empty(len(rows))
+		chunk = max(1, self.block_size // (self.samples * self.length))
+		for start in range(0, len(rows), chunk):
+			sources = self.fingerprints_matrix[rows[start:(start + chunk)]]
+			targets = self.fingerprints_matrix[columns[start:(start + chunk)]]
+			# The rows share a column when the walkers meet, so the weight of the meeting is kept.
+			scores[start:(start + chunk)] = np.asarray(sources.multiply(targets != 0).sum(axis=1)).ravel() / self.samples
+		scores[rows == columns] = 1
+		return scores
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+import multiprocessing
+import numpy as np
+import scipy.sparse
+from similarity.sparse_similarity import SparseSimilarity
+
+# Sparse engine of a worker process. It is created by the pool initializer over the shared adjacency.
+worker_similarity = None
+
+# Function that creates the sparse engine of a worker process over the arrays in shared memory.
+def initialize_worker(shared_arrays, vcount, seed):
+	global worker_similarity
+	worker_similarity = SparseSimilarity()
+	worker_similarity.seed = seed
+	data, indices, indptr, edge_weights, degrees, set_degrees = [np.frombuffer(array, dtype=dtype)[:length] for array, dtype, length in shared_arrays]
+	worker_similarity.adjacency = scipy.sparse.csr_matrix((data, indices, indptr), shape=(vcount, vcount), copy=False)
+	worker_similarity.edge_weights = edge_weights
+	worker_similarity.degrees = degrees
+	worker_similarity.set_degrees = set_degrees
+
+# Function that scores a shard of source vertices in a worker process. Returns the blocks of the shard and, if they
+# are requested, the blocks with the scores of its edges.
+def score_shard(arguments):
+	name, first, last, threshold, cache_edges = arguments
+	edge_blocks = [] if cache_edges else None
+	return list(worker_similarity.predict_rows(name, first, last, threshold, edge_blocks)), edge_blocks
+
+# Class that calculates the similarity indices of the sparse engine in parallel processes. The source vertices are
+# split in shards with about the same amount of work (by their 2 hops paths) and each worker process scores its shards
+# against an adjacency matrix stored in shared memory.
+class ParallelSimilarity():
+
+	def __init__(self, workers=2, shards_per_worker=4, similarity_cache=None):
+		# Number of worker processes.
+		self.workers = workers
+		# Number of shards of each worker, so the slower shards are balanced by the other ones.
+		self.shards_per_worker = shards_per_worker
+		# Cache that receives the scores of the edges calculated by the workers.
+		self.similarity_cache = similarity_cache
+		self.sparse_similarity = SparseSimilarity(similarity_cache=similarity_cache)
+
+	# Method that tests if a similarity method can be calculated in parallel.
+	def supports(self, similarity):
+		return self.sparse_similarity.supports(similarity)
+
+	# Method that copies the adjacency matrix, the edge weights and the degrees of the loaded graph to shared memory.
+	def share(self):
+		adjacency = self.sparse_similarity.adjacency
+		arrays = [adjacency.data.astype(np.float64), adjacency.indices.astype(np.int64), adjacency.indptr.astype(np.int64),
+				  self.sparse_similarity.edge_weights, self.sparse_similarity.degrees, self.sparse_similarity.set_degrees]
+		shared_arrays = []
+		for array in arrays:
+			shared_array = multiprocessing.RawArray('b', max(array.nbytes, array.itemsize))
+			np.frombuffer(shared_array, dtype=array.dtype)[:len(array)] = array
+			shared_arrays.append((shared_array, array.dtype, len(array)))
+		return shared_arrays
+
+	# Method that splits the source vertices in shards with about the same number of 2 hops paths plus the number of
+	# scored pairs. Returns a list of ranges [first, last).
+	def shards(self, n_shards):
+		adjacency = self.sparse_similarity.adjacency
+		n = adjacency.shape[0]
+		costs = np.cumsum(adjacency.dot(self.sparse_similarity.set_degrees) + (n - np.arange(n)))
+		boundaries = np.searchsorted(costs, np.linspace(0, costs[-1], n_shards + 1)[1:-1]) if n else []
+		boundaries = sorted(set([0, n] + list(boundaries)))
+		return zip(boundaries[:-1], boundaries[1:])
+
+	# Method that yields the scores of the pairs (v, u), v < u, that are not edges of the graph, in blocks of arrays:
+	# sources, targets and scores. The blocks of each shard are yielded as soon as the shard is scored.
+	def predict_blocks(self, graph, similarity, threshold=None):
+		# The daemonic processes (like the fold workers) can't have children, so they score sequentially.
+		if(self.workers <= 1 or multiprocessing.current_process().daemon):
+			for block in self.sparse_similarity.predict_blocks(graph, similarity, threshold):
+				yield block
+			return
+		self.sparse_similarity.load_graph(graph)
+		cache_edges = self.similarity_cache is not None
+		tasks = [(similarity.__name__, first, last, threshold, cache_edges) for first, last in self.shards(self.workers * self.shards_per_worker)]
+		pool = multiprocessing.Pool(self.workers, initialize_worker, (self.share(), graph.vcount(), self.sparse_similarity.seed))
+		try:
+			for blocks, edge_blocks in pool.imap_unordered(score_shard, tasks):
+				if(cache_edges):
+					key = self.similarity_cache.key(graph, similarity)
+					for edge_block in edge_blocks:
+						self.similarity_cache.store(key, *edge_block)
+				for block in blocks:
+					yield block
+		finally:
+			pool.close()
+			pool.join()
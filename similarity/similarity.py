@@ -1,22 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from __future__ import division
+from __future__ import division, absolute_import
 import math
 import numpy as np
-from numpy.linalg import inv
+from loader.edge_index import EdgeIndex
+from similarity.sparse_katz import SparseKatz
+from similarity.sparse_pagerank import SparsePageRank
+from similarity.monte_carlo_simrank import MonteCarloSimRank
 
 class Similarity():
 
 	def __init__(self):
-		# Matrix that stores the katz measure to avoid re-calculations.
-		self.katz_matrix = None
-		# Dict that stores the katz similarities to avoid re-calculations.
-		self.katz_similarities = {}
-		self.katz_length = None
-		self.katz_beta = None
-		self.last_i = -1
+		# Engine of the global index of the last graph (and parameters) and the row of similarities of the last vertex,
+		# to avoid re-calculations. Only the state of one row is stored.
+		self.row_engine = None
+		self.row_graph = None
+		self.row = None
+		self.row_i = -1
 		# Array that contains all the available similarities measures implemented in this class.
-		self.similarities_array = [self.common_neighbors, self.jaccard_index, self.salton_index, self.adamic_adar, self.preferential_attachment, self.katz_index, self.lowmem_katz_index]
+		self.similarities_array = [self.common_neighbors, self.jaccard_index, self.salton_index, self.adamic_adar, self.preferential_attachment, self.katz_index, self.lowmem_katz_index, self.weighted_lowmem_katz_index, self.simrank, self.pagerank]
 
 	############################
 	# Local Similarity Indices #
@@ -61,78 +63,42 @@ class Similarity():
 	# Global Similarity Indices #
 	#############################
 
-	# Implementation of standard katz similarity index for link prediction. (Uses too much memory)
+	# Implementation of standard katz similarity index for link prediction. The row of the vertex i is calculated by an
+	# iterative solver over the sparse adjacency matrix instead of the inverse of the dense matrix.
 	def katz_index(self, graph, adjlist, i, j, beta=0.5):
-		# If any object is different, the katz matrix must be calculated. In a positive case, katz similarity must be recalculated.
-		if (self.katz_matrix is None):
-			# Gets the adjacency matrix of the graph as a numpy object.
-			adj_matrix = np.array(graph.get_adjacency().data)
-			I = np.identity(graph.vcount())
-			self.katz_matrix = inv((I - beta * adj_matrix)) - I
-		return (self.katz_matrix[i, j])
+		return self.row_similarity(graph, i, j, ('katz_index', beta), lambda: SparseKatz(EdgeIndex.get(graph).adjacency(), beta))
 
-	# Implementation of a iterative katz similarity index for link prediction. (Uses less memory.)
+	# Implementation of a iterative katz similarity index for link prediction. (Uses less memory.) The paths of up to l
+	# edges are counted by l products of the sparse adjacency matrix and the row of the vertex i.
 	def lowmem_katz_index(self, graph, adjlist, i, j, l=3, beta=0.5):
-		# If the parameters are different, the entire matrix must be recalculated.
-		if((self.katz_length != l) or (self.katz_beta != beta) or (self.last_i != i)):
-			self.katz_length = l
-			self.katz_beta = beta
-			self.last_i = i
+		return self.row_similarity(graph, i, j, ('lowmem_katz_index', l, beta),
+										lambda: SparseKatz(EdgeIndex.get(graph).adjacency(), beta, 'series', l))
 
-			constant = beta
-			# Creates the array of adjacency for the vertex v.
-			v_adjacency = [1 if (x in adjlist[i]) else 0 for x in range(graph.vcount())]
-			# Array that stores the katz similarities. Similarities starts with (beta * adjacency), as iteration 1.
-			self.katz_similarities = np.dot(constant, v_adjacency)
-
-			for cont in range(2, (l + 1)):
-				# Updates the product constant value.
-				constant *= beta
-				product = np.empty([graph.vcount()])
-				for k in range(graph.vcount()):
-					product[k] = 0
-					for neighbor in adjlist[k]:
-						if(v_adjacency[neighbor] != 0):
-							product[k] += 1
-					# Updates the similarities values.
-					self.katz_similarities[k] += constant * product[k]
-				v_adjacency = product
-
-		return self.katz_similarities[j]
-
-	# Implementation of a iterative katz similarity index for link prediction. (Uses less memory.)
+	# Implementation of a iterative katz similarity index for link prediction. (Uses less memory.) The weight of a path
+	# is the product of the weights of its edges.
 	def weighted_lowmem_katz_index(self, graph, adjlist, i, j, l=3, beta=0.5):
-		# If the parameters are different, the entire matrix must be recalculated.
-		if((self.katz_length != l) or (self.katz_beta != beta) or (self.last_i != i)):
-			self.katz_length = l
-			self.katz_beta = beta
-			self.last_i = i
-
-			constant = beta
-			# Creates the array of adjacency for the vertex v.
-			v_adjacency = [graph[i, x] for x in range(graph.vcount())]
-			# Array that stores the katz similarities. Similarities starts with (beta * adjacency), as iteration 1.
-			self.katz_similarities = np.dot(constant, v_adjacency)
-
-			for cont in range(2, (l + 1)):
-				# Updates the product constant value.
-				constant *= beta
-				product = np.empty([graph.vcount()])
-				for k in range(graph.vcount()):
-					product[k] = 0
-					for neighbor in adjlist[k]:
-						if(v_adjacency[neighbor] != 0):
-							product[k] += 1
-					# Updates the similarities values.
-					self.katz_similarities[k] += constant * product[k]
-				v_adjacency = product
-
-		return self.katz_similarities[j]
-
-	# Implementation of simrank index for link prediction.
+		return self.row_similarity(graph, i, j, ('weighted_lowmem_katz_index', l, beta),
+										lambda: SparseKatz(EdgeIndex.get(graph).adjacency(weighted=True), beta, 'series', l))
+
+	# Method that returns the similarity of (i, j) from the row of the vertex i. If the graph (or its edges) or the
+	# parameters are different, the engine of the index is created again by the function.
+	def row_similarity(self, graph, i, j, parameters, create_engine):
+		graph_key = (EdgeIndex.get(graph).serial,) + parameters
+		if (self.row_graph != graph_key):
+			self.row_engine = create_engine()
+			self.row_graph = graph_key
+			self.row_i = -1
+		if (self.row_i != i):
+			self.row = self.row_engine.scores([i])[0]
+			self.row_i = i
+		return self.row[j]
+
+	# Implementation of simrank index for link prediction. The scores are estimated by Monte Carlo fingerprints of
+	# random walks of up to it steps.
 	def simrank(self, graph, adjlist, i, j, it=5):
-		return 0
+		return self.row_similarity(graph, i, j, ('simrank', it), lambda: MonteCarloSimRank(EdgeIndex.get(graph).adjacency(), length=it))
 
-	# Implementation of page rank for link prediction.
-	def pagerank(self, graph, adjlist, i, j, it=5, df = .85):
-		return 0
+	# Implementation of rooted page rank for link prediction. The distribution of the root i is calculated by a sparse
+	# power iteration of up to it steps with damping factor df.
+	def pagerank(self, graph, adjlist, i, j, it=100, df=.85):
+		return self.row_similarity(graph, i, j, ('pagerank', it, df), lambda: SparsePageRank(EdgeIndex.get(graph).adjacency(), df, max_iterations=it))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+from collections import OrderedDict
+import numpy as np
+from loader.edge_index import EdgeIndex
+
+# Class that stores the similarity scores already calculated for pairs of vertices, so the scores calculated by one
+# step (like the matching) are not calculated again by another one (like the link prediction). The scores are keyed
+# by the graph (the serial of its edge index, that changes with the level and with any edge update) and the similarity
+# method, and each key has a table of the pairs (packed in sorted int64 keys) and their scores, searched by
+# numpy.searchsorted. The stored blocks are merged in the table only when it's searched. The memory is bounded by a
+# number of scores and the tables of the least recently used keys are evicted.
+class SimilarityCache():
+
+	def __init__(self, capacity=2 ** 22):
+		# Maximum number of stored scores.
+		self.capacity = capacity
+		# Dict (in the order of use) that maps (graph, similarity) to a list of blocks of pair keys and scores. The
+		# first block of a searched table is sorted.
+		self.tables = OrderedDict()
+		self.n_scores = 0
+		self.hits = 0
+		self.misses = 0
+
+	# Method that returns the key of the scores of a similarity method for the current state of a graph.
+	def key(self, graph, similarity):
+		return (EdgeIndex.get(graph).serial, similarity.__name__)
+
+	# Method that returns the packed keys (min << 32 | max) of the pairs (sources[k], targets[k]).
+	def pair_keys(self, sources, targets):
+		sources = np.asarray(sources, dtype=np.int64)
+		targets = np.asarray(targets, dtype=np.int64)
+		return (np.minimum(sources, targets) << 32) | np.maximum(sources, targets)
+
+	# Method that stores the scores of the pairs (sources[k], targets[k]).
+	def store(self, key, sources, targets, scores):
+		if(len(scores) == 0):
+			return
+		blocks = self.tables.pop(key, [])
+		blocks.append((self.pair_keys(sources, targets), np.asarray(scores, dtype=np.float64)))
+		# The key is reinserted as the most recently used one.
+		self.tables[key] = blocks
+		self.n_scores += len(scores)
+		# The tables of the least recently used keys are evicted (but not the one that was just stored).
+		while(self.n_scores > self.capacity and len(self.tables) > 1):
+			evicted_key, evicted_blocks = self.tables.popitem(last=False)
+			self.n_scores -= sum([len(block_scores) for block_keys, block_scores in evicted_blocks])
+
+	# Method that merges the blocks of a key in a sorted table. Returns the pair keys and the scores of the table.
+	def table(self, key):
+		blocks = self.tables.pop(key, None)
+		if(blocks is None):
+			return None
+		if(len(blocks) > 1):
+			pair_keys = np.concatenate([block_keys for block_keys, block_scores in blocks])
+			scores = np.concatenate([block_scores for block_keys, block_scores in blocks])
+			pair_keys, first = np.unique(pair_keys, return_index=True)
+			self.n_scores -= len(scores) - len(pair_keys)
+			blocks = [(pair_keys, scores[first])]
+		elif(len(blocks[0][0]) > 1 and (np.diff(blocks[0][0]) < 0).any()):
+			order = np.argsort(blocks[0][0], kind='mergesort')
+			blocks = [(blocks[0][0][order], blocks[0][1][order])]
+		self.tables[key] = blocks
+		return blocks[0]
+
+	# Method that returns the scores of the pairs (sources[k], targets[k]). The pairs that are not stored are calculated
+	# at once by the function (that receives the sources and the targets of the missing pairs) and stored.
+	def pair_scores(self, key, sources, targets, function):
+		sources = np.asarray(sources)
+		targets = np.asarray(targets)
+		scores = np.full(len(sources), np.nan)
+		table = self.table(key)
+		if(table is not None and len(table[0])):
+			table_keys, table_scores = table
+			pair_keys = self.pair_keys(sources, targets)
+			positions = np.minimum(np.searchsorted(table_keys, pair_keys), len(table_keys) - 1)
+			found = table_keys[positions] == pair_keys
+			scores[found] = table_scores[positions[found]]
+		missing = np.isnan(scores)
+		self.hits += len(scores) - np.count_nonzero(missing)
+		self.misses += np.count_nonzero(missing)
+		if(missing.any()):
+			scores[missing] = function(sources[missing], targets[missing])
+			self.store(key, sources[missing], targets[missing], scores[missing])
+		return scores
+
+	# Method that removes all the stored scores.
+	def clear(self):
+		self.tables.clear()
+		self.n_scores = 0
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+import warnings
+import numpy as np
+import scipy.sparse
+import scipy.sparse.linalg
+
+# Class that calculates the katz similarity index, sum(beta^l * A^l) for l >= 1, over a sparse (CSR) adjacency matrix.
+# The scores are calculated for blocks of source vertices (rows) by a truncated power series or by solving the linear
+# system (I - beta * A) x = e for each source vertex (conjugate gradient for symmetric matrices, GMRES otherwise), so the
+# V x V inverse is never built.
+class SparseKatz():
+
+	def __init__(self, adjacency, beta=0.5, method='solve', length=None, tol=1e-8, max_iterations=1000, safety=0.9, block_size=2 ** 22):
+		self.adjacency = adjacency.tocsr().astype(np.float64)
+		# Maximum number of scores calculated in each block of rows (block rows * vertices).
+		self.block_size = block_size
+		self.symmetric = (abs(self.adjacency - self.adjacency.T) > 0).nnz == 0
+		# Method used to calculate the scores. [series - truncated power series, solve - iterative linear solver].
+		self.method = method
+		# Number of terms of the truncated power series. If None, the series is summed until it converges.
+		self.length = length
+		self.tol = tol
+		self.max_iterations = max_iterations
+		self.spectral_radius = None
+		self.beta = beta
+		# The series only converges when beta < 1 / spectral radius, so beta is reduced to a fraction (safety) of this
+		# bound. The truncated series with a fixed length always exists, so its beta is kept. The reduction is reported by
+		# a warning (shown once for each beta by the default filters, instead of once for each graph), and the reduced
+		# beta of the graph is in self.beta.
+		if(method == 'solve' or length is None):
+			spectral_radius = self.estimate_spectral_radius()
+			if(spectral_radius > 0 and beta * spectral_radius >= 1):
+				self.beta = safety / spectral_radius
+				warnings.warn("katz beta = %r doesn't converge, using %r / spectral radius" % (beta, safety), RuntimeWarning)
+		# Matrix of the linear systems (I - beta * A.T) x = e.
+		self.system = None
+		if(method == 'solve'):
+			self.system = scipy.sparse.identity(self.adjacency.shape[0], format='csr') - self.beta * self.adjacency.T.tocsr()
+
+	# Method that estimates the largest eigenvalue (in absolute value) of the adjacency matrix. The maximum degree is an
+	# upper bound used when the estimate doesn't converge. ARPACK starts from the vector of ones (instead of a random
+	# one), so the estimate (and the beta) is the same in every run.
+	def estimate_spectral_radius(self):
+		if(self.spectral_radius is None):
+			n = self.adjacency.shape[0]
+			self.spectral_radius = float(np.abs(self.adjacency).sum(axis=1).max()) if n else 0.0
+			# ARPACK needs at least 3 vertices.
+			if(n >= 3 and self.adjacency.nnz > 0):
+				try:
+					if(self.symmetric):
+						values = scipy.sparse.linalg.eigsh(self.adjacency, k=1, which='LM', tol=1e-4, v0=np.ones(n), return_eigenvectors=False)
+					else:
+						values = scipy.sparse.linalg.eigs(self.adjacency, k=1, which='LM', tol=1e-4, v0=np.ones(n), return_eigenvectors=False)
+					# The estimate is slightly increased, since it's only accurate up to the tolerance.
+					self.spectral_radius = min(float(np.abs(values).max()) * (1 + 1e-3), self.spectral_radius)
+				except scipy.sparse.linalg.ArpackNoConvergence:
+					pass
+		return self.spectral_radius
+
+	# Method that returns the katz scores of the rows (a slice or an array of vertices) against all vertices (a dense
+	# block) or of each pair (rows[k], columns[k]). The pairs are calculated in blocks of their distinct rows.
+	def scores(self, rows, columns=None):
+		n = self.adjacency.shape[0]
+		rows = np.arange(n)[rows]
+		if(columns is None):
+			return self.block(rows)
+		columns = np.asarray(columns)
+		distinct_rows, positions = np.unique(rows, return_inverse=True)
+		scores = np.empty(len(rows))
+		block_rows = max(1, self.block_size // max(n, 1))
+		for start in range(0, len(distinct_rows), block_rows):
+			block = self.block(distinct_rows[start:(start + block_rows)])
+			selected = (positions >= start) & (positions < (start + block_rows))
+			scores[selected] = block[(positions[selected] - start), columns[selected]]
+		return scores
+
+	# Method that returns the katz scores of the rows against all vertices.
+	def block(self, rows):
+		if(self.method == 'series'):
+			return self.series(rows)
+		return self.solve(rows)
+
+	# Method that sums the power series beta * e A + beta^2 * e A^2 + ... for the rows. The series is truncated after
+	# length terms or when the last term is below the tolerance.
+	def series(self, rows):
+		n = self.adjacency.shape[0]
+		term = np.zeros((len(rows), n))
+		term[np.arange(len(rows)), rows] = 1
+		total = np.zeros((len(rows), n))
+		power = 0
+		while(self.length is None or power < self.length):
+			power += 1
+			# (term * A) is calculated as (A.T * term.T).T to keep the sparse matrix on the left.
+			term = self.beta * self.adjacency.T.dot(term.T).T
+			total += term
+			if(self.length is None and (np.abs(term).max() <= self.tol or power >= self.max_iterations)):
+				break
+		return total
+
+	# Method that solves (I - beta * A.T) x = e for each row, so x - e is the row of the katz matrix. The symmetric
+	# systems are solved by a conjugate gradient over all the rows at once, the other ones by GMRES for each row.
+	def solve(self, rows):
+		n = self.adjacency.shape[0]
+		right = np.zeros((n, len(rows)))
+		right[rows, np.arange(len(rows))] = 1
+		if(self.symmetric):
+			solution = self.block_conjugate_gradient(self.system, right)
+		else:
+			solution = np.empty((n, len(rows)))
+			for k in range(len(rows)):
+				solution[:, k], info = scipy.sparse.linalg.gmres(self.system, right[:, k], tol=self.tol, maxiter=self.max_iterations)
+		return (solution - right).T
+
+	# Method that runs the conjugate gradient for the columns of the right side at once. Each column has its own step
+	# sizes, so it's the same of running the method for each column.
+	def block_conjugate_gradient(self, system, right):
+		solution = np.zeros_like(right)
+		residual = right.copy()
+		direction = residual.copy()
+		residual_norms = (residual * residual).sum(axis=0)
+		stop = (self.tol ** 2) * np.maximum(residual_norms, 1e-300)
+		for iteration in range(self.max_iterations):
+			active = residual_norms > stop
+			if(not active.any()):
+				break
+			product = system.dot(direction)
+			curvature = (direction * product).sum(axis=0)
+			alpha = np.divide(residual_norms, curvature, out=np.zeros_like(residual_norms), where=(active & (curvature > 0)))
+			solution += alpha * direction
+			residual -= alpha * product
+			new_norms = (residual * residual).sum(axis=0)
+			gamma = np.divide(new_norms, residual_norms, out=np.zeros_like(new_norms), where=(residual_norms > 0))
+			direction = residual + gamma * direction
+			residual_norms = new_norms
+		return solution
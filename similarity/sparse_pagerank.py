@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+import numpy as np
+import scipy.sparse
+
+# Class that calculates the rooted pagerank similarity index over a sparse (CSR) adjacency matrix. The rooted pagerank
+# of a root i is the stationary distribution of a random walk that, at each step, goes back to i with probability
+# (1 - damping). The distributions are calculated for blocks of roots (rows) at once by a sparse power iteration.
+class SparsePageRank():
+
+	def __init__(self, adjacency, damping=0.85, tol=1e-6, max_iterations=100, block_size=2 ** 22):
+		self.adjacency = adjacency.tocsr().astype(np.float64)
+		self.damping = damping
+		self.tol = tol
+		self.max_iterations = max_iterations
+		# Maximum number of scores calculated in each block of rows (block rows * vertices).
+		self.block_size = block_size
+		self.symmetric = (abs(self.adjacency - self.adjacency.T) > 0).nnz == 0
+		self.degrees = np.asarray(self.adjacency.sum(axis=1), dtype=np.float64).ravel()
+		# Transposed transition matrix (P.T, P = D^-1 A), so the step of the walk is P.T * x.
+		inverse_degrees = np.divide(1, self.degrees, out=np.zeros_like(self.degrees), where=(self.degrees > 0))
+		self.transition = (scipy.sparse.diags(inverse_degrees) * self.adjacency).T.tocsr()
+		# The walks that reach a vertex without edges go back to the root.
+		self.dangling = self.degrees == 0
+
+	# Method that returns the similarities of the rows (a slice or an array of roots) against all vertices (a dense
+	# block) or of each pair (rows[k], columns[k]). The pairs are calculated in blocks of their distinct rows.
+	def scores(self, rows, columns=None):
+		n = self.adjacency.shape[0]
+		rows = np.arange(n)[rows]
+		if(columns is None):
+			return self.block(rows)
+		columns = np.asarray(columns)
+		distinct_rows, positions = np.unique(rows, return_inverse=True)
+		scores = np.empty(len(rows))
+		block_rows = max(1, self.block_size // max(n, 1))
+		for start in range(0, len(distinct_rows), block_rows):
+			block = self.block(distinct_rows[start:(start + block_rows)])
+			selected = (positions >= start) & (positions < (start + block_rows))
+			scores[selected] = block[(positions[selected] - start), columns[selected]]
+		return scores
+
+	# Method that returns the symmetric similarities pi_i(j) + pi_j(i) of the rows against all vertices. In undirected
+	# graphs d_i * pi_i(j) = d_j * pi_j(i) (detailed balance), so both terms are taken from the row of i. In directed
+	# graphs the similarity is only pi_i(j).
+	def block(self, rows):
+		distributions = self.rooted_pagerank(rows)
+		if(not self.symmetric):
+			return distributions
+		ratios = np.divide(self.degrees[rows][:, np.newaxis], self.degrees[np.newaxis, :],
+						   out=np.zeros((len(rows), len(self.degrees))), where=(self.degrees[np.newaxis, :] > 0))
+		return distributions * (1 + ratios)
+
+	# Method that calculates the rooted pagerank distributions of the rows by a power iteration over all the rows at
+	# once. It stops when the change of every distribution (L1 norm) is below the tolerance.
+	def rooted_pagerank(self, rows):
+		n = self.adjacency.shape[0]
+		restart = np.zeros((n, len(rows)))
+		restart[rows, np.arange(len(rows))] = 1
+		distributions = restart.copy()
+		for iteration in range(self.max_iterations):
+			lost = distributions[self.dangling].sum(axis=0)
+			walked = self.damping * self.transition.dot(distributions)
+			updated = walked + restart * ((1 - self.damping) + (self.damping * lost))
+			change = np.abs(updated - distributions).sum(axis=0).max() if len(rows) else 0
+			distributions = updated
+			if(change <= self.tol):
+				break
+		return distributions.T
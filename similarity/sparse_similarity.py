@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, absolute_import
+import numpy as np
+import scipy.sparse
+from loader.edge_index import EdgeIndex
+from similarity.sparse_katz import SparseKatz
+from similarity.sparse_pagerank import SparsePageRank
+from similarity.monte_carlo_simrank import MonteCarloSimRank
+
+# Class that calculates the local similarity indices for blocks of vertices at once. The scores are calculated as sparse
+# matrix products over the adjacency matrix of the graph instead of set intersections for each pair of vertices.
+class SparseSimilarity():
+
+	# Indices calculated from the neighborhoods of each pair, so the scores of a pair don't depend on the rest of the
+	# graph. The other indices (like katz) are global: they depend on the whole graph that is loaded.
+	local_indices = ['common_neighbors', 'jaccard_index', 'salton_index', 'adamic_adar', 'preferential_attachment']
+
+	def __init__(self, block_size=2 ** 22, similarity_cache=None):
+		# Maximum number of scores calculated in each block of rows (block rows * vertices).
+		self.block_size = block_size
+		# Cache that receives the scores of the edges, which are calculated by the blocks but not predicted.
+		self.similarity_cache = similarity_cache
+		# Sparse adjacency matrix (CSR) of the loaded graph and its degrees.
+		self.adjacency = None
+		self.degrees = None
+		self.set_degrees = None
+		# Dict that maps the name of the similarity methods of the Similarity class to their batch implementations.
+		self.indices = {'common_neighbors': self.common_neighbors, 'jaccard_index': self.jaccard_index,
+						'salton_index': self.salton_index, 'adamic_adar': self.adamic_adar,
+						'preferential_attachment': self.preferential_attachment, 'katz_index': self.katz_index,
+						'lowmem_katz_index': self.lowmem_katz_index, 'weighted_lowmem_katz_index': self.weighted_lowmem_katz_index,
+						'simrank': self.simrank, 'pagerank': self.pagerank}
+		# Weights of the edges in the same order of the data of the adjacency matrix.
+		self.edge_weights = None
+		# Dict that stores the engines of the global indices over the loaded graph. They are created when the indices
+		# are used.
+		self.engines = {}
+		# Seed of the random indices, so all the blocks (and the worker processes) of a graph use the same samples.
+		self.seed = None
+
+	# Method that tests if a similarity method of the Similarity class has a batch implementation.
+	def supports(self, similarity):
+		return similarity.__name__ in self.indices
+
+	# Method that loads the adjacency matrix of the graph (without weights and multiple edges), the edge weights and the
+	# degrees used by the similarity indices. Complexity = O(V + E)
+	def load_graph(self, graph):
+		edge_index = EdgeIndex.get(graph)
+		adjacency = edge_index.adjacency()
+		self.adjacency = adjacency
+		rows = np.repeat(np.arange(adjacency.shape[0]), np.diff(adjacency.indptr))
+		self.edge_weights = edge_index.weights_of(rows, adjacency.indices).astype(np.float64)
+		self.engines = {}
+		self.seed = np.random.randint(0, (2 ** 31) - 1)
+		# The degrees follow the graph (like graph.degree), the set degrees follow the adjacency lists.
+		self.degrees = np.array(graph.degree(), dtype=np.float64)
+		self.set_degrees = np.asarray(adjacency.sum(axis=1), dtype=np.float64).ravel()
+
+	############################
+	#      Block handling      #
+	############################
+
+	# Method that counts the common neighbors of the rows against all vertices (a dense block) or of each pair
+	# (rows[k], columns[k]). The common neighbors can be weighted by a value for each vertex.
+	def intersection(self, rows, columns=None, weights=None):
+		sources = self.adjacency[rows]
+		if(weights is not None):
+			sources = sources * scipy.sparse.diags(weights)
+		if(columns is None):
+			return (sources * self.adjacency.T).toarray()
+		return np.asarray(sources.multiply(self.adjacency[columns]).sum(axis=1), dtype=np.float64).ravel()
+
+	# Method that combines a value of each vertex of the rows with the values of all vertices (a dense block) or with
+	# the values of each column.
+	def combine(self, values, rows, columns, function):
+		if(columns is None):
+			return function(values[rows][:, np.newaxis], values[np.newaxis, :])
+		return function(values[rows], values[columns])
+
+	# Method that yields the scores of the pairs (v, u), v < u, that are not edges of the graph. The pairs are yielded
+	# in blocks of rows as three arrays: sources, targets and scores. If a threshold is given, only the pairs with a
+	# score greater than the threshold are yielded.
+	def predict_blocks(self, graph, similarity, threshold=None):
+		self.load_graph(graph)
+		if(self.similarity_cache is None):
+			return self.predict_rows(similarity.__name__, 0, graph.vcount(), threshold)
+		return self.predict_rows_to_cache(self.similarity_cache.key(graph, similarity), similarity.__name__, 0, graph.vcount(), threshold)
+
+	# Method that yields the blocks like the method below and stores the scores of the edges of each block in the
+	# similarity cache, so a matching with the same index doesn't calculate them again.
+	def predict_rows_to_cache(self, key, name, first, last, threshold=None):
+		edge_blocks = []
+		for block in self.predict_rows(name, first, last, threshold, edge_blocks):
+			while(edge_blocks):
+				self.similarity_cache.store(key, *edge_blocks.pop())
+			yield block
+
+	# Method that yields the scores of the pairs (v, u), v < u, that are not edges of the loaded graph, for the source
+	# vertices in the range [first, last). The rows are split in blocks like in the method above. If a list of edge
+	# blocks is given, the scores of the edges (v, u), v < u, of each block are appended to it.
+	def predict_rows(self, name, first, last, threshold=None, edge_blocks=None):
+		index = self.indices[name]
+		n = self.adjacency.shape[0]
+		block_rows = max(1, self.block_size // max(n, 1))
+		for start in range(first, last, block_rows):
+			end = min(last, start + block_rows)
+			scores = index(slice(start, end))
+			# Only the pairs above the main diagonal that are not edges are predicted.
+			mask = np.arange(n)[np.newaxis, :] > np.arange(start, end)[:, np.newaxis]
+			edge_sources, edge_targets = self.adjacency[start:end].nonzero()
+			mask[edge_sources, edge_targets] = False
+			if(edge_blocks is not None):
+				upper = edge_targets > (edge_sources + start)
+				edge_sources, edge_targets = edge_sources[upper], edge_targets[upper]
+				edge_blocks.append(((edge_sources + start), edge_targets, scores[edge_sources, edge_targets]))
+			if(threshold is not None):
+				mask &= (scores > threshold)
+			sources, targets = np.nonzero(mask)
+			yield (sources + start), targets, scores[sources, targets]
+
+	# Method that calculates the scores of the pairs (sources[k], targets[k]) of the loaded graph.
+	def pair_scores(self, similarity, sources, targets):
+		return self.indices[similarity.__name__](sources, targets)
+
+	############################
+	# Local Similarity Indices #
+	############################
+
+	# Implementation of common neighbors similarity index for link prediction.
+	def common_neighbors(self, rows, columns=None):
+		return self.intersection(rows, columns)
+
+	# Implementation of jaccard similarity index for link prediction.
+	def jaccard_index(self, rows, columns=None):
+		isect = self.intersection(rows, columns)
+		union = self.combine(self.set_degrees, rows, columns, np.add) - isect
+		# Tests if the union of the two sets is not empty.
+		return np.divide(isect, union, out=np.zeros_like(isect), where=(union != 0))
+
+	# Implementation of salton similarity index for link prediction.
+	def salton_index(self, rows, columns=None):
+		isect = self.intersection(rows, columns)
+		product = self.combine(self.degrees, rows, columns, np.multiply)
+		return np.divide(isect, np.sqrt(product), out=np.zeros_like(isect), where=(product != 0))
+
+	# Implementation of adamic adar similarity index for link prediction.
+	def adamic_adar(self, rows, columns=None):
+		weights = np.zeros(len(self.degrees))
+		# Vertices with degree 0 or 1 don't contribute to the score.
+		valid = self.degrees > 1
+		weights[valid] = 1 / np.log(self.degrees[valid])
+		return self.intersection(rows, columns, weights)
+
+	# Implementation of preferential attachment similarity index for link prediction.
+	def preferential_attachment(self, rows, columns=None):
+		return self.combine(self.degrees, rows, columns, np.multiply)
+
+	#############################
+	# Global Similarity Indices #
+	#############################
+
+	# Method that returns the engine of a global index over the loaded graph. The engine is created by the function
+	# when the index is used for the first time.
+	def engine(self, name, create_engine):
+		if(name not in self.engines):
+			self.engines[name] = create_engine()
+		return self.engines[name]
+
+	# Method that returns the adjacency matrix of the loaded graph with the edge weights as values.
+	def weighted_adjacency(self):
+		return scipy.sparse.csr_matrix((self.edge_weights, self.adjacency.indices, self.adjacency.indptr), shape=self.adjacency.shape)
+
+	# Implementation of standard katz similarity index for link prediction. The rows are calculated by an iterative
+	# solver over the sparse adjacency matrix, so the scores are the same of the inverse (I - beta * A)^-1 - I.
+	def katz_index(self, rows, columns=None, beta=0.5):
+		return self.engine('katz_index', lambda: SparseKatz(self.adjacency, beta)).scores(rows, columns)
+
+	# Implementation of a truncated katz similarity index for link prediction. The paths of up to l edges are counted
+	# by l products of the adjacency matrix and the block of rows.
+	def lowmem_katz_index(self, rows, columns=None, l=3, beta=0.5):
+		return self.engine('lowmem_katz_index', lambda: SparseKatz(self.adjacency, beta, 'series', l)).scores(rows, columns)
+
+	# Implementation of a truncated katz similarity index for link prediction over the weighted adjacency matrix, so
+	# the weight of a path is the product of the weights of its edges.
+	def weighted_lowmem_katz_index(self, rows, columns=None, l=3, beta=0.5):
+		return self.engine('weighted_lowmem_katz_index', lambda: SparseKatz(self.weighted_adjacency(), beta, 'series', l)).scores(rows, columns)
+
+	# Implementation of simrank index for link prediction. The scores are estimated by Monte Carlo fingerprints of
+	# random walks of up to it steps.
+	def simrank(self, rows, columns=None, it=5):
+		return self.engine('simrank', lambda: MonteCarloSimRank(self.adjacency, length=it, seed=self.seed)).scores(rows, columns)
+
+	# Implementation of rooted page rank for link prediction. The distributions of the roots are calculated by a sparse
+	# power iteration of up to it steps with damping factor df.
+	def pagerank(self, rows, columns=None, it=100, df=.85):
+		return self.engine('pagerank', lambda: SparsePageRank(self.adjacency, df, max_iterations=it)).scores(rows, columns)
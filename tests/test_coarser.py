@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+import unittest
+import numpy as np
+from igraph import Graph
+from coarsening.coarser import Coarser
+from coarsening.matching import Matching
+from similarity.similarity import Similarity
+
+# Tests of the contraction of the coarser against a contraction of each edge by a dict of the coarsed edges.
+class CoarserTest(unittest.TestCase):
+
+    # Method that creates a random graph with edge weights.
+    def create_graph(self, seed, n=60, p=0.08):
+        random_state = np.random.RandomState(seed)
+        sources, targets = np.triu_indices(n, 1)
+        mask = random_state.random_sample(len(sources)) < p
+        graph = Graph(n=n, edges=zip(sources[mask].tolist(), targets[mask].tolist()))
+        graph.es['weight'] = random_state.randint(1, 4, size=graph.ecount()).tolist()
+        graph['successors'] = range(n)
+        graph['level'] = 0
+        return graph
+
+    # Method that contracts the graph by the matching one edge at a time. Returns the number of vertices, a dict of
+    # the coarsed edges (v, u), v < u, and their weights and the successors of the original vertices.
+    def reference_coarsening(self, graph, matching, original_successors):
+        successors = range(graph.vcount())
+        n_vertices = 0
+        for i in range(len(matching)):
+            if(i <= matching[i]):
+                successors[i] = n_vertices
+                n_vertices += 1
+            else:
+                successors[i] = successors[matching[i]]
+        weights = {}
+        for edge in graph.es:
+            new_source, new_target = successors[edge.source], successors[edge.target]
+            if(new_source != new_target):
+                key = (min(new_source, new_target), max(new_source, new_target))
+                weights[key] = weights.get(key, 0) + edge['weight']
+        return n_vertices, weights, [successors[successor] for successor in original_successors]
+
+    # The coarsed graphs of the pairwise and the cluster matchings are the same of the reference, level by level.
+    def test_contraction(self):
+        similarity = Similarity()
+        for seed in range(5):
+            random.seed(seed)
+            np.random.seed(seed)
+            matching = Matching(max_cluster_size=4)
+            for matching_method in [matching.random_matching, matching.heavy_edge_matching, matching.greedy_light_edge_matching,
+                                    matching.most_similar_edge_matching, matching.label_propagation_matching, matching.twin_vertex_matching]:
+                graph = self.create_graph(seed)
+                for level in range(3):
+                    matching_array = matching_method(graph, similarity.common_neighbors)
+                    n_vertices, weights, successors = self.reference_coarsening(graph, matching_array, graph['successors'])
+                    coarsed_graph = Coarser().coarserning(graph, matching_array)
+                    self.assertEqual(coarsed_graph.vcount(), n_vertices)
+                    self.assertEqual(dict(((edge.source, edge.target), edge['weight']) for edge in coarsed_graph.es), weights)
+                    self.assertEqual(list(coarsed_graph['successors']), successors)
+                    self.assertEqual(coarsed_graph['level'], level + 1)
+                    graph = coarsed_graph
+
+# Tests of the matchings.
+class MatchingTest(unittest.TestCase):
+
+    # Method that creates a random graph with few distinct edge weights, so there are many ties.
+    def create_graph(self, seed, n=80, p=0.06):
+        random_state = np.random.RandomState(seed)
+        sources, targets = np.triu_indices(n, 1)
+        mask = random_state.random_sample(len(sources)) < p
+        graph = Graph(n=n, edges=zip(sources[mask].tolist(), targets[mask].tolist()))
+        graph.es['weight'] = random_state.randint(1, 4, size=graph.ecount()).tolist()
+        return graph
+
+    # Method that matches the edges greedily in the order of their priorities (the ties by the edge order).
+    def greedy_matching(self, vcount, sources, targets, priorities):
+        matching = range(vcount)
+        for i in sorted(range(len(priorities)), key=lambda i: -priorities[i]):
+            if(matching[sources[i]] == sources[i] and matching[targets[i]] == targets[i]):
+                matching[sources[i]] = targets[i]
+                matching[targets[i]] = sources[i]
+        return matching
+
+    # The handshake rounds give the same matching of the greedy one, also when the remaining edges are matched after
+    # the last round.
+    def test_handshake_matching(self):
+        for seed in range(5):
+            graph = self.create_graph(seed)
+            sources, targets = np.array(graph.get_edgelist(), dtype=np.int64).T
+            priorities = np.random.RandomState(seed).permutation(len(sources)).astype(np.float64)
+            expected = self.greedy_matching(graph.vcount(), sources.tolist(), targets.tolist(), priorities.tolist())
+            for max_rounds in [32, 1, 0]:
+                matching = Matching().handshake_matching(graph.vcount(), sources, targets, priorities, max_rounds)
+                self.assertEqual(list(matching), expected)
+
+    # The HEM and the LEM match each visited vertex to the unmatched neighbor with the heaviest (or lightest) edge.
+    def test_heavy_and_light_edge_matching(self):
+        for seed in range(5):
+            graph = self.create_graph(seed)
+            adjlist = graph.get_adjlist()
+            for matching_method, best in [(Matching().heavy_edge_matching, max), (Matching().light_edge_matching, min)]:
+                random.seed(seed)
+                matching = matching_method(graph, None)
+                random.seed(seed)
+                order = random.sample(range(graph.vcount()), graph.vcount())
+                visited = set()
+                for vertex in order:
+                    if(vertex in visited):
+                        continue
+                    visited.add(vertex)
+                    unmatched = [neighbor for neighbor in adjlist[vertex] if neighbor not in visited]
+                    if(not unmatched):
+                        self.assertEqual(matching[vertex], vertex)
+                        continue
+                    weight = best([graph[vertex, neighbor] for neighbor in unmatched])
+                    self.assertEqual(graph[vertex, matching[vertex]], weight)
+                    self.assertEqual(matching[matching[vertex]], vertex)
+                    visited.add(matching[vertex])
+
+if __name__ == '__main__':
+    unittest.main()
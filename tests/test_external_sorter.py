@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+import numpy as np
+from loader.iohandler import ranking_dtype
+from loader.external_sorter import ExternalSorter
+
+# Tests of the external sort of the rankings, with memory budgets small enough to split the files in many chunks.
+class ExternalSorterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, "ranking")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Method that creates a ranking with repeated scores and vertices of different number of digits, so the chunks
+    # have lines of different widths.
+    def create_ranking(self, seed, n=2000):
+        random_state = np.random.RandomState(seed)
+        records = np.empty(n, dtype=ranking_dtype)
+        records['source'] = random_state.random_sample(n) * (10 ** random_state.randint(1, 7, size=n))
+        records['target'] = random_state.randint(0, 10 ** 6, size=n)
+        records['score'] = random_state.randint(0, 50, size=n) / 7.0
+        return records
+
+    # The text chunks of different line widths are merged in the same order of a stable sort.
+    def test_text_sort_with_many_chunks(self):
+        for seed in range(10):
+            records = self.create_ranking(seed)
+            lines = ["%d %d %r\n" % (source, target, score) for source, target, score in records.tolist()]
+            with open(self.path, 'wb') as ranking_file:
+                ranking_file.writelines(lines)
+            ExternalSorter(ranking_dtype, workers=2, memory_budget=4096).sort(self.path, binary=False)
+            order = np.argsort(-records['score'], kind='mergesort')
+            with open(self.path, 'rb') as ranking_file:
+                self.assertEqual(ranking_file.readlines(), [lines[i] for i in order])
+
+    # The binary chunks are merged in the same order of a stable sort, also when only the first records are kept.
+    def test_binary_sort_with_many_chunks(self):
+        for seed in range(10):
+            records = self.create_ranking(seed)
+            records.tofile(self.path)
+            top_path = self.path + ".top"
+            ExternalSorter(ranking_dtype, workers=2, memory_budget=4096).sort(self.path, top_path, top=100)
+            ExternalSorter(ranking_dtype, workers=2, memory_budget=4096).sort(self.path)
+            expected = records[np.argsort(-records['score'], kind='mergesort')]
+            self.assertTrue(np.array_equal(np.fromfile(self.path, dtype=ranking_dtype), expected))
+            self.assertTrue(np.array_equal(np.fromfile(top_path, dtype=ranking_dtype), expected[:100]))
+
+if __name__ == '__main__':
+    unittest.main()
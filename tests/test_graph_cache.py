@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+import numpy as np
+from igraph import Graph
+from loader.edge_index import EdgeIndex
+from loader.graph_cache import GraphCache
+from loader.graph_loader import GraphLoader
+from loader.ncol_stream_reader import NcolStreamReader
+
+# Tests of the index of the edges of a graph against the igraph queries.
+class EdgeIndexTest(unittest.TestCase):
+
+    # The edge queries (one by one and in arrays) are the same of graph[v, u], in both orientations of the pairs,
+    # also after edges are deleted and added.
+    def test_queries(self):
+        random_state = np.random.RandomState(0)
+        sources, targets = np.triu_indices(30, 1)
+        mask = random_state.random_sample(len(sources)) < 0.2
+        graph = Graph(n=30, edges=zip(sources[mask].tolist(), targets[mask].tolist()))
+        graph.es['weight'] = random_state.randint(1, 9, size=graph.ecount()).tolist()
+        edge_index = EdgeIndex.get(graph)
+        edge_index.delete_edges(graph, graph.get_edgelist()[:5])
+        absent = zip(sources[~mask].tolist(), targets[~mask].tolist())[:2]
+        edge_index.add_edges(graph, [absent[0], absent[1][::-1]], [11, 12])
+        self.assertIs(EdgeIndex.get(graph), edge_index)
+        pairs_sources, pairs_targets = np.meshgrid(np.arange(30), np.arange(30))
+        pairs_sources, pairs_targets = pairs_sources.ravel(), pairs_targets.ravel()
+        expected = [graph[v, u] for v, u in zip(pairs_sources.tolist(), pairs_targets.tolist())]
+        self.assertEqual([edge_index.weight(v, u) for v, u in zip(pairs_sources.tolist(), pairs_targets.tolist())], expected)
+        self.assertEqual(edge_index.weights_of(pairs_sources, pairs_targets).tolist(), expected)
+        self.assertEqual(edge_index.contains_pairs(pairs_sources, pairs_targets).tolist(), [weight != 0 for weight in expected])
+        edge_sources, edge_targets, weights = edge_index.edges()
+        self.assertEqual(sorted(zip(edge_sources.tolist(), edge_targets.tolist(), weights.tolist())),
+                         sorted((edge.source, edge.target, edge['weight']) for edge in graph.es))
+        # A copy of the graph has its own index.
+        copy = graph.copy()
+        self.assertIsNot(EdgeIndex.get(copy), edge_index)
+
+# Tests of the binary cache of the networks and of the streaming reader of the .ncol networks.
+class GraphCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.file = os.path.join(self.directory, "network.ncol")
+        self.graph_cache = GraphCache(os.path.join(self.directory, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Method that writes a .ncol network with named vertices, self edges and duplicated edges (in both orientations and
+    # with different weights).
+    def write_network(self, seed, n=50, m=300, weighted=True):
+        random_state = np.random.RandomState(seed)
+        with open(self.file, 'w') as network_file:
+            for source, target, weight in zip(random_state.randint(0, n, size=m), random_state.randint(0, n, size=m), random_state.randint(1, 5, size=m)):
+                if(weighted):
+                    network_file.write("v%d v%d %d\n" % (source * 7, target * 7, weight))
+                else:
+                    network_file.write("v%d v%d\n" % (source * 7, target * 7))
+
+    # Method that returns the names of the vertices and a dict of the edges of a graph, by the names of their vertices,
+    # and their weights (the last weight of the duplicated edges, like graph[v, u]).
+    def named_edges(self, graph):
+        names = graph.vs['name']
+        weights = EdgeIndex.get(graph).weights_by_key
+        return names, dict(((names[key >> 32], names[key & 0xFFFFFFFF]), weight) for key, weight in weights.items())
+
+    # The graph loaded from the cache is the same of the graph read from the file, in the first and in the next loads.
+    def test_load(self):
+        self.write_network(0)
+        graph = Graph.Read_Ncol(self.file, directed=False)
+        calls = []
+        read_graph = lambda: calls.append(True) or Graph.Read_Ncol(self.file, directed=False)
+        for load in range(2):
+            cached_graph = self.graph_cache.load(self.file, 'undirected_ncol', read_graph)
+            self.assertEqual(cached_graph.vs['name'], graph.vs['name'])
+            self.assertEqual(sorted(cached_graph.get_edgelist()), sorted(graph.get_edgelist()))
+            self.assertEqual(self.named_edges(cached_graph), self.named_edges(graph))
+        self.assertEqual(len(calls), 1)
+        # The cache of a changed file is built again.
+        self.write_network(1)
+        cached_graph = self.graph_cache.load(self.file, 'undirected_ncol', read_graph)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.named_edges(cached_graph), self.named_edges(Graph.Read_Ncol(self.file, directed=False)))
+
+    # The streamed network (read in many chunks and buckets) is the network read by igraph without its self edges and
+    # with its duplicated edges merged.
+    def test_ncol_stream_reader(self):
+        for weighted in [True, False]:
+            self.write_network(2, weighted=weighted)
+            graph = GraphLoader().load_unipartite_undirected_ncol(self.file)
+            reader = NcolStreamReader(self.graph_cache, chunk_lines=4, bucket_bits=2, tempdir=self.directory, verbose=False)
+            header = reader.write(self.file, 'streamed_ncol')
+            streamed_graph = self.graph_cache.build_graph(self.file, 'streamed_ncol', header)
+            self.assertEqual(header['weighted'], weighted)
+            self.assertFalse(any(streamed_graph.is_loop()) or any(streamed_graph.is_multiple()))
+            self.assertEqual(self.named_edges(streamed_graph), self.named_edges(graph))
+            # The loader builds the same network from the cache.
+            streamed_graph = GraphLoader(self.graph_cache).load_unipartite_undirected_ncol_streaming(self.file)
+            self.assertEqual(self.named_edges(streamed_graph), self.named_edges(graph))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import json
+import random
+import shutil
+import unittest
+from tempfile import mkdtemp
+import numpy as np
+from igraph import Graph
+from coarsening.coarser import Coarser
+from coarsening.matching import Matching
+from coarsening.hierarchy import Hierarchy
+from coarsening.hierarchy_store import HierarchyStore
+
+# Tests of the store of the coarsed levels.
+class HierarchyStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.file = os.path.join(self.directory, "network.ncol")
+        with open(self.file, 'w') as network_file:
+            network_file.write("0 1\n")
+        self.hierarchy_store = HierarchyStore(os.path.join(self.directory, "store"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Method that creates a random graph of the level 0.
+    def create_graph(self, seed, n=80, p=0.06):
+        random_state = np.random.RandomState(seed)
+        sources, targets = np.triu_indices(n, 1)
+        mask = random_state.random_sample(len(sources)) < p
+        graph = Graph(n=n, edges=zip(sources[mask].tolist(), targets[mask].tolist()))
+        graph['successors'] = range(n)
+        graph['level'] = 0
+        return graph
+
+    # Method that returns the edges of a graph, v < u, with their weights.
+    def weighted_edges(self, graph):
+        return sorted((min(edge.tuple), max(edge.tuple), edge['weight']) for edge in graph.es)
+
+    # Method that coarses the levels of the graph through the store. Returns the graphs of the levels and the number
+    # of levels coarsed by the matching.
+    def coarsen_levels(self, graph, fold_key, levels=3):
+        coarsed = []
+        graphs = [graph]
+        def coarsen(graph):
+            coarsed.append(graph['level'] + 1)
+            return Coarser().coarserning(graph, Matching().heavy_edge_matching(graph, None))
+        for level in range(1, levels + 1):
+            graphs.append(self.hierarchy_store.coarsen(graphs[-1], fold_key, 'heavy_edge_matching', level, coarsen))
+        return graphs, len(coarsed)
+
+    # The stored levels are loaded with the same edges, weights, successors and hierarchy of the coarsed ones, and they
+    # are not coarsed again.
+    def test_round_trip(self):
+        random.seed(0)
+        graph = self.create_graph(0)
+        fold_key = self.hierarchy_store.fold_key(self.file, [(0, 1), (5, 3)])
+        self.assertEqual(fold_key, self.hierarchy_store.fold_key(self.file, [(3, 5), (0, 1)]))
+        self.assertNotEqual(fold_key, self.hierarchy_store.fold_key(self.file, [(0, 1)]))
+        coarsed_graphs, coarsed = self.coarsen_levels(graph, fold_key)
+        self.assertEqual(coarsed, 3)
+        loaded_graphs, coarsed = self.coarsen_levels(self.create_graph(0), fold_key)
+        self.assertEqual(coarsed, 0)
+        for coarsed_graph, loaded_graph in zip(coarsed_graphs[1:], loaded_graphs[1:]):
+            self.assertEqual(loaded_graph['level'], coarsed_graph['level'])
+            self.assertEqual(loaded_graph.vcount(), coarsed_graph.vcount())
+            self.assertEqual(self.weighted_edges(loaded_graph), self.weighted_edges(coarsed_graph))
+            self.assertEqual(list(loaded_graph['successors']), list(coarsed_graph['successors']))
+            self.assertEqual(Hierarchy.get(loaded_graph).membership().tolist(), Hierarchy.get(coarsed_graph).membership().tolist())
+        # The levels of other versions are coarsed again.
+        header_path = os.path.join(self.hierarchy_store.level_path(fold_key, 'heavy_edge_matching', 2), "header.json")
+        with open(header_path) as header_file:
+            header = json.load(header_file)
+        header['version'] = HierarchyStore.version - 1
+        with open(header_path, 'w') as header_file:
+            json.dump(header, header_file)
+        self.assertIsNone(self.hierarchy_store.load(fold_key, 'heavy_edge_matching', 2))
+        loaded_graphs, coarsed = self.coarsen_levels(self.create_graph(0), fold_key)
+        self.assertEqual(coarsed, 1)
+        self.assertIsNotNone(self.hierarchy_store.load(fold_key, 'heavy_edge_matching', 2))
+
+if __name__ == '__main__':
+    unittest.main()
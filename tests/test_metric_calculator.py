@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import unittest
+from tempfile import mkdtemp
+import numpy as np
+from loader.iohandler import IOHandler, ranking_dtype
+from linkprediction.metric_calculator import MetricCalculator
+from linkprediction.ranking import TopKRanking
+
+# Tests of the AUC calculations: the exact AUC, the sampled AUC of the binary rankings and the AUC of the top-K rankings.
+class MetricCalculatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = mkdtemp()
+        self.path = os.path.join(self.directory, "ranking")
+        self.metric_calculator = MetricCalculator()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    # Method that creates a ranking of the pairs (v, u), v < u, of n vertices with scores of few distinct values (exact
+    # in the float32 of the binary rankings), so there are many ties. Returns the predicted edges and a probe set.
+    def create_ranking(self, seed, n=30, probe_size=40):
+        random_state = np.random.RandomState(seed)
+        sources, targets = np.triu_indices(n, 1)
+        scores = random_state.randint(0, 8, size=len(sources)) / 8.0
+        predicted_edges = dict(zip(zip(sources.tolist(), targets.tolist()), scores.tolist()))
+        probe = random_state.choice(len(sources), probe_size, replace=False)
+        # The probe edges have higher scores, so the AUC isn't 0.5.
+        for i in probe.tolist():
+            predicted_edges[(sources[i], targets[i])] = min(1.0, predicted_edges[(sources[i], targets[i])] + 0.25)
+        return predicted_edges, set(zip(sources[probe].tolist(), targets[probe].tolist()))
+
+    # Method that writes the predicted edges in a binary ranking and opens it for reading.
+    def write_ranking(self, predicted_edges):
+        io_handler = IOHandler(binary=True)
+        io_handler.load_output_file(self.path)
+        io_handler.write_predicted_edges(predicted_edges)
+        io_handler.close_files()
+        io_handler.load_input_file(self.path)
+        return io_handler
+
+    # Method that calculates the AUC by comparing every probe score with every non-existent score.
+    def brute_force_auc(self, probe_scores, non_existent_scores):
+        comparisons = [1.0 if probe > other else (0.5 if probe == other else 0.0) for probe in probe_scores for other in non_existent_scores]
+        return sum(comparisons) / len(comparisons)
+
+    # The exact AUC is the Mann-Whitney statistic, given the non-existent scores or their distinct values and counts.
+    def test_exact_auc(self):
+        random_state = np.random.RandomState(0)
+        probe_scores = random_state.randint(0, 5, size=30)
+        non_existent_scores = random_state.randint(0, 5, size=70)
+        expected = self.brute_force_auc(probe_scores, non_existent_scores)
+        self.assertAlmostEqual(self.metric_calculator.calculate_exact_auc(probe_scores, non_existent_scores), expected)
+        values, counts = np.unique(non_existent_scores, return_counts=True)
+        self.assertAlmostEqual(self.metric_calculator.calculate_exact_auc(probe_scores, values[::-1], counts[::-1]), expected)
+        self.assertEqual(self.metric_calculator.calculate_exact_auc([], non_existent_scores), 0.5)
+
+    # The sampled AUC of a binary ranking agrees with the exact AUC: it's exact when the probe edges are ranked
+    # apart from the non-existent ones and its mean over many seeds is the exact AUC.
+    def test_sampled_auc_agrees_with_exact_auc(self):
+        predicted_edges, edges_probe_set = self.create_ranking(0)
+        exact_auc = self.metric_calculator.calculate_exact_auc_from_edges(predicted_edges, edges_probe_set)
+        io_handler = self.write_ranking(predicted_edges)
+        aucs = [self.metric_calculator.calculate_auc_from_sample(edges_probe_set, io_handler, 40, seed, block_size=100) for seed in range(300)]
+        io_handler.close_files()
+        self.assertAlmostEqual(np.mean(aucs), exact_auc, delta=0.01)
+        # The same seed gives the same sample and the smaller n use the first comparisons of the sample.
+        io_handler.load_input_file(self.path)
+        aucs = self.metric_calculator.calculate_aucs_from_sample(edges_probe_set, io_handler, [10, 40], seed=7)
+        self.assertEqual(aucs[1], self.metric_calculator.calculate_auc_from_sample(edges_probe_set, io_handler, 40, seed=7))
+        probe_values, predicted_values = self.metric_calculator.sample_ranking(edges_probe_set, io_handler, 40, seed=7)
+        comparisons = [1.0 if probe > other else (0.5 if probe == other else 0.0) for probe, other in zip(probe_values[:10], predicted_values[:10])]
+        self.assertEqual(aucs[0], sum(comparisons) / 10)
+        io_handler.close_files()
+        # The probe edges above all the other ones.
+        for edge in predicted_edges:
+            predicted_edges[edge] = 2.0 if edge in edges_probe_set else predicted_edges[edge]
+        io_handler = self.write_ranking(predicted_edges)
+        self.assertEqual(self.metric_calculator.calculate_auc_from_sample(edges_probe_set, io_handler, 40, seed=1), 1.0)
+        io_handler.close_files()
+
+    # The probe edges that are not in the ranking have zero scores and, with the number of pairs that could be
+    # predicted, the pairs that are not in the ranking are non-existent edges with zero scores.
+    def test_sampled_auc_with_missing_pairs(self):
+        predicted_edges, edges_probe_set = self.create_ranking(1)
+        # Only the pairs with non-zero scores are ranked, like in the rankings of the uncoarsening.
+        ranked_edges = dict((edge, score) for edge, score in predicted_edges.items() if score > 0)
+        total_pairs = len(predicted_edges)
+        exact_auc = self.metric_calculator.calculate_exact_auc_from_edges(ranked_edges, edges_probe_set, total_pairs)
+        self.assertEqual(exact_auc, self.metric_calculator.calculate_exact_auc_from_edges(predicted_edges, edges_probe_set))
+        io_handler = self.write_ranking(ranked_edges)
+        aucs = [self.metric_calculator.calculate_auc_from_sample(edges_probe_set, io_handler, 40, seed, total_pairs=total_pairs) for seed in range(300)]
+        io_handler.close_files()
+        self.assertAlmostEqual(np.mean(aucs), exact_auc, delta=0.01)
+
+    # The AUC of the records of a shuffled binary ranking is the ratio of the comparisons that were made, also when the
+    # ranking has less than n probe edges.
+    def test_auc_from_records(self):
+        records = np.zeros(6, dtype=ranking_dtype)
+        records['source'] = [0, 1, 2, 3, 4, 5]
+        records['target'] = 9
+        records['score'] = [3, 1, 2, 2, 1, 5]
+        edges_probe_set = set([(0, 9), (2, 9), (7, 9)])
+        # The probe scores [3, 2] are compared with the first non-existent scores [1, 2].
+        self.assertEqual(self.metric_calculator.calculate_auc_from_records(edges_probe_set, records, 100, block_size=2), 0.75)
+        self.assertEqual(self.metric_calculator.calculate_auc_from_records(edges_probe_set, records, 1), 1.0)
+        self.assertEqual(self.metric_calculator.calculate_auc_from_records(set([(8, 9)]), records, 100), 0.0)
+
+    # The exact AUC of a top-K ranking is the exact AUC of all its pairs, also when the pairs not fed are the tail of
+    # zero scores, and the K best pairs are kept.
+    def test_top_k_ranking(self):
+        predicted_edges, edges_probe_set = self.create_ranking(2)
+        ranked_edges = dict((edge, score) for edge, score in predicted_edges.items() if score > 0)
+        ranking = TopKRanking(25, edges_probe_set, total_pairs=len(predicted_edges), buffer_size=7)
+        for edge, score in ranked_edges.items():
+            ranking.write_predicted_edge(edge, score)
+        exact_auc = self.metric_calculator.calculate_exact_auc_from_edges(predicted_edges, edges_probe_set)
+        self.assertAlmostEqual(self.metric_calculator.calculate_exact_auc_from_ranking(ranking), exact_auc)
+        sources, targets, scores, is_probe = ranking.top()
+        self.assertEqual(scores.tolist(), sorted(ranked_edges.values(), reverse=True)[:25])
+        self.assertEqual([ranked_edges[edge] for edge in zip(sources.tolist(), targets.tolist())], scores.tolist())
+        self.assertEqual(is_probe.tolist(), [edge in edges_probe_set for edge in zip(sources.tolist(), targets.tolist())])
+
+    # The histogram of the non-probe scores is bounded by max_values bins and keeps the total of pairs, so the AUC
+    # of the merged bins stays close to the exact one.
+    def test_top_k_ranking_bins(self):
+        random_state = np.random.RandomState(3)
+        scores = random_state.random_sample(5000)
+        edges_probe_set = set((i, i + 1) for i in range(0, 200, 2))
+        ranking = TopKRanking(10, edges_probe_set, max_values=64)
+        for start in range(0, 5000, 500):
+            ranking.add_block(np.arange(start, start + 500), np.arange(start, start + 500) + 1, scores[start:(start + 500)])
+        values, counts = ranking.non_probe_distribution()
+        self.assertTrue(len(values) <= 2 * 64)
+        self.assertEqual(counts.sum(), 5000 - len(edges_probe_set))
+        exact_auc = self.metric_calculator.calculate_exact_auc(scores[:200:2], scores[np.setdiff1d(np.arange(5000), np.arange(0, 200, 2))])
+        self.assertAlmostEqual(self.metric_calculator.calculate_exact_auc_from_ranking(ranking), exact_auc, delta=0.01)
+
+if __name__ == '__main__':
+    unittest.main()
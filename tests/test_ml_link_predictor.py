@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+import unittest
+import warnings
+import numpy as np
+from igraph import Graph
+from coarsening.coarser import Coarser
+from coarsening.matching import Matching
+from similarity.similarity import Similarity
+from linkprediction.ml_link_predictor import MultilevelLinkPredictor
+
+# Tests of the projections of the coarsed predictions to the original graph: the edge replication, the refinement of
+# the pairs inside the super-vertices and the uncoarsening.
+class MultilevelLinkPredictorTest(unittest.TestCase):
+
+    # Method that creates a random graph and its coarsed graphs by the label propagation (super-vertices of up to 4
+    # vertices). Returns the graphs of the levels.
+    def create_levels(self, seed, n=60, p=0.08, levels=2):
+        random.seed(seed)
+        np.random.seed(seed)
+        random_state = np.random.RandomState(seed)
+        sources, targets = np.triu_indices(n, 1)
+        mask = random_state.random_sample(len(sources)) < p
+        graph = Graph(n=n, edges=zip(sources[mask].tolist(), targets[mask].tolist()))
+        graph['successors'] = range(n)
+        graph['level'] = 0
+        graphs = [graph]
+        for level in range(levels):
+            matching = Matching(max_cluster_size=4).label_propagation_matching(graphs[-1], Similarity().common_neighbors)
+            graphs.append(Coarser().coarserning(graphs[-1], matching))
+        return graphs
+
+    # Method that returns the scores of the pairs (v, u), v < u, of a graph that are not edges, by the Similarity class.
+    def similarity_scores(self, graph, similarity):
+        adjlist = map(set, graph.get_adjlist())
+        pairs = [(v, u) for v in range(graph.vcount()) for u in range(v + 1, graph.vcount()) if u not in adjlist[v]]
+        return dict(((v, u), similarity(graph, adjlist, i=v, j=u)) for v, u in pairs)
+
+    # The projection gives each original pair the weight of the coarsed edge between their super-vertices, 1 inside a
+    # super-vertex or the predicted value of the coarsed pair (divided by the original pairs in the weighted version).
+    def test_edge_replication(self):
+        graph, coarsed_graph = self.create_levels(0, levels=1)
+        coarsed_predicted_edges = self.similarity_scores(coarsed_graph, Similarity().common_neighbors)
+        successors = coarsed_graph['successors']
+        sizes = np.bincount(successors)
+        coarsed_weights = dict(((min(edge.tuple), max(edge.tuple)), edge['weight']) for edge in coarsed_graph.es)
+        for weighted in [False, True]:
+            expected = {}
+            for v, u in self.similarity_scores(graph, Similarity().common_neighbors):
+                super_v, super_u = min(successors[v], successors[u]), max(successors[v], successors[u])
+                divisor = float(sizes[super_v] * sizes[super_u]) if weighted else 1.0
+                if(super_v == super_u):
+                    expected[(v, u)] = (1.0 / sizes[super_v]) if weighted else 1.0
+                elif((super_v, super_u) in coarsed_weights):
+                    expected[(v, u)] = coarsed_weights[(super_v, super_u)] / divisor
+                elif((super_v, super_u) in coarsed_predicted_edges):
+                    expected[(v, u)] = coarsed_predicted_edges[(super_v, super_u)]
+            ml_link_predictor = MultilevelLinkPredictor(chunk_size=50)
+            predictor = ml_link_predictor.predict_by_weighted_edge_replication if weighted else ml_link_predictor.predict_by_edge_replication
+            predicted_edges = predictor(graph, coarsed_graph, coarsed_predicted_edges)
+            self.assertEqual(sorted(predicted_edges.keys()), sorted(expected.keys()))
+            for pair in expected:
+                self.assertAlmostEqual(predicted_edges[pair], expected[pair])
+
+    # The refinement scores the pairs inside each super-vertex by the similarity on the subgraph induced by the
+    # super-vertex, and the scores don't depend on the number of workers or on the size of the tasks.
+    def test_refinement(self):
+        graph, coarsed_graph = self.create_levels(1, levels=1)
+        successors = np.asarray(coarsed_graph['successors'])
+        with warnings.catch_warnings():
+            # The katz beta of the tests doesn't converge and is reduced.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            for name in ['adamic_adar', 'katz_index']:
+                similarity = getattr(Similarity(), name)
+                expected = {}
+                for super_vertex in range(coarsed_graph.vcount()):
+                    members = np.flatnonzero(successors == super_vertex)
+                    subgraph = graph.subgraph(members.tolist())
+                    for (v, u), score in self.similarity_scores(subgraph, getattr(Similarity(), name)).items():
+                        expected[(members[v], members[u])] = score
+                for chunk_size, workers in [(2 ** 22, 1), (3, 1), (3, 3)]:
+                    predicted_edges = MultilevelLinkPredictor(chunk_size=chunk_size).predict_inside_super_vertex(graph, coarsed_graph, similarity, workers)
+                    self.assertEqual(sorted(predicted_edges.keys()), sorted(expected.keys()))
+                    for pair in expected:
+                        self.assertAlmostEqual(predicted_edges[pair], expected[pair], places=9)
+
+    # The uncoarsening rescores the children of the best pairs of each level by the similarity on the graph of the
+    # level. With a budget of all the pairs, the original pairs are scored by the similarity on the original graph.
+    def test_uncoarsening(self):
+        level_graphs = self.create_levels(2)
+        similarity = Similarity().common_neighbors
+        coarsed_predicted_edges = self.similarity_scores(level_graphs[-1], similarity)
+        expected = self.similarity_scores(level_graphs[0], similarity)
+        ml_link_predictor = MultilevelLinkPredictor()
+        predicted_edges = ml_link_predictor.predict_by_uncoarsening(level_graphs, coarsed_predicted_edges, similarity, 60 * 60)
+        self.assertEqual(predicted_edges, expected)
+        # With a smaller budget, only the best pairs are kept, with the scores of the similarity.
+        predicted_edges = ml_link_predictor.predict_by_uncoarsening(level_graphs, coarsed_predicted_edges, similarity, 50)
+        self.assertEqual(len(predicted_edges), 50)
+        self.assertEqual(predicted_edges, dict((pair, expected[pair]) for pair in predicted_edges))
+
+if __name__ == '__main__':
+    unittest.main()
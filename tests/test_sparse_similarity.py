@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+import warnings
+import numpy as np
+from igraph import Graph
+from similarity.similarity import Similarity
+from similarity.sparse_similarity import SparseSimilarity
+from similarity.similarity_cache import SimilarityCache
+
+# Tests of the sparse similarity engine against the scores of each pair calculated by the Similarity class.
+class SparseSimilarityTest(unittest.TestCase):
+
+    # Method that creates a random graph with isolated vertices, leaves and hubs, so all the branches of the indices
+    # (like the vertices of degree 1 of the adamic adar) are used.
+    def create_graph(self, seed, n=40, p=0.12, weighted=False):
+        random_state = np.random.RandomState(seed)
+        sources, targets = np.triu_indices(n, 1)
+        mask = random_state.random_sample(len(sources)) < p
+        graph = Graph(n=n, edges=zip(sources[mask].tolist(), targets[mask].tolist()))
+        if(weighted):
+            graph.es['weight'] = (random_state.randint(1, 5, size=graph.ecount()) / 4.0).tolist()
+        graph['successors'] = range(n)
+        graph['level'] = 0
+        return graph
+
+    # Method that returns the scores of all pairs (v, u), v < u, by the Similarity class.
+    def expected_scores(self, graph, similarity):
+        adjlist = map(set, graph.get_adjlist())
+        sources, targets = np.triu_indices(graph.vcount(), 1)
+        return sources, targets, np.array([similarity(graph, adjlist, i=v, j=u) for v, u in zip(sources.tolist(), targets.tolist())], dtype=np.float64)
+
+    # The scores of the pairs given to the engine are the same of the Similarity class, for the local and the
+    # deterministic global indices.
+    def test_pair_scores(self):
+        names = SparseSimilarity.local_indices + ['katz_index', 'lowmem_katz_index', 'weighted_lowmem_katz_index', 'pagerank']
+        with warnings.catch_warnings():
+            # The katz beta of the tests doesn't converge and is reduced.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            for seed in range(3):
+                graph = self.create_graph(seed, weighted=(seed == 2))
+                sparse_similarity = SparseSimilarity()
+                sparse_similarity.load_graph(graph)
+                for name in names:
+                    similarity = getattr(Similarity(), name)
+                    sources, targets, expected = self.expected_scores(graph, similarity)
+                    scores = np.asarray(sparse_similarity.pair_scores(similarity, sources, targets), dtype=np.float64)
+                    # The power iteration of the pagerank stops by the slowest root of a block, so its scores differ from
+                    # the iteration of a single root up to the tolerance.
+                    tolerance = 1e-5 if name == 'pagerank' else 1e-12
+                    self.assertTrue(np.allclose(scores, expected, rtol=1e-9, atol=tolerance), (seed, name))
+
+    # The blocks of the engine have the scores of all the pairs (v, u), v < u, that are not edges, also when each
+    # block has a few rows.
+    def test_predict_blocks(self):
+        graph = self.create_graph(3)
+        edges = set(graph.get_edgelist())
+        for name in SparseSimilarity.local_indices:
+            similarity = getattr(Similarity(), name)
+            sources, targets, expected = self.expected_scores(graph, similarity)
+            expected = dict((pair, score) for pair, score in zip(zip(sources.tolist(), targets.tolist()), expected.tolist()) if pair not in edges)
+            predicted = {}
+            for block_sources, block_targets, block_scores in SparseSimilarity(block_size=100).predict_blocks(graph, similarity):
+                predicted.update(zip(zip(block_sources.tolist(), block_targets.tolist()), block_scores.tolist()))
+            self.assertEqual(sorted(predicted.keys()), sorted(expected.keys()))
+            for pair in expected:
+                self.assertAlmostEqual(predicted[pair], expected[pair], places=12)
+
+    # The engine with a cache stores the scores of the edges of the blocks, which are the scores of the Similarity class.
+    def test_predict_blocks_to_cache(self):
+        graph = self.create_graph(4)
+        similarity_cache = SimilarityCache()
+        similarity = Similarity().adamic_adar
+        for block in SparseSimilarity(block_size=100, similarity_cache=similarity_cache).predict_blocks(graph, similarity):
+            pass
+        sources, targets = np.array(graph.get_edgelist(), dtype=np.int64).T
+        adjlist = map(set, graph.get_adjlist())
+        expected = [similarity(graph, adjlist, i=v, j=u) for v, u in zip(sources.tolist(), targets.tolist())]
+        scores = similarity_cache.pair_scores(similarity_cache.key(graph, similarity), sources, targets, None)
+        self.assertTrue(np.allclose(scores, expected))
+        self.assertEqual(similarity_cache.misses, 0)
+
+# Tests of the cache of the similarity scores.
+class SimilarityCacheTest(unittest.TestCase):
+
+    # The stored scores are found in any orientation of the pairs and only the missing pairs are calculated.
+    def test_pair_scores(self):
+        similarity_cache = SimilarityCache()
+        similarity_cache.store('key', [1, 5, 2], [3, 4, 9], [0.5, 1.5, 2.5])
+        similarity_cache.store('key', [7], [0], [3.5])
+        calculated = []
+        function = lambda sources, targets: calculated.append((sources.tolist(), targets.tolist())) or (sources * 10.0 + targets)
+        scores = similarity_cache.pair_scores('key', np.array([3, 4, 0, 6, 9]), np.array([1, 5, 7, 8, 2]), function)
+        self.assertEqual(scores.tolist(), [0.5, 1.5, 3.5, 68.0, 2.5])
+        self.assertEqual(calculated, [([6], [8])])
+        self.assertEqual((similarity_cache.hits, similarity_cache.misses), (4, 1))
+        # The calculated pair is stored.
+        self.assertEqual(similarity_cache.pair_scores('key', np.array([8]), np.array([6]), None).tolist(), [68.0])
+        self.assertEqual(similarity_cache.pair_scores('other', np.array([1]), np.array([3]), lambda v, u: np.zeros(len(v))).tolist(), [0.0])
+
+    # The tables of the least recently used keys are evicted when the capacity is exceeded, but not the stored one.
+    def test_eviction(self):
+        similarity_cache = SimilarityCache(capacity=4)
+        similarity_cache.store('first', [0, 1], [1, 2], [1.0, 2.0])
+        similarity_cache.store('second', [0, 1], [1, 2], [3.0, 4.0])
+        # The first key is used, so the second one is the least recently used.
+        similarity_cache.pair_scores('first', np.array([0]), np.array([1]), None)
+        similarity_cache.store('third', [0], [1], [5.0])
+        self.assertEqual(list(similarity_cache.tables.keys()), ['first', 'third'])
+        self.assertEqual(similarity_cache.n_scores, 3)
+        similarity_cache.store('fourth', [0, 1, 2, 3, 4], [5, 6, 7, 8, 9], np.ones(5))
+        self.assertEqual(list(similarity_cache.tables.keys()), ['fourth'])
+        similarity_cache.clear()
+        self.assertEqual((len(similarity_cache.tables), similarity_cache.n_scores), (0, 0))
+
+if __name__ == '__main__':
+    unittest.main()